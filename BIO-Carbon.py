@@ -182,6 +182,9 @@ campaign.add_mission(mission_name="Deployment_645",
 # Set interpolators to automatically cache as dat files (no need to regenerate them, useful for large worlds)
 #campaign.enable_interpolator_cache()
 
+# Only build interpolators the first time a mission flies through them (skips worlds that are never queried)
+#campaign.enable_lazy_interpolators()
+
 # build missions (search datasets, download datasets, build interpolators etc)
 campaign.build_missions()
 
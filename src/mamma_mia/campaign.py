@@ -10,17 +10,26 @@
 # limitations under the License.
 
 from mamma_mia.mission import Mission, Creator, Contributor, Publisher
-from mamma_mia.interpolator import Interpolators
+from mamma_mia.interpolator import Interpolators, InterpolatorEngine
+from mamma_mia.interpolator_cache import InterpolatorCache
+from mamma_mia.interpolator_registry import InterpolatorRegistry
 from mamma_mia import create_platform_attrs
 from mamma_mia.find_worlds import SourceConfig
+from mamma_mia.worlds import Precision, SourceType, WorldsConf, WorldsAttributes, WorldExtent
 from mamma_mia.exceptions import MissionExists, PlatformExists, UnknownPlatform, InvalidEntity
 from loguru import logger
 import zarr
-from os import sep
+from os import sep, cpu_count
 import sys
 from attrs import define, field
 from mamma_mia.log import log_filter
 from mamma_mia.catalog import Cats
+from mamma_mia.world_registry import WorldRegistry
+from mamma_mia.fetcher import WorldFetcher
+from mamma_mia.get_worlds import world_caches
+from mamma_mia.world_cache import WorldCacheIndex
+from mamma_mia.segments import SegmentedInterpolators, segment_name
+import dataclasses
 
 @define
 class Campaign:
@@ -42,15 +51,31 @@ class Campaign:
         A dictionary containing missions objects
     interpolators: dict[str, Interpolator]
         A dictionary containing interpolators, used to interpolate model data to a platforms trajectory
+    segmented_interpolators: dict[str, SegmentedInterpolators]
+        Interpolators of the missions whose worlds are got per along track segment, routing each point of the flight
+        to the interpolators of its segment
+    interpolator_registry: InterpolatorRegistry
+        Registry of loaded interpolators, used to keep the campaign within a memory budget
+    world_registry: WorldRegistry
+        Registry of matched worlds, used to get each world and build its interpolators once for all missions
+    world_fetcher: WorldFetcher
+        Gets the worlds of the campaign concurrently
+    world_caches: dict[SourceType, WorldCacheIndex]
+        Index of the downloaded world cache of each source type
     verbose: bool
         Logging verbosity
     """
     name: str
     description: str
-    catalog: Cats = Cats()
+    catalog: Cats = field(factory=Cats)
     platforms: dict[str,create_platform_attrs()] = field(factory=dict)
     missions: dict[str, Mission] = field(factory=dict)
     interpolators: dict[str, Interpolators] = field(factory=dict)
+    segmented_interpolators: dict[str, SegmentedInterpolators] = field(factory=dict)
+    interpolator_registry: InterpolatorRegistry | None = None
+    world_registry: WorldRegistry = field(factory=WorldRegistry)
+    world_fetcher: WorldFetcher = field(factory=WorldFetcher)
+    world_caches: dict[SourceType, WorldCacheIndex] = field(factory=world_caches)
     verbose: bool = False
     debug: bool = False
 
@@ -106,6 +131,10 @@ class Campaign:
                     source_location: str = "CMEMS",
                     mission_time_step: int = 1,
                     apply_obs_error: bool = False,
+                    interpolator_engine: str = "regrid",
+                    precision: str = "float64",
+                    segment_length: float | None = None,
+                    segment_duration: float | None = None,
                     standard_name_vocabulary: str = "https://cfconventions.org/Data/cf-standard-names/current/build/cf-standard-name-table.html",
                     ) -> None:
         """
@@ -126,6 +155,21 @@ class Campaign:
             url of standard name vocabulary
         apply_obs_error: bool, optional
             apply an observation error to the payload to make more realistic observations
+        interpolator_engine: str, optional
+            how worlds are interpolated, "regrid" regrids curvilinear (MSM and LOCAL) worlds on to a regular grid and
+            loads worlds into memory, "curvilinear" interpolates curvilinear worlds directly on their native grid and
+            "chunked" keeps CMEMS worlds out of core, loading only the chunks the flight passes through
+        precision: str, optional
+            "float64" or "float32", single precision halves the memory of worlds, interpolators and the payload.
+            Rounding error is at most 2**-24 (~6e-8) relative to the interpolated values, e.g. ~2e-6 degC at 30 degC.
+            Navigation parameters are always kept in double precision
+        segment_length: float, optional
+            length in kilometres of along track segments, worlds are got for a padded extent around each segment
+            (a corridor following the trajectory) rather than the bounding box of the whole trajectory. None gets
+            worlds for the bounding box
+        segment_duration: float, optional
+            maximum duration in days of along track segments, long missions are split into time segments whose worlds
+            are got, built and flown in sequence. None doesn't split missions in time
         mission_time_step: int, optional
             time step mission will run at, e.g. the output timestep of the payload and flight
         source_location: str, optional
@@ -161,6 +205,7 @@ class Campaign:
         except KeyError:
             raise UnknownPlatform
         mission_source = SourceConfig.from_string(source_location)
+        mission_precision = Precision.from_string(precision)
         mission = Mission.for_campaign(mission=mission_name,
                           title=title,
                           summary=summary,
@@ -176,36 +221,231 @@ class Campaign:
                           source_config=mission_source,
                           mission_time_step=mission_time_step,
                           apply_obs_error=apply_obs_error,
-                          standard_name_vocabulary=standard_name_vocabulary
+                          standard_name_vocabulary=standard_name_vocabulary,
+                          precision=mission_precision,
+                          segment_length=segment_length,
+                          segment_duration=segment_duration
                           )
-        interpolator = Interpolators()
+        interpolator = Interpolators(engine=InterpolatorEngine.from_string(interpolator_engine),
+                                     precision=mission_precision)
         self.missions[mission.attrs.mission] = mission
         self.interpolators[mission.attrs.mission] = interpolator
         logger.success(f"successfully added mission {mission.attrs.mission} to campaign {self.name}")
 
     def build_missions(self) -> None:
         """
-        Build the missions contained within the missions dictionary.
+        Build the missions contained within the missions dictionary. Missions that match the same world share it, the
+        world is got once for their merged extent and its interpolators are built once.
         """
         logger.info(f"building {self.name} missions")
-        for mission in self.missions.values():
-            logger.info(f"building {mission.attrs.mission}")
-            self.catalog.init_catalog(source_type=mission.attrs.source_config.source_type)
-            mission.build_mission(cat=self.catalog)
-            logger.success(f"successfully built {mission.attrs.mission}")
-        for key, interpol in self.interpolators.items():
-            logger.info(f"building interpolators for {key}")
-            interpol.build(worlds=self.missions[key].worlds,mission=key,source_type=self.missions[key].attrs.source_config.source_type)
-            logger.success(f"successfully built interpolators for {key}")
+        # each catalog is initialised once for all the missions that use it
+        self.catalog.init_catalogs(source_types=[mission.attrs.source_config.source_type
+                                                 for mission in self.missions.values()])
+        flights = {}
+        for key, mission in self.missions.items():
+            logger.info(f"matching worlds for {key}")
+            mission.match_worlds(cat=self.catalog)
+            flights[key] = self.__flights(mission=mission)
+            for name, (worlds, flight_extent) in flights[key].items():
+                self.world_registry.register(mission=name,
+                                             worlds=worlds,
+                                             source=mission.attrs.source_config,
+                                             flight_extent=flight_extent,
+                                             parent=key)
+        for (data_id, entry), missions in self.world_registry.plan().items():
+            logger.info(f"world {data_id} ({entry}) will be got once for missions {missions}")
+        self.world_registry.get_worlds(cat=self.catalog, fetcher=self.world_fetcher, caches=self.world_caches)
+        # the worlds of this campaign are pinned so only stores it doesn't use are evicted
+        for cache in self.world_caches.values():
+            cache.evict()
+        interpolators = {}
+        worlds = {}
+        for key, mission in self.missions.items():
+            for name, (flight_worlds, _) in flights[key].items():
+                self.world_registry.assign(mission=name, worlds=flight_worlds)
+                worlds[name] = flight_worlds
+                if name == key:
+                    interpolators[name] = self.interpolators[key]
+                else:
+                    # each segment gets interpolators with the settings of the mission, they are built lazily so
+                    # only the interpolators of the segment that is being flown are built
+                    interpolators[name] = dataclasses.replace(self.interpolators[key], interpolator={}, grids={},
+                                                              owners={}, aliases={}, lazy=True)
+                    for world_key, world in flight_worlds.worlds.items():
+                        mission.worlds.worlds[f"{world_key}_{name}"] = world
+                        mission.worlds.stores[f"{world_key}_{name}"] = flight_worlds.stores[world_key]
+            logger.success(f"successfully built {key}")
+        logger.info(f"building interpolators for {list(self.interpolators.keys())}")
+        self.world_registry.build_interpolators(interpolators=interpolators, worlds=worlds)
+        for key, mission in self.missions.items():
+            if mission.worlds.attributes.segments:
+                self.segmented_interpolators[key] = SegmentedInterpolators.from_segments(
+                    segments=mission.worlds.attributes.segments,
+                    interpolators=[interpolators[name] for name in flights[key]])
+        logger.success(f"successfully built interpolators for {list(self.interpolators.keys())}")
 
-    def enable_interpolator_cache(self) -> None:
+    @staticmethod
+    def __flights(mission: Mission) -> dict[str, tuple[WorldsConf, WorldExtent]]:
         """
-        enable interpolator cache so generated interpolators are stored on disk
+        worlds and flight extent the worlds of a mission are got for, one for the whole mission or one for each of its
+        along track segments
+        """
+        segments = mission.worlds.attributes.segments
+        if not segments:
+            return {mission.attrs.mission: (mission.worlds, mission.flight_extent())}
+        flights = {}
+        attributes = mission.worlds.attributes
+        for i, segment in enumerate(segments):
+            worlds = WorldsConf(attributes=WorldsAttributes(extent=segment.extent,
+                                                            interpolator_priorities=attributes.interpolator_priorities,
+                                                            matched_worlds=attributes.matched_worlds),
+                                worlds={},
+                                stores={})
+            flights[segment_name(mission=mission.attrs.mission, index=i)] = (worlds, segment.flight_extent)
+        return flights
+
+    def enable_interpolator_cache(self, cache_dir: str = "interpolator_cache", max_size: int | None = 10 * 1024 ** 3) -> None:
         """
+        enable interpolator cache so generated interpolators are stored on disk, the cache is shared between all
+        missions of the campaign (and any other campaign using the same cache directory)
+
+        Parameters
+        -----------
+        cache_dir: str, optional
+            directory to cache interpolators in
+        max_size: int, optional
+            disk budget of the cache in bytes, least recently used interpolators are evicted when it is exceeded.
+            None disables eviction
+        """
+        interpolator_cache = InterpolatorCache(cache_dir=cache_dir, max_size=max_size)
         for key, interpol in self.interpolators.items():
             interpol.cache = True
+            interpol.interpolator_cache = interpolator_cache
             logger.info(f"enabled interpolator cache for {key}")
 
+    def enable_lazy_interpolators(self) -> None:
+        """
+        enable lazy interpolators so each interpolator is only built the first time a mission flies through it
+        """
+        for key, interpol in self.interpolators.items():
+            interpol.lazy = True
+            logger.info(f"enabled lazy interpolators for {key}")
+
+    def set_download_concurrency(self, max_concurrent: int = 4, retries: int = 3, backoff: float = 2.0) -> None:
+        """
+        configure how worlds are downloaded, independent worlds are downloaded concurrently and failed downloads are
+        retried with exponential backoff
+
+        Parameters
+        -----------
+        max_concurrent: int, optional
+            maximum number of worlds downloaded at the same time, 1 downloads them one after another
+        retries: int, optional
+            number of times a failed download is retried
+        backoff: float, optional
+            seconds to wait before the first retry, doubled for every retry after it
+        """
+        self.world_fetcher = WorldFetcher(max_concurrent=max_concurrent, retries=retries, backoff=backoff)
+        logger.info(f"worlds will be downloaded {max_concurrent} at a time with {retries} retries")
+
+    def refresh_catalogs(self) -> None:
+        """
+        fetch the catalogs of the campaign's missions from their servers again, catalogs are otherwise initialised once
+        and then reused for the life of the campaign
+        """
+        self.catalog.init_catalogs(source_types=[mission.attrs.source_config.source_type
+                                                 for mission in self.missions.values()], refresh=True)
+
+    def set_world_cache_budget(self,max_size: int | None = 50 * 1024 ** 3) -> None:
+        """
+        set a disk budget for the caches of downloaded worlds, the least recently used worlds are evicted once the
+        campaign's worlds have been got. Worlds used by a running campaign (in this or any other process) are never
+        evicted.
+
+        Parameters
+        -----------
+        max_size: int, optional
+            disk budget of each world cache in bytes, None disables eviction
+        """
+        for source_type, cache in self.world_caches.items():
+            cache.max_size = max_size
+            logger.info(f"set {source_type.name} world cache budget to {max_size} bytes")
+
+    def world_cache_report(self) -> dict[str, dict]:
+        """
+        reports the size and hit rate of the world caches
+
+        Returns
+        -------
+        dict
+            cache directory and its hits, misses, hit rate, number of stores and size in bytes
+        """
+        report = {}
+        for cache in self.world_caches.values():
+            report[cache.cache_dir] = cache.stats()
+            stats = report[cache.cache_dir]
+            logger.info(f"world cache {cache.cache_dir} holds {stats['stores']} worlds ({stats['size']} bytes), "
+                        f"hit rate {stats['hit_rate']:.2f} ({stats['hits']} hits, {stats['misses']} misses)")
+        return report
+
+    def enable_memory_budget(self, max_memory: int) -> None:
+        """
+        enable a campaign wide memory budget for interpolators. Interpolators are built lazily and the least recently
+        used ones are unloaded when the budget is exceeded, they are rebuilt (or reloaded from the interpolator cache
+        if it is enabled) when they are next needed. A mission's interpolators are unloaded once it has been flown.
+
+        Parameters
+        -----------
+        max_memory: int
+            memory budget of the loaded interpolators in bytes
+        """
+        self.interpolator_registry = InterpolatorRegistry(max_memory=max_memory)
+        for key, interpol in self.interpolators.items():
+            interpol.lazy = True
+            interpol.registry = self.interpolator_registry
+            logger.info(f"enabled interpolator memory budget of {max_memory} bytes for {key}")
+
+    def interpolator_memory(self) -> dict[str, int]:
+        """
+        reports the memory held by loaded interpolators
+
+        Returns
+        -------
+        dict
+            world data id and the size in bytes of its loaded interpolators
+        """
+        if self.interpolator_registry is None:
+            logger.warning("interpolator memory is only tracked if a memory budget is enabled")
+            return {}
+        report = self.interpolator_registry.report()
+        for world, nbytes in report.items():
+            logger.info(f"world {world} has {nbytes} bytes of interpolators loaded")
+        logger.info(f"{self.interpolator_registry.resident} bytes of interpolators loaded in total")
+        return report
+
+    def enable_parallel_build(self, max_workers: int | None = None, max_memory: int | None = None,
+                              use_processes: bool = False) -> None:
+        """
+        enable parallel interpolator builds so the variables of each mission are opened, subset and regridded
+        concurrently rather than one after another
+
+        Parameters
+        -----------
+        max_workers: int, optional
+            number of workers to build interpolators on, defaults to the number of cpus
+        max_memory: int, optional
+            memory budget of the running build tasks in bytes, None for no budget
+        use_processes: bool, optional
+            build on a process pool instead of a thread pool
+        """
+        if max_workers is None:
+            max_workers = cpu_count() or 1
+        for key, interpol in self.interpolators.items():
+            interpol.max_workers = max_workers
+            interpol.max_memory = max_memory
+            interpol.use_processes = use_processes
+            logger.info(f"enabled parallel interpolator build with {max_workers} workers for {key}")
+
     def run(self) -> None:
         """
         Executes the missions as specified within the mission's dictionary.
@@ -213,7 +453,12 @@ class Campaign:
         logger.info(f"running {self.name}")
         for mission in self.missions.values():
             logger.info(f"flying {mission.attrs.mission}")
-            mission.fly(self.interpolators[mission.attrs.mission])
+            name = mission.attrs.mission
+            mission.fly(self.segmented_interpolators.get(name, self.interpolators[name]))
+            if self.interpolator_registry is not None:
+                self.interpolator_registry.release(mission=name)
+                for i in range(len(mission.worlds.attributes.segments)):
+                    self.interpolator_registry.release(mission=segment_name(mission=name, index=i))
         logger.success(f"{self.name} finished successfully")
 
     def export(self,overwrite=True,export_path=None) -> None:
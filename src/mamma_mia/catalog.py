@@ -8,76 +8,167 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
-import json
-from datetime import datetime
-from attrs import define
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from attrs import define, field
 from OceanDataStore import OceanDataCatalog
 from copernicusmarine import CopernicusMarineCatalogue, describe
 from loguru import logger
-import jsonpickle
 from mamma_mia.worlds import SourceType
-from pathlib import Path
+from mamma_mia.inventory import inventory
+from mamma_mia.catalog_cache import CmemsCatalog, load_cmems_catalog, save_cmems_catalog, CMEMS_CATALOG_FILE, \
+    CATALOG_TTL, MsmCatalog, load_msm_catalog, save_msm_catalog, catalog_fresh, MSM_CATALOG_FILE, MSM_CATALOG_NAME, \
+    MSM_COLLECTION, hash_source_names
 
 
 @define
 class Cats:
     """
     Catalog class, contains all the model source data that is available to download. There is a field for each source,
-    these are populated with their relevant catalogs that can be searched for matching worlds.
+    these are populated with their relevant catalogs that can be searched for matching worlds. Each catalog is only
+    initialised once, however many missions use it, unless it is explicitly refreshed.
 
     Parameters
     ----------
     overwrite: bool, optional
         overwrites the metadata cache used for CMEMS sources
+    ttl: float, optional
+        age in seconds after which cached catalogs are refreshed, None if they never go stale
+    cmems_file: str, optional
+        location of the cached CMEMS catalog
+    msm_file: str, optional
+        location of the cached MSM catalog
+    offline: bool, optional
+        only use the cached catalogs, however old they are, and never connect to the catalog servers
 
     Attributes
     ----------
-    cmems_cat: CopernicusMarineCatalog
-        cmems catalog class
-    msm_cat: OceanDataCatalog
-        msm catalog class
+    cmems_cat: CmemsCatalog
+        compact cmems catalog
+    msm_cat: MsmCatalog
+        compact msm catalog
     """
-    cmems_cat: CopernicusMarineCatalogue = None
-    msm_cat: OceanDataCatalog = None
+    cmems_cat: CmemsCatalog | CopernicusMarineCatalogue = None
+    msm_cat: MsmCatalog = None
     overwrite: bool = False
+    ttl: float | None = CATALOG_TTL
+    cmems_file: str = CMEMS_CATALOG_FILE
+    msm_file: str = MSM_CATALOG_FILE
+    offline: bool = False
+    _msm_datastore: OceanDataCatalog = field(default=None, init=False, repr=False)
+    _initialised: set[SourceType] = field(factory=set, init=False, repr=False)
+    _locks: dict[SourceType, threading.Lock] = field(factory=lambda: {source_type: threading.Lock()
+                                                                       for source_type in SourceType},
+                                                      init=False, repr=False)
+    _datastore_lock: threading.Lock = field(factory=threading.Lock, init=False, repr=False)
 
-    def init_catalog(self,source_type: SourceType):
+    def init_catalog(self,source_type: SourceType, refresh: bool = False) -> None:
         """
-        initialize the catalog class
+        initialize the catalog of a source type, each catalog is only initialised once for the life of the class
+
+        Args:
+            source_type: source type whose catalog is initialised
+            refresh: fetch the catalog from its server again, even if it has already been initialised or is cached
+        """
+        with self._locks[source_type]:
+            if source_type in self._initialised and not refresh:
+                logger.debug(f"{source_type.name} catalog already initialized")
+                return
+            logger.info("Initializing catalog")
+            if source_type == SourceType.LOCAL:
+                logger.info("local data source request, skipping catalog initialization")
+            elif source_type == SourceType.CMEMS:
+                logger.info("CMEMS source requested, building catalog")
+                self.__init_cmems(fetch=self.overwrite or refresh)
+            elif source_type == SourceType.MSM:
+                logger.info("MSM source requested, building catalog")
+                self.__init_msm(fetch=self.overwrite or refresh)
+            self._initialised.add(source_type)
+            logger.info("Catalog initialized")
+
+    def init_catalogs(self, source_types, refresh: bool = False) -> None:
         """
-        logger.info("Initializing catalog")
-        if source_type == SourceType.LOCAL:
-            logger.info("local data source request, skipping catalog initialization")
-        elif source_type == SourceType.CMEMS:
-            logger.info("CMEMS source requested, building catalog")
-            self.cmems_cat = describe(contains=[])
-        elif source_type == SourceType.MSM:
-            logger.info("MSM source requested, building catalog")
-            cat_file = Path("catalog.json")
-            if cat_file.is_file() and not self.overwrite:
-                logger.info("local catalog file found, reading catalog")
-                with open(cat_file, "r") as f:
-                    cat = json.load(f)
-                self.msm_cat = jsonpickle.decode(cat)
-                cat = OceanDataCatalog(catalog_name="noc-model-stac")
-                last_update_server = datetime.strptime(cat.Catalog.extra_fields['last_update'],"%Y-%m-%dT%H:%M:%S.%f")
-                last_update_local = datetime.strptime(self.msm_cat.Catalog.extra_fields['last_update'],"%Y-%m-%dT%H:%M:%S.%f")
-                if last_update_local < last_update_server:
-                    logger.info("local catalog is out of date with server catalog, updating....")
-                    self.__create_local_catalog()
-                    logger.info("local catalog updated")
+        initialize the catalogs of several source types concurrently, as each is network (or disk) bound
+
+        Args:
+            source_types: source types whose catalogs are initialised
+            refresh: fetch the catalogs from their servers again, even if they have already been initialised or are
+                cached
+        """
+        source_types = set(source_types)
+        with ThreadPoolExecutor(max_workers=max(len(source_types), 1)) as executor:
+            futures = [executor.submit(self.init_catalog, source_type=source_type, refresh=refresh)
+                       for source_type in source_types]
+            # raise the first failure, if any
+            for future in futures:
+                future.result()
+
+    def __init_cmems(self, fetch: bool) -> None:
+        source_names = self.__source_names()
+        self.cmems_cat = None if fetch else load_cmems_catalog(path=self.cmems_file,
+                                                               ttl=None if self.offline else self.ttl)
+        if self.cmems_cat is not None and self.cmems_cat.source_names_hash != hash_source_names(source_names):
+            # the cached catalog only holds the variables of the inventory it was made for
+            if self.offline:
+                logger.warning("cached cmems catalog was made for a different inventory, using it as it can't be "
+                               "fetched offline")
+            else:
+                logger.info("cached cmems catalog was made for a different inventory, it will be refreshed")
+                self.cmems_cat = None
+        if self.cmems_cat is not None:
+            logger.info("cached cmems catalog found, using cached catalog")
+        elif self.offline:
+            raise FileNotFoundError(f"no cached cmems catalog at {self.cmems_file}, it can't be fetched offline")
+        else:
+            logger.info("fetching cmems catalog")
+            self.cmems_cat = CmemsCatalog.from_catalogue(catalogue=describe(contains=[]), source_names=source_names)
+            save_cmems_catalog(catalog=self.cmems_cat, path=self.cmems_file)
+
+    def __init_msm(self, fetch: bool) -> None:
+        self.msm_cat = None if fetch else load_msm_catalog(path=self.msm_file)
+        if self.msm_cat is not None and (self.offline or catalog_fresh(path=self.msm_file, ttl=self.ttl)):
+            logger.info("cached msm catalog found, using cached catalog")
+        elif self.offline:
+            raise FileNotFoundError(f"no cached msm catalog at {self.msm_file}, it can't be fetched offline")
+        else:
+            datastore = self.msm_datastore(refresh=fetch)
+            if self.msm_cat is not None and self.msm_cat.last_update == datastore.Catalog.extra_fields["last_update"]:
+                logger.info("cached msm catalog is up to date with server catalog")
+                # restart the ttl so the server isn't checked again until the cached catalog is stale again
+                os.utime(self.msm_file)
             else:
-                if self.overwrite:
-                    logger.info("catalog overwrite requested, creating new catalog")
-                else:
-                    logger.info("local catalog not found, creating new catalog")
-                self.__create_local_catalog()
+                logger.info("fetching msm catalog")
+                self.msm_cat = MsmCatalog.from_catalog(catalog=datastore)
+                save_msm_catalog(catalog=self.msm_cat, path=self.msm_file)
 
-        logger.info("Catalog initialized")
+    @staticmethod
+    def __source_names() -> set[str]:
+        """
+        names of the source variables of every parameter in the inventory, any other variables can't be matched
+        """
+        source_names = set()
+        for parameter in inventory.parameters.entries.values():
+            source_names.update(parameter.source_names)
+        return source_names
 
-    def __create_local_catalog(self,file_name="catalog.json"):
-        self.msm_cat = OceanDataCatalog(catalog_name="noc-model-stac")
-        self.msm_cat.search(collection="noc-npd-era5")
-        cat_file2 = jsonpickle.encode(self.msm_cat)
-        with open(file_name, "w") as f2:
-            json.dump(cat_file2, f2)
+    def msm_datastore(self, refresh: bool = False) -> OceanDataCatalog:
+        """
+        MSM catalog worlds are downloaded from, it is only created when it is first needed so a campaign whose worlds
+        are all cached never connects to the server
+
+        Args:
+            refresh: connect to the server again even if the catalog has already been created
+
+        Returns:
+            OceanDataCatalog searched for the msm collection
+        """
+        # worlds are downloaded concurrently, the catalog is only created by the first download that needs it
+        with self._datastore_lock:
+            if self._msm_datastore is None or refresh:
+                if self.offline:
+                    raise ConnectionError("msm worlds can't be downloaded offline")
+                logger.info("connecting to msm catalog")
+                self._msm_datastore = OceanDataCatalog(catalog_name=MSM_CATALOG_NAME)
+                self._msm_datastore.search(collection=MSM_COLLECTION)
+            return self._msm_datastore
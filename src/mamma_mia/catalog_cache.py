@@ -0,0 +1,382 @@
+# Copyright 2025 National Oceanography Centre
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#  http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import gzip
+import json
+import time
+import hashlib
+import numpy as np
+from attrs import frozen
+from cattrs import structure, unstructure
+from loguru import logger
+
+# file the compact cmems catalog is cached in
+CMEMS_CATALOG_FILE = "cmems_catalog.json.gz"
+# default age in seconds after which cached catalogs are refreshed
+CATALOG_TTL = 7 * 24 * 3600
+# coordinates of cmems variables that are used to match worlds
+CMEMS_COORDINATES = ["time", "depth"]
+# file the compact msm catalog is cached in
+MSM_CATALOG_FILE = "msm_catalog.npz"
+# msm stac catalog and the collection of it worlds are found in
+MSM_CATALOG_NAME = "noc-model-stac"
+MSM_COLLECTION = "noc-npd-era5"
+
+
+@frozen
+class CatalogCoordinate:
+    coordinate_id: str
+    values: list | None = None
+    minimum_value: float | None = None
+    maximum_value: float | None = None
+
+
+@frozen
+class CatalogVariable:
+    short_name: str
+    bbox: list[float]
+    coordinates: list[CatalogCoordinate]
+
+
+@frozen
+class CatalogService:
+    service_format: str
+    variables: list[CatalogVariable]
+
+
+@frozen
+class CatalogPart:
+    services: list[CatalogService]
+
+
+@frozen
+class CatalogVersion:
+    parts: list[CatalogPart]
+
+
+@frozen
+class CatalogDataset:
+    dataset_id: str
+    versions: list[CatalogVersion]
+
+
+@frozen
+class CatalogProduct:
+    sources: list[str]
+    datasets: list[CatalogDataset]
+
+
+@frozen
+class CmemsCatalog:
+    """
+    Compact copy of the CMEMS catalogue holding only what is used to match worlds: numerical model products, the zarr
+    service of the latest version of each dataset and the variables that are source names of inventory parameters. It
+    has the same structure (products, datasets, versions, parts, services, variables and coordinates) as the catalogue
+    returned by copernicusmarine.describe so worlds are matched against it in the same way. The source names it was
+    filtered by are recorded as a hash, so a copy made for a different inventory is not used.
+    """
+    products: list[CatalogProduct]
+    source_names_hash: str | None = None
+
+    @classmethod
+    def from_catalogue(cls, catalogue, source_names: set[str]) -> "CmemsCatalog":
+        """
+        Creates a compact catalog from a full CMEMS catalogue
+
+        Args:
+            catalogue: catalogue returned by copernicusmarine.describe
+            source_names: names of the variables to keep
+
+        Returns:
+            CmemsCatalog of the numerical model datasets with any of the variables
+        """
+        products = []
+        for product in catalogue.products:
+            if "Numerical models" not in product.sources:
+                continue
+            datasets = []
+            for dataset in product.datasets:
+                service = _zarr_service(services=dataset.versions[0].parts[0].services)
+                variables = [_compact_variable(variable=variable) for variable in service.variables
+                             if variable.short_name in source_names]
+                if variables:
+                    part = CatalogPart(services=[CatalogService(service_format="zarr", variables=variables)])
+                    datasets.append(CatalogDataset(dataset_id=dataset.dataset_id,
+                                                   versions=[CatalogVersion(parts=[part])]))
+            if datasets:
+                products.append(CatalogProduct(sources=list(product.sources), datasets=datasets))
+        return cls(products=products, source_names_hash=hash_source_names(source_names=source_names))
+
+
+def hash_source_names(source_names: set[str]) -> str:
+    """
+    Args:
+        source_names: names of the variables a CMEMS catalog is filtered by
+
+    Returns:
+        hash of the names, the same whatever their order
+    """
+    return hashlib.sha1(",".join(sorted(source_names)).encode()).hexdigest()
+
+
+def load_cmems_catalog(path: str = CMEMS_CATALOG_FILE, ttl: float | None = CATALOG_TTL) -> CmemsCatalog | None:
+    """
+    Loads the cached CMEMS catalog
+
+    Args:
+        path: location of the cached catalog
+        ttl: age in seconds after which the cached catalog is stale, None if it never goes stale
+
+    Returns:
+        CmemsCatalog, or None if there is no cached catalog or it is stale
+    """
+    if not os.path.exists(path):
+        return None
+    age = time.time() - os.path.getmtime(path)
+    if ttl is not None and age > ttl:
+        logger.info(f"cached cmems catalog is {age / 3600:.1f} hours old, it will be refreshed")
+        return None
+    with gzip.open(path, "rt") as f:
+        return structure(json.load(f), CmemsCatalog)
+
+
+def save_cmems_catalog(catalog: CmemsCatalog, path: str = CMEMS_CATALOG_FILE) -> None:
+    """
+    Caches a CMEMS catalog
+
+    Args:
+        catalog: compact CMEMS catalog
+        path: location of the cached catalog
+
+    """
+    # write to a temporary file first so a reader never sees a partially written catalog
+    tmp_file = f"{path}.tmp-{os.getpid()}"
+    with gzip.open(tmp_file, "wt") as f:
+        json.dump(unstructure(catalog), f)
+    os.replace(tmp_file, path)
+    logger.info(f"cached cmems catalog of {len(catalog.products)} products to {path}")
+
+
+def _zarr_service(services: list):
+    """
+    the service worlds are downloaded from, the zarr service if there is one otherwise the last service
+    """
+    for service in services:
+        if getattr(service.service_format, "value", service.service_format) == "zarr":
+            return service
+    return services[-1]
+
+
+def _compact_variable(variable) -> CatalogVariable:
+    """
+    copies a catalogue variable with just its time and depth coordinates, time is kept as its first and last value
+    """
+    coordinates = []
+    for coordinate in variable.coordinates:
+        if coordinate.coordinate_id not in CMEMS_COORDINATES:
+            continue
+        values = list(coordinate.values) if coordinate.values else None
+        minimum_value = coordinate.minimum_value
+        maximum_value = coordinate.maximum_value
+        if coordinate.coordinate_id == "time" and values:
+            minimum_value, maximum_value, values = values[0], values[-1], None
+        coordinates.append(CatalogCoordinate(coordinate_id=coordinate.coordinate_id, values=values,
+                                             minimum_value=minimum_value, maximum_value=maximum_value))
+    return CatalogVariable(short_name=variable.short_name, bbox=list(variable.bbox), coordinates=coordinates)
+
+
+@frozen
+class MsmItem:
+    """
+    Item of the MSM catalog, holding only the properties used to match worlds
+    """
+    id: str
+    bbox: list[float]
+    start_datetime: np.datetime64
+    end_datetime: np.datetime64
+    variables: list[str]
+    operation_frequency: str
+    depth_levels: tuple[float, ...] | None = None
+
+
+@frozen(eq=False)
+class MsmCatalog:
+    """
+    Compact columnar copy of the MSM catalog holding only the properties of its items used to match worlds. Each
+    property is a column (a numpy array with a row per item) so the catalog is cached as a single npz file that loads
+    without decoding the STAC objects, and the items within an extent are found without looping over the catalog.
+
+    Parameters
+    ----------
+    ids: np.ndarray
+        ids of the items
+    bbox: np.ndarray
+        bounding boxes of the items (lon_min, lat_min, lon_max, lat_max)
+    start_datetime: np.ndarray
+        times the items start
+    end_datetime: np.ndarray
+        times the items end
+    variables: np.ndarray
+        comma separated variables of the items
+    operation_frequency: np.ndarray
+        field types of the items
+    depth_levels: np.ndarray
+        depth levels of all the items, one after another
+    depth_offsets: np.ndarray
+        offsets of the depth levels of each item, an item without depth levels has none
+    last_update: str
+        time the server catalog was last updated when this copy was made
+    """
+    ids: np.ndarray
+    bbox: np.ndarray
+    start_datetime: np.ndarray
+    end_datetime: np.ndarray
+    variables: np.ndarray
+    operation_frequency: np.ndarray
+    depth_levels: np.ndarray
+    depth_offsets: np.ndarray
+    last_update: str
+
+    @classmethod
+    def from_catalog(cls, catalog) -> "MsmCatalog":
+        """
+        Creates a compact catalog from a searched OceanDataCatalog
+
+        Args:
+            catalog: OceanDataCatalog searched for the msm collection
+
+        Returns:
+            MsmCatalog of the items of the catalog
+        """
+        items = list(catalog.Items)
+        depth_levels = [_stac_depth_levels(item=item) or () for item in items]
+        return cls(ids=np.array([item.id for item in items], dtype=str),
+                   bbox=np.array([item.bbox for item in items], dtype=np.float64).reshape(-1, 4),
+                   start_datetime=np.array([_stac_datetime(item.properties.get("start_datetime")) for item in items],
+                                           dtype="datetime64[s]"),
+                   end_datetime=np.array([_stac_datetime(item.properties.get("end_datetime")) for item in items],
+                                         dtype="datetime64[s]"),
+                   variables=np.array([",".join(item.properties.get("variables", [])) for item in items], dtype=str),
+                   operation_frequency=np.array([item.properties.get("operation_frequency", "") for item in items],
+                                                dtype=str),
+                   depth_levels=np.array([level for levels in depth_levels for level in levels], dtype=np.float64),
+                   depth_offsets=np.cumsum([0] + [len(levels) for levels in depth_levels], dtype=np.int64),
+                   last_update=catalog.Catalog.extra_fields["last_update"])
+
+    def __len__(self) -> int:
+        return self.ids.size
+
+    def item(self, index: int) -> MsmItem:
+        """
+        Args:
+            index: row of the item
+
+        Returns:
+            MsmItem of the row
+        """
+        depth_levels = self.depth_levels[self.depth_offsets[index]:self.depth_offsets[index + 1]]
+        return MsmItem(id=str(self.ids[index]),
+                       bbox=self.bbox[index].tolist(),
+                       start_datetime=self.start_datetime[index],
+                       end_datetime=self.end_datetime[index],
+                       variables=str(self.variables[index]).split(",") if self.variables[index] else [],
+                       operation_frequency=str(self.operation_frequency[index]),
+                       depth_levels=tuple(depth_levels.tolist()) if depth_levels.size else None)
+
+    def search(self, extent) -> list[MsmItem]:
+        """
+        Finds the items that contain the spatial and temporal extent of a world
+
+        Args:
+            extent: WorldExtent of the world
+
+        Returns:
+            list of the items that contain the extent
+        """
+        world_start = np.datetime64(extent.time_start, "s")
+        world_end = np.datetime64(extent.time_end, "s")
+        within = ((self.bbox[:, 0] <= extent.lon_min) & (self.bbox[:, 2] >= extent.lon_max) &
+                  (self.bbox[:, 1] <= extent.lat_min) & (self.bbox[:, 3] >= extent.lat_max) &
+                  (self.start_datetime < world_start) & (self.end_datetime > world_end))
+        return [self.item(index=index) for index in np.flatnonzero(within)]
+
+
+def catalog_fresh(path: str, ttl: float | None) -> bool:
+    """
+    Checks whether a cached catalog is younger than its ttl
+
+    Args:
+        path: location of the cached catalog
+        ttl: age in seconds after which the cached catalog is stale, None if it never goes stale
+
+    Returns:
+        True if the cached catalog exists and is fresh
+    """
+    if not os.path.exists(path):
+        return False
+    return ttl is None or time.time() - os.path.getmtime(path) <= ttl
+
+
+def load_msm_catalog(path: str = MSM_CATALOG_FILE) -> MsmCatalog | None:
+    """
+    Loads the cached MSM catalog
+
+    Args:
+        path: location of the cached catalog
+
+    Returns:
+        MsmCatalog, or None if there is no cached catalog
+    """
+    if not os.path.exists(path):
+        return None
+    with np.load(path, allow_pickle=False) as columns:
+        return MsmCatalog(**{name: columns[name] for name in columns.files if name != "last_update"},
+                          last_update=str(columns["last_update"]))
+
+
+def save_msm_catalog(catalog: MsmCatalog, path: str = MSM_CATALOG_FILE) -> None:
+    """
+    Caches an MSM catalog
+
+    Args:
+        catalog: compact MSM catalog
+        path: location of the cached catalog
+
+    """
+    # write to a temporary file first so a reader never sees a partially written catalog
+    tmp_file = f"{path}.tmp-{os.getpid()}"
+    with open(tmp_file, "wb") as f:
+        np.savez_compressed(f, ids=catalog.ids, bbox=catalog.bbox, start_datetime=catalog.start_datetime,
+                            end_datetime=catalog.end_datetime, variables=catalog.variables,
+                            operation_frequency=catalog.operation_frequency, depth_levels=catalog.depth_levels,
+                            depth_offsets=catalog.depth_offsets, last_update=np.array(catalog.last_update))
+    os.replace(tmp_file, path)
+    logger.info(f"cached msm catalog of {len(catalog)} items to {path}")
+
+
+def _stac_datetime(value: str | None) -> np.datetime64:
+    """
+    converts a stac datetime property, a missing datetime is NaT so the item never matches
+    """
+    if value is None:
+        return np.datetime64("NaT", "s")
+    return np.datetime64(value.rstrip("Z"), "s")
+
+
+def _stac_depth_levels(item) -> tuple[float, ...] | None:
+    """
+    depth levels of a stac item from its datacube metadata, None if they are not listed
+    """
+    for name, dimension in item.properties.get("cube:dimensions", {}).items():
+        if (name.startswith("depth") or dimension.get("axis") == "z") and dimension.get("values"):
+            return tuple(float(level) for level in dimension["values"])
+    return None
@@ -0,0 +1,137 @@
+# Copyright 2025 National Oceanography Centre
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#  http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from collections import OrderedDict
+import numpy as np
+import xarray as xr
+import pyinterp
+import pyinterp.backends.xarray
+from attrs import define, field
+from loguru import logger
+
+# grid cells loaded either side of a tile so points on its edges are still bracketed
+TILE_HALO = 1
+# default memory budget of the loaded tiles in bytes
+TILE_CACHE_SIZE = 1024 ** 3
+
+
+def _chunk_bounds(data_array: xr.DataArray, dim: str) -> np.ndarray:
+    """
+    gets the index each chunk along a dimension starts at, plus the length of the dimension. Dask chunks are used if
+    the world is opened with dask, otherwise the chunks of the zarr store. Unchunked arrays are a single chunk.
+    """
+    size = data_array.sizes[dim]
+    if data_array.chunks is not None:
+        chunks = data_array.chunks[data_array.get_axis_num(dim)]
+        return np.concatenate(([0], np.cumsum(chunks)))
+    step = size
+    if "preferred_chunks" in data_array.encoding:
+        step = data_array.encoding["preferred_chunks"].get(dim, size)
+    elif "chunks" in data_array.encoding:
+        step = data_array.encoding["chunks"][data_array.get_axis_num(dim)]
+    return np.append(np.arange(0, size, max(int(step), 1)), size)
+
+
+@define
+class ChunkedGrid4D:
+    """
+    Interpolates a world that is kept out of core in its zarr chunks. For each batch of points only the chunks (plus a
+    halo) the points fall in are loaded, each becomes a pyinterp Grid4D tile that is kept in a least recently used cache
+    bounded by cache_size. It has the same quadrivariate method as a pyinterp Grid4D so it can be used in its place.
+
+    Tiles do not wrap around the antimeridian, so a global world is not treated as circular in longitude.
+
+    Attributes
+    ----------
+    data_array: xr.DataArray
+        lazily opened world variable with time, depth, latitude and longitude dimensions
+    dtype: np.dtype
+        floating point type tiles are loaded as
+    cache_size: int
+        memory budget of the loaded tiles in bytes
+    halo: int
+        grid cells loaded either side of a tile
+    """
+    data_array: xr.DataArray
+    dtype: np.dtype = np.dtype(np.float64)
+    cache_size: int = TILE_CACHE_SIZE
+    halo: int = TILE_HALO
+    tiles: OrderedDict = field(factory=OrderedDict, repr=False)
+    tiles_size: int = 0
+    bounds: dict = field(factory=dict, repr=False)
+    axes: dict = field(factory=dict, repr=False)
+
+    def __attrs_post_init__(self):
+        for dim in self.data_array.dims:
+            self.bounds[dim] = _chunk_bounds(data_array=self.data_array, dim=dim)
+            values = self.data_array[dim].values
+            if dim == "time":
+                values = values.astype('datetime64[ns]').astype(np.int64)
+            self.axes[dim] = values
+
+    def quadrivariate(self, coords: dict, *args, **kwargs) -> np.ndarray:
+        """
+        Interpolates the world on to a set of points, loading the tiles they fall in
+
+        Args:
+            coords: dictionary of longitude, latitude, depth and time arrays
+            *args: passed on to pyinterp quadrivariate
+            **kwargs: passed on to pyinterp quadrivariate
+
+        Returns:
+            interpolated values
+
+        """
+        points = {dim: np.asarray(values) for dim, values in coords.items()}
+        size = points["longitude"].size
+        tile_index = []
+        for dim in self.data_array.dims:
+            values = points[dim]
+            if dim == "time":
+                values = values.astype('datetime64[ns]').astype(np.int64)
+            axis = self.axes[dim]
+            # index of the grid cell at or before each point, the point needs it and the next cell
+            cell = np.clip(np.searchsorted(axis, values, side='right') - 1, 0, max(axis.size - 2, 0))
+            tile_index.append(np.searchsorted(self.bounds[dim], cell, side='right') - 1)
+        tile_index = np.column_stack(tile_index)
+        result = np.full(size, np.nan, dtype=np.float64)
+        tile_keys, inverse = np.unique(tile_index, axis=0, return_inverse=True)
+        for i, tile_key in enumerate(tile_keys):
+            selected = inverse.ravel() == i
+            grid = self.__tile(tile_key=tuple(int(k) for k in tile_key))
+            result[selected] = grid.quadrivariate({dim: values[selected] for dim, values in points.items()},
+                                                  *args, **kwargs)
+        return result
+
+    def __tile(self, tile_key: tuple) -> pyinterp.backends.xarray.Grid4D:
+        """
+        gets the interpolator of a tile from the cache, loading it if needed and evicting the least recently used
+        tiles once the cache is over budget
+        """
+        if tile_key in self.tiles:
+            self.tiles.move_to_end(tile_key)
+            return self.tiles[tile_key][0]
+        selection = {}
+        for dim, chunk in zip(self.data_array.dims, tile_key):
+            bounds = self.bounds[dim]
+            selection[dim] = slice(max(bounds[chunk] - self.halo, 0),
+                                   min(bounds[chunk + 1] + self.halo, self.data_array.sizes[dim]))
+        tile = self.data_array.isel(selection).astype(self.dtype).load()
+        logger.debug(f"loaded tile {tile_key} of {self.data_array.name} ({tile.nbytes} bytes)")
+        grid = pyinterp.backends.xarray.Grid4D(tile, geodetic=True)
+        self.tiles[tile_key] = (grid, tile.nbytes)
+        self.tiles_size += tile.nbytes
+        # always keep the newest tile, even if it is larger than the budget on its own
+        while self.tiles_size > self.cache_size and len(self.tiles) > 1:
+            evicted_key, (_, nbytes) = self.tiles.popitem(last=False)
+            self.tiles_size -= nbytes
+            logger.debug(f"evicted tile {evicted_key} of {self.data_array.name}")
+        return grid
@@ -0,0 +1,258 @@
+# Copyright 2025 National Oceanography Centre
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#  http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import hashlib
+import pickle
+import numpy as np
+import xarray as xr
+from attrs import define
+from loguru import logger
+from scipy.spatial import cKDTree
+from mamma_mia.interpolator_cache import InterpolatorCache, TMP_MARKER
+
+# number of nearest grid nodes whose surrounding cells are searched for the cell containing a point
+NEIGHBOURS = 4
+# newton iterations used to invert the bilinear mapping of a grid cell
+INVERSE_ITERATIONS = 8
+# tolerance on the fractional position of a point for it to lie within a grid cell
+CELL_TOLERANCE = 1e-6
+# sub directory of the interpolator cache that spatial trees are stored in
+TREES_DIR = "trees"
+
+
+def _to_cartesian(lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+    """
+    converts latitudes and longitudes into points on the unit sphere so distances are valid across the poles and
+    the antimeridian
+    """
+    lat_r = np.deg2rad(lat)
+    lon_r = np.deg2rad(lon)
+    return np.column_stack((np.cos(lat_r) * np.cos(lon_r), np.cos(lat_r) * np.sin(lon_r), np.sin(lat_r)))
+
+
+def _local_xy(lat: np.ndarray, lon: np.ndarray, lat0: np.ndarray, lon0: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    projects positions on to a plane tangent at a reference position (in degrees), longitudes are wrapped so cells
+    crossing the antimeridian are not torn apart
+    """
+    dlon = (lon - lon0 + 180.0) % 360.0 - 180.0
+    return dlon * np.cos(np.deg2rad(lat0)), lat - lat0
+
+
+def _inverse_bilinear(corners_x: np.ndarray, corners_y: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    finds the fractional position (s, t) of the origin within quadrilateral cells, corners are ordered (0, 0),
+    (1, 0), (1, 1), (0, 1) along the last axis. The bilinear mapping of each cell is inverted with newton iterations,
+    which are exact after one iteration for parallelogram cells.
+    """
+    x00, x10, x11, x01 = np.moveaxis(corners_x, -1, 0)
+    y00, y10, y11, y01 = np.moveaxis(corners_y, -1, 0)
+    s = np.full(x00.shape, 0.5)
+    t = np.full(x00.shape, 0.5)
+    for _ in range(INVERSE_ITERATIONS):
+        fx = (1 - s) * (1 - t) * x00 + s * (1 - t) * x10 + s * t * x11 + (1 - s) * t * x01
+        fy = (1 - s) * (1 - t) * y00 + s * (1 - t) * y10 + s * t * y11 + (1 - s) * t * y01
+        dxs = (1 - t) * (x10 - x00) + t * (x11 - x01)
+        dys = (1 - t) * (y10 - y00) + t * (y11 - y01)
+        dxt = (1 - s) * (x01 - x00) + s * (x11 - x10)
+        dyt = (1 - s) * (y01 - y00) + s * (y11 - y10)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            determinant = dxs * dyt - dxt * dys
+            s = s - (fx * dyt - fy * dxt) / determinant
+            t = t - (fy * dxs - fx * dys) / determinant
+    return s, t
+
+
+def _axis_weights(axis: np.ndarray, points: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    finds the indexes either side of each point along a monotonically increasing axis and the linear weight of the
+    upper index. Points outside the axis are flagged as invalid.
+    """
+    upper = np.clip(np.searchsorted(axis, points, side='right'), 1, axis.size - 1)
+    lower = upper - 1
+    span = axis[upper] - axis[lower]
+    weight = (points - axis[lower]) / span
+    valid = (points >= axis[0]) & (points <= axis[-1])
+    return lower, weight, valid
+
+
+@define
+class CurvilinearGrid4D:
+    """
+    Interpolates a world directly on its curvilinear nav_lat/nav_lon grid without regridding it first. A spatial tree
+    finds the grid cell (the quadrilateral between four neighbouring grid nodes) containing each point, horizontal
+    interpolation is then bilinear within that cell, using the inverse of the cell's bilinear mapping, so it is as
+    accurate as regridding with bilinear weights. Vertical and temporal interpolation are linear. It has the same
+    quadrivariate method as a pyinterp Grid4D so it can be used in its place.
+
+    Attributes
+    ----------
+    tree: cKDTree
+        spatial tree over the grid nodes on the unit sphere
+    lat: np.ndarray
+        2D latitudes of the grid nodes
+    lon: np.ndarray
+        2D longitudes of the grid nodes
+    depth: np.ndarray
+        depth levels of the world
+    time: np.ndarray
+        time steps of the world
+    values: np.ndarray
+        world values with dimensions time, depth, grid node
+    neighbours: int
+        number of nearest grid nodes whose surrounding cells are searched for the cell containing a point
+    """
+    tree: cKDTree
+    lat: np.ndarray
+    lon: np.ndarray
+    depth: np.ndarray
+    time: np.ndarray
+    values: np.ndarray
+    neighbours: int = NEIGHBOURS
+
+    @classmethod
+    def from_dataset(cls, ds: xr.Dataset, var: str, lat: str, lon: str, cache: InterpolatorCache = None,
+                     dtype: np.dtype = np.float64) -> "CurvilinearGrid4D":
+        """
+        Creates a curvilinear interpolator for a variable of a world
+
+        Args:
+            ds: world dataset with time and depth coordinates
+            var: variable to interpolate
+            lat: name of 2D latitude variable
+            lon: name of 2D longitude variable
+            cache: optional interpolator cache to persist the spatial tree in, trees are keyed by a hash of the grid so
+                   every variable and run over the same model domain reuses them
+            dtype: floating point type the world values are held in
+
+        Returns:
+            CurvilinearGrid4D object
+
+        """
+        y_dim, x_dim = ds[lat].dims
+        lat_values = ds[lat].values.astype(np.float64)
+        lon_values = ds[lon].values.astype(np.float64)
+        tree = cls.__tree(lat=lat_values, lon=lon_values, cache=cache)
+        data_array = ds[var].transpose("time", "depth", y_dim, x_dim)
+        values = data_array.values.astype(dtype).reshape(data_array.sizes["time"], data_array.sizes["depth"], -1)
+        return cls(tree=tree,
+                   lat=lat_values,
+                   lon=lon_values,
+                   depth=ds["depth"].values.astype(np.float64),
+                   time=ds["time"].values.astype('datetime64[ns]'),
+                   values=values)
+
+    @staticmethod
+    def __tree(lat: np.ndarray, lon: np.ndarray, cache: InterpolatorCache = None) -> cKDTree:
+        tree_file = None
+        if cache is not None:
+            grid_hash = hashlib.sha256()
+            for array in [lat, lon]:
+                grid_hash.update(str(array.shape).encode())
+                grid_hash.update(np.ascontiguousarray(array).tobytes())
+            tree_file = cache.file_path(kind=TREES_DIR, name=f"{grid_hash.hexdigest()}.tree")
+            # touching the tree marks it as recently used so it is evicted after trees that haven't been reused
+            if cache.touch(path=tree_file):
+                logger.info(f"reusing spatial tree {tree_file}")
+                try:
+                    with open(tree_file, "rb") as f:
+                        return pickle.load(f)
+                except FileNotFoundError:
+                    # evicted by another process since it was touched
+                    pass
+        logger.info("building spatial tree for curvilinear grid")
+        tree = cKDTree(_to_cartesian(lat=lat.ravel(), lon=lon.ravel()))
+        if tree_file is not None:
+            tmp_file = f"{tree_file}{TMP_MARKER}{os.getpid()}"
+            with open(tmp_file, "wb") as f:
+                pickle.dump(tree, f)
+            os.replace(tmp_file, tree_file)
+            logger.info(f"stored spatial tree {tree_file}")
+            # trees count towards the disk budget of the interpolator cache
+            cache.evict()
+        return tree
+
+    def quadrivariate(self, coords: dict, *args, **kwargs) -> np.ndarray:
+        """
+        Interpolates the world on to a set of points
+
+        Args:
+            coords: dictionary of longitude, latitude, depth and time arrays
+
+        Returns:
+            interpolated values, NaN where a point is outside the world's grid, depth or time range or all of its
+            surrounding values are missing
+
+        """
+        longitude = np.asarray(coords["longitude"], dtype=np.float64)
+        latitude = np.asarray(coords["latitude"], dtype=np.float64)
+        depth = np.asarray(coords["depth"], dtype=np.float64)
+        time = np.asarray(coords["time"]).astype('datetime64[ns]')
+
+        # horizontal bilinear weights of the corners of the cell containing each point
+        corners, horizontal, inside = self.__cells(latitude=latitude, longitude=longitude)
+
+        # vertical and temporal linear weights
+        z0, z_weight, z_valid = _axis_weights(self.depth, depth)
+        t0, t_weight, t_valid = _axis_weights(self.time.astype(np.int64), time.astype(np.int64))
+
+        result = np.zeros(longitude.size, dtype=np.float64)
+        for t_offset, t_w in [(0, 1.0 - t_weight), (1, t_weight)]:
+            for z_offset, z_w in [(0, 1.0 - z_weight), (1, z_weight)]:
+                values = self.values[(t0 + t_offset)[:, None], (z0 + z_offset)[:, None], corners]
+                weights = np.where(np.isnan(values), 0.0, horizontal)
+                with np.errstate(invalid='ignore'):
+                    level = np.nansum(values * weights, axis=1) / weights.sum(axis=1)
+                # levels and time steps that don't contribute shouldn't spread their missing values
+                result += np.where(t_w * z_w > 0, t_w * z_w * level, 0.0)
+        result[~(inside & z_valid & t_valid)] = np.nan
+        return result
+
+    def __cells(self, latitude: np.ndarray, longitude: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        finds the cell containing each point among the cells around its nearest grid nodes
+
+        Returns:
+            flat indexes of the four corners of each point's cell, their bilinear weights and whether the point is
+            within a cell of the grid
+        """
+        ny, nx = self.lat.shape
+        _, node = self.tree.query(_to_cartesian(lat=latitude, lon=longitude), k=self.neighbours)
+        node = node.reshape(longitude.size, -1)
+        corners = np.zeros((longitude.size, 4), dtype=np.int64)
+        horizontal = np.zeros((longitude.size, 4), dtype=np.float64)
+        inside = np.zeros(longitude.size, dtype=bool)
+        for n in range(node.shape[1]):
+            j, i = np.divmod(node[:, n], nx)
+            # a node is a corner of up to four cells, identified by the index of their first corner
+            for dj, di in [(0, 0), (-1, 0), (0, -1), (-1, -1)]:
+                remaining = np.flatnonzero(~inside & (j + dj >= 0) & (j + dj < ny - 1) &
+                                           (i + di >= 0) & (i + di < nx - 1))
+                if remaining.size == 0:
+                    continue
+                j0 = j[remaining] + dj
+                i0 = i[remaining] + di
+                corner_j = j0[:, None] + np.array([0, 0, 1, 1])
+                corner_i = i0[:, None] + np.array([0, 1, 1, 0])
+                x, y = _local_xy(lat=self.lat[corner_j, corner_i], lon=self.lon[corner_j, corner_i],
+                                 lat0=latitude[remaining, None], lon0=longitude[remaining, None])
+                cell_s, cell_t = _inverse_bilinear(corners_x=x, corners_y=y)
+                within = ((cell_s >= -CELL_TOLERANCE) & (cell_s <= 1 + CELL_TOLERANCE) &
+                          (cell_t >= -CELL_TOLERANCE) & (cell_t <= 1 + CELL_TOLERANCE))
+                found = remaining[within]
+                cell_s = np.clip(cell_s[within], 0.0, 1.0)
+                cell_t = np.clip(cell_t[within], 0.0, 1.0)
+                corners[found] = corner_j[within] * nx + corner_i[within]
+                horizontal[found] = np.column_stack(((1 - cell_s) * (1 - cell_t), cell_s * (1 - cell_t),
+                                                     cell_s * cell_t, (1 - cell_s) * cell_t))
+                inside[found] = True
+        return corners, horizontal, inside
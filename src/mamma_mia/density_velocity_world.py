@@ -248,7 +248,7 @@ class Reality:
     verbose: bool = False
 
     @classmethod
-    def for_glidersim(cls,extent: WorldExtent,env_source:str,verbose: bool = False):
+    def for_glidersim(cls,extent: WorldExtent,env_source:str,verbose: bool = False,lazy: bool = False):
         # reset logger
         logger.remove()        # set logger based on requested verbosity
         if verbose:
@@ -257,7 +257,7 @@ class Reality:
             logger.add(sys.stderr, format='{time:YYYY-MM-DDTHH:mm:ss} - <level>{level}</level> - {message}',level="DEBUG",filter=log_filter)
         logger.info("creating velocity reality")
         world = RealityWorld.for_glidersim(extent=extent,env_source=env_source)
-        interpolators = Interpolators()
+        interpolators = Interpolators(lazy=lazy)
         interpolators.build(worlds=world.world_conf,mission="DVR",source_type=world.source.source_type)
         logger.success("reality created successfully")
         return cls(extent=extent,
@@ -0,0 +1,275 @@
+# Copyright 2025 National Oceanography Centre
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#  http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import re
+import json
+import shutil
+import time
+import xarray as xr
+from loguru import logger
+from mamma_mia.locks import FileLock
+
+# suffix of the manifest kept next to each downloaded store recording which parts of it have been written, it is kept
+# outside the store so (re)initialising the store never removes it
+MANIFEST_SUFFIX = ".manifest.json"
+# names the time dimension has in downloaded worlds
+TIME_DIMS = ["time", "time_counter"]
+# suffix of the lock file kept next to a store while it is being downloaded
+LOCK_SUFFIX = ".lock"
+# default upper bound of the size of each slab written, bounds the memory a download holds at once
+MAX_SLAB_BYTES = 256 * 1024 ** 2
+# part of the store holding the variables without a time dimension
+STATIC_PART = "static"
+# files of a zarr store (formats 2 and 3) holding metadata rather than chunks
+ZARR_METADATA_FILES = ["zarr.json", ".zarray", ".zattrs", ".zgroup", ".zmetadata"]
+
+
+def store_complete(store: str, time_start: str | None = None, time_end: str | None = None) -> bool:
+    """
+    Checks whether a downloaded store is complete and can be used
+
+    Args:
+        store: location of the store
+        time_start: start of the time range the store was downloaded for, None if unknown
+        time_end: end of the time range the store was downloaded for, None if unknown
+
+    Returns:
+        True if every part of the store has been written. Stores without a manifest were downloaded before manifests
+        were written, they are validated instead and given a complete manifest if they pass.
+
+    """
+    if not os.path.isdir(store):
+        return False
+    manifest = _read_manifest(store=store)
+    if manifest is None:
+        if not _legacy_store_valid(store=store, time_start=time_start, time_end=time_end):
+            logger.warning(f"{store} has no manifest and is incomplete, it will be downloaded again")
+            return False
+        # the parts are unknown, so the store is written again from scratch if it is ever resumed
+        _write_manifest(store=store, manifest={"parts": None, "written": [], "complete": True})
+        return True
+    return manifest["complete"]
+
+
+def store_lock(store: str) -> FileLock:
+    """
+    Lock held while a store is downloaded, so a world missing from the cache is downloaded by a single process (or
+    thread) while the others wait for it and then use the cached store
+
+    Args:
+        store: location of the store
+
+    Returns:
+        FileLock of the store
+    """
+    return FileLock(path=store.rstrip("/") + LOCK_SUFFIX)
+
+
+def store_locked(store: str) -> bool:
+    """
+    Args:
+        store: location of the store
+
+    Returns:
+        True if the store is being downloaded, a lock left behind by a download that has died is ignored
+    """
+    lock = store_lock(store=store)
+    return os.path.exists(lock.path) and not lock.stale()
+
+
+def store_size(store: str) -> int:
+    """
+    Args:
+        store: location of the store
+
+    Returns:
+        size of the store on disk in bytes
+    """
+    size = 0
+    for root, _, files in os.walk(store):
+        size += sum(os.path.getsize(os.path.join(root, f)) for f in files)
+    return size
+
+
+def remove_store(store: str) -> None:
+    """
+    Removes a downloaded store and its manifest
+
+    Args:
+        store: location of the store
+
+    """
+    shutil.rmtree(store, ignore_errors=True)
+    manifest_file = store.rstrip("/") + MANIFEST_SUFFIX
+    if os.path.exists(manifest_file):
+        os.remove(manifest_file)
+
+
+def write_resumable(ds: xr.Dataset, store: str, max_slab_bytes: int = MAX_SLAB_BYTES) -> None:
+    """
+    Writes a lazily opened world to a zarr store one time slab at a time, each slab matching a chunk of the store.
+    A manifest records every slab that has been written, so if the download is interrupted writing it again only
+    fetches the missing slabs, and the store is only treated as cached once every slab is written.
+
+    Args:
+        ds: lazily opened world, chunked with dask
+        store: location of the zarr store to write
+        max_slab_bytes: upper bound of the size of each slab, time chunks that are larger are split
+
+    """
+    time_dim = next((dim for dim in TIME_DIMS if dim in ds.dims), None)
+    ds = _uniform_chunks(ds=ds)
+    ds = _bound_slabs(ds=ds, time_dim=time_dim, max_slab_bytes=max_slab_bytes)
+    slabs = _slabs(ds=ds, time_dim=time_dim)
+    parts = [STATIC_PART] + [f"{start}:{end}" for start, end in slabs]
+    manifest = _read_manifest(store=store) if os.path.isdir(store) else None
+    if manifest is None or manifest["parts"] != parts:
+        # the manifest is written before anything else so an interrupted store is never mistaken for a complete one
+        manifest = {"parts": parts, "written": [], "complete": False}
+        _write_manifest(store=store, manifest=manifest)
+        ds.to_zarr(store=store, mode="w", compute=False)
+    else:
+        logger.info(f"resuming download of {store}, {len(manifest['written'])}/{len(parts)} parts already written")
+    static_vars = [var for var in ds.variables if time_dim is None or time_dim not in ds[var].dims]
+    total_bytes = sum(ds[var].nbytes for var in ds.data_vars)
+    written_bytes = sum(_part_nbytes(ds=ds, time_dim=time_dim, slab=slab, static_vars=static_vars)
+                        for part, slab in zip(parts, [None] + slabs) if part in manifest["written"])
+    start_time = time.perf_counter()
+    for part, slab in zip(parts, [None] + slabs):
+        if part in manifest["written"]:
+            continue
+        if slab is None:
+            ds[static_vars].to_zarr(store=store, mode="a")
+        else:
+            region = ds.isel({time_dim: slice(*slab)}).drop_vars(static_vars)
+            region.to_zarr(store=store, region={time_dim: slice(*slab)})
+        manifest["written"].append(part)
+        _write_manifest(store=store, manifest=manifest)
+        written_bytes += _part_nbytes(ds=ds, time_dim=time_dim, slab=slab, static_vars=static_vars)
+        logger.info(f"written part {len(manifest['written'])}/{len(parts)} of {store}, "
+                    f"{written_bytes / 1024 ** 2:.1f}/{total_bytes / 1024 ** 2:.1f} MiB "
+                    f"({100 * written_bytes / max(total_bytes, 1):.0f}%) in {time.perf_counter() - start_time:.1f}s")
+    manifest["complete"] = True
+    _write_manifest(store=store, manifest=manifest)
+
+
+def _uniform_chunks(ds: xr.Dataset) -> xr.Dataset:
+    """
+    rechunks a lazily opened world so every chunk of a dimension, other than its last, is the same size. Zarr needs
+    uniform chunks and a subset (in time, space or depth) of a chunked world usually starts and ends part way through a
+    chunk, each dimension is given the size of its largest chunk.
+    """
+    chunks = {}
+    for var in ds.variables.values():
+        for dim, sizes in (var.chunksizes or {}).items():
+            chunks[dim] = max(chunks.get(dim, 1), *sizes)
+    if not chunks:
+        return ds
+    return ds.chunk(chunks)
+
+
+def _bound_slabs(ds: xr.Dataset, time_dim: str | None, max_slab_bytes: int) -> xr.Dataset:
+    """
+    rechunks the time dimension of a lazily opened world so no slab is larger than max_slab_bytes
+    """
+    if time_dim is None or not ds.chunks or time_dim not in ds.chunks:
+        return ds
+    step_bytes = sum(ds[var].nbytes for var in ds.data_vars if time_dim in ds[var].dims) / ds.sizes[time_dim]
+    steps = max(int(max_slab_bytes // max(step_bytes, 1)), 1)
+    if max(ds.chunks[time_dim]) > steps:
+        logger.debug(f"splitting time chunks into slabs of {steps} steps")
+        ds = ds.chunk({time_dim: steps})
+    return ds
+
+
+def _part_nbytes(ds: xr.Dataset, time_dim: str | None, slab: tuple[int, int] | None, static_vars: list[str]) -> int:
+    """
+    size of the data variables written in a part of the store
+    """
+    if slab is None:
+        return sum(ds[var].nbytes for var in ds.data_vars if var in static_vars)
+    step_bytes = sum(ds[var].nbytes for var in ds.data_vars if var not in static_vars) / ds.sizes[time_dim]
+    return int(step_bytes * (slab[1] - slab[0]))
+
+
+def _slabs(ds: xr.Dataset, time_dim: str | None) -> list[tuple[int, int]]:
+    """
+    splits the time dimension of a world into slabs of one (uniform) time chunk each, so every slab is written to
+    whole chunks of the store
+    """
+    if time_dim is None:
+        return []
+    size = ds.sizes[time_dim]
+    chunks = ds.chunks.get(time_dim) if ds.chunks else None
+    step = chunks[0] if chunks else 1
+    return [(start, min(start + step, size)) for start in range(0, size, step)]
+
+
+def _legacy_store_valid(store: str, time_start: str | None, time_end: str | None) -> bool:
+    """
+    validates a store written in one go before manifests were written, which a failed download may have left partial.
+    Its metadata and coordinates are written before any data, so besides consolidated metadata and time coordinates
+    over the requested range every time chunk of every variable must have been written.
+    """
+    try:
+        ds = xr.open_zarr(store, consolidated=True)
+    except (OSError, ValueError, KeyError) as e:
+        logger.warning(f"could not open {store}: {e}")
+        return False
+    time_dim = next((dim for dim in TIME_DIMS if dim in ds.dims), None)
+    if time_dim is None:
+        return True
+    times = ds[time_dim].sel({time_dim: slice(time_start, time_end)})
+    if times.size == 0 or bool(times.isnull().any()):
+        return False
+    for var in ds.data_vars:
+        if time_dim not in ds[var].dims:
+            continue
+        axis = ds[var].dims.index(time_dim)
+        chunk = ds[var].encoding["chunks"][axis]
+        if _written_chunks(path=os.path.join(store, var), axis=axis) != set(range(-(-ds.sizes[time_dim] // chunk))):
+            return False
+    return True
+
+
+def _written_chunks(path: str, axis: int) -> set[int]:
+    """
+    indices along an axis of the chunks of an array that are on disk. Chunks that are all fill value (e.g. land) are
+    not written, so a chunk index is on disk if any chunk with that index along the axis is.
+    """
+    indices = set()
+    for directory, _, files in os.walk(path):
+        for f in files:
+            if f in ZARR_METADATA_FILES:
+                continue
+            key = os.path.relpath(os.path.join(directory, f), path)
+            # zarr 3 keys chunks as c/0/1/2, zarr 2 as 0.1.2 (or 0/1/2)
+            key = key.removeprefix("c" + os.sep)
+            indices.add(int(re.split(r"[./\\]", key)[axis]))
+    return indices
+
+
+def _read_manifest(store: str) -> dict | None:
+    manifest_file = store.rstrip("/") + MANIFEST_SUFFIX
+    if not os.path.exists(manifest_file):
+        return None
+    with open(manifest_file, "r") as f:
+        return json.load(f)
+
+
+def _write_manifest(store: str, manifest: dict) -> None:
+    manifest_file = store.rstrip("/") + MANIFEST_SUFFIX
+    os.makedirs(os.path.dirname(manifest_file) or ".", exist_ok=True)
+    tmp_file = f"{manifest_file}.tmp-{os.getpid()}"
+    with open(tmp_file, "w") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_file, manifest_file)
@@ -0,0 +1,82 @@
+# Copyright 2025 National Oceanography Centre
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#  http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable
+from attrs import define
+from loguru import logger
+from mamma_mia.exceptions import UnknownSourceKey
+
+
+@define
+class WorldFetcher:
+    """
+    Gets worlds concurrently. Each world is fetched on a thread pool (downloads are network bound) with a limit on the
+    number of concurrent downloads, failed downloads are retried with exponential backoff.
+
+    Parameters
+    ----------
+    max_concurrent: int, optional
+        maximum number of worlds downloaded at the same time
+    retries: int, optional
+        number of times a failed download is retried
+    backoff: float, optional
+        seconds to wait before the first retry, doubled for every retry after it
+    """
+    max_concurrent: int = 4
+    retries: int = 3
+    backoff: float = 2.0
+
+    def fetch(self, requests: dict[str, Callable]) -> dict:
+        """
+        Runs world requests concurrently
+
+        Args:
+            requests: dictionary of world name and a callable that gets it
+
+        Returns:
+            dictionary of world name and the result of its request
+
+        Raises:
+            the error of a request that still fails once its retries are used up
+        """
+        results = {}
+        if not requests:
+            return results
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max(min(self.max_concurrent, len(requests)), 1)) as executor:
+            futures = {executor.submit(self.__fetch_one, name, request): name for name, request in requests.items()}
+            for future in as_completed(futures):
+                results[futures[future]] = future.result()
+                logger.info(f"got {len(results)}/{len(requests)} worlds")
+        logger.info(f"got {len(requests)} worlds in {time.perf_counter() - start:.1f}s")
+        return results
+
+    def __fetch_one(self, name: str, request: Callable):
+        """
+        gets a single world, retrying with backoff if it fails
+        """
+        for attempt in range(self.retries + 1):
+            start = time.perf_counter()
+            try:
+                result = request()
+                logger.info(f"got world {name} in {time.perf_counter() - start:.1f}s")
+                return result
+            except UnknownSourceKey:
+                raise
+            except Exception as e:
+                if attempt == self.retries:
+                    logger.error(f"failed to get world {name} after {attempt + 1} attempts: {e}")
+                    raise
+                wait = self.backoff * 2 ** attempt
+                logger.warning(f"failed to get world {name} (attempt {attempt + 1}): {e}, retrying in {wait:.1f}s")
+                time.sleep(wait)
@@ -9,7 +9,6 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 import os
-from datetime import datetime
 
 from mamma_mia.catalog import Cats
 from loguru import logger
@@ -269,13 +268,15 @@ class FindWorlds:
                                     and variables[m].bbox[2] > extent.lon_max and
                                     variables[m].bbox[3] > extent.lat_max):
                                 depth_len = 0
+                                depth_levels = None
                                 # get length of depth dimension
                                 for coord in variables[m].coordinates:
                                     if coord.coordinate_id == "depth":
                                         # some multiple sources dataasets don't have any depth values so need to handle None
                                         try:
                                             depth_len = coord.values.__len__()
-                                        except AttributeError:
+                                            depth_levels = tuple(float(level) for level in coord.values)
+                                        except (AttributeError, TypeError):
                                             continue
                                 # if depth dimension is single value i.e. 2D then skip dataset
                                 if depth_len == 1:
@@ -342,7 +343,8 @@ class FindWorlds:
                                         resolution= ResolutionTypeWithRank.from_string(enum_string=parts[5]),
                                         field_type=field_type,
                                         variable_alias={variables[m].short_name:key},
-                                        alternative_parameter={key:alternative_parameter}
+                                        alternative_parameter={key:alternative_parameter},
+                                        depth_levels=depth_levels
                                     )
                                     # create a new world entry based on existing entries ranking and variables.
                                     # NOTE this assumes that all variables of a dataset exist across all field types.
@@ -391,123 +393,112 @@ class FindWorlds:
         alternative_source_names = {}
         for src in alternative_sources:
             alternative_source_names[src] = inventory.parameters.entries[src].source_names
-        # create datetimes from extent strings
-        world_start = datetime.strptime(extent.time_start, "%Y-%m-%d")
-        world_end = datetime.strptime(extent.time_end, "%Y-%m-%d")
-        # for every item in msm catalog
-        for item in cat.msm_cat.Items:
-            # see if the item contains the required temporal and spatial extent
-            if (
-                    item.bbox[0] <= extent.lon_min and
-                    item.bbox[2] >= extent.lon_max and
-                    item.bbox[1] <= extent.lat_min and
-                    item.bbox[3] >= extent.lat_max and
-                    datetime.strptime(item.properties["start_datetime"], "%Y-%m-%dT%H:%M:%SZ") < world_start and
-                    datetime.strptime(item.properties["end_datetime"], "%Y-%m-%dT%H:%M:%SZ") > world_end
-            ):
-                # check to see if item variable is in parameters list
-                variables = item.properties["variables"]
-                # check each variable
-                for i in range(variables.__len__()):
-                    alternative_parameter = None
-                    for alt_key,alt_src in alternative_source_names.items():
-                        if variables[i] in alt_src:
-                            alternative_parameter = alt_key
-                            break
-                    if variables[i] in inventory.parameters.entries[key].source_names or alternative_parameter is not None:
-                        parts = item.id.split("/")
-                        # check to see if field type is supported by MM
-                        try:
-                            field_type = FieldTypeWithRank.from_string(enum_string=item.properties["operation_frequency"])
-                        except ValueError:
-                            logger.debug(f"{item.properties['operation_frequency']} is not a supported field type")
-                            continue
-                        world_id = item.id
-                        # check to see if domain type is supported by MM
-                        try:
-                            if item.bbox == [-180.0, -90.0, 180.0, 90.0]:
-                                domain_type = DomainType.from_string(enum_string="glo")
-                            else:
-                                domain_type = DomainType.from_string(enum_string="regional")
-                        except ValueError as e:
-                            logger.debug(f"domain {e} not supported, skipping this dataset")
-                            continue
-                        # check is world type is supported
-                        try:
-                            # TODO this should not be hardcoded, ideally need to locate a suitable field in catalog metadata
-                            world_type = WorldType.from_string(enum_string="mod")
-                        except ValueError as e:
-                            logger.debug(f"world type {e} not supported, skipping this dataset")
-                            continue
-                        resolution_parts = parts[1].split("-")
-                        try:
-                            resolution = ResolutionTypeWithRank.from_string(enum_string=resolution_parts[1])
-                        except ValueError as e:
-                            logger.debig(f"resolution {e} not supported, skipping this dataset")
-                            continue
-                        if parts[2] == "tn":
-                            logger.debug(f"model types {parts[2]} not currently supported, skipping this dataset")
-                            continue
-                        # after all that PHEW! we can add to matched entries
-                        logger.info(f"found a match in {item.id} for {key}")
-                        new_world = MatchedWorld(
-                            data_id=item.id,
-                            world_type=world_type,
-                            domain=domain_type,
-                            dataset_name=parts[1],
-                            resolution=resolution,
-                            field_type=field_type,
-                            variable_alias={item.properties["variables"][i]:key},
-                            alternative_parameter={key:alternative_parameter}
-                        )
-                        # check existing worlds to see if the new one is better and replace if it is
-                        for world_id2,world in self.entries.items():
-                            if set(new_world.variable_alias) & set(world.variable_alias):
-                                logger.info("found world with same variable alias, will assess which one to keep")
-                                if new_world.field_type.rank < world.field_type.rank or new_world.resolution.rank < world.resolution.rank:
-                                    logger.info("new model is ranked higher, replacing....")
-                                    # update new world with any existing variable aliases and alternative parameters
-                                    try:
-                                        new_world.variable_alias.update(self.entries[world_id].variable_alias)
-                                        new_world.alternative_parameter.update(self.entries[world_id].alternative_parameter)
-                                    except KeyError as e:
-                                        # this is raised if the world id doesn't already exist, i.e. if the model is better
-                                        # rather than if another variable has already created the better model
-                                        logger.debug(f"key {e} doesn't exist in world entries")
-                                        pass
-                                    del self.entries[world_id2]
-                                    self.entries[world_id] = new_world
-                                    logger.info(f"replaced world {world.data_id} with new world {new_world.data_id}")
-                                    break
-
-                        # check each world id to see if an entry needs updating for new variables etc.
-                        if world_id in self.entries:
-                            # if the rank of existing world is higher (and therefore not as good) replace
-                            if self.entries[world_id].field_type.rank > new_world.field_type.rank:
-                                # get any existing variables
-                                existing_vars = self.entries[world_id].variable_alias
-                                # get any existing alternative variables
-                                existing_alts = self.entries[world_id].alternative_parameter
+        # for every item in msm catalog that contains the required temporal and spatial extent
+        for item in cat.msm_cat.search(extent=extent):
+            # check to see if item variable is in parameters list
+            variables = item.variables
+            # check each variable
+            for i in range(variables.__len__()):
+                alternative_parameter = None
+                for alt_key,alt_src in alternative_source_names.items():
+                    if variables[i] in alt_src:
+                        alternative_parameter = alt_key
+                        break
+                if variables[i] in inventory.parameters.entries[key].source_names or alternative_parameter is not None:
+                    parts = item.id.split("/")
+                    # check to see if field type is supported by MM
+                    try:
+                        field_type = FieldTypeWithRank.from_string(enum_string=item.operation_frequency)
+                    except ValueError:
+                        logger.debug(f"{item.operation_frequency} is not a supported field type")
+                        continue
+                    world_id = item.id
+                    # check to see if domain type is supported by MM
+                    try:
+                        if item.bbox == [-180.0, -90.0, 180.0, 90.0]:
+                            domain_type = DomainType.from_string(enum_string="glo")
+                        else:
+                            domain_type = DomainType.from_string(enum_string="regional")
+                    except ValueError as e:
+                        logger.debug(f"domain {e} not supported, skipping this dataset")
+                        continue
+                    # check is world type is supported
+                    try:
+                        # TODO this should not be hardcoded, ideally need to locate a suitable field in catalog metadata
+                        world_type = WorldType.from_string(enum_string="mod")
+                    except ValueError as e:
+                        logger.debug(f"world type {e} not supported, skipping this dataset")
+                        continue
+                    resolution_parts = parts[1].split("-")
+                    try:
+                        resolution = ResolutionTypeWithRank.from_string(enum_string=resolution_parts[1])
+                    except ValueError as e:
+                        logger.debig(f"resolution {e} not supported, skipping this dataset")
+                        continue
+                    if parts[2] == "tn":
+                        logger.debug(f"model types {parts[2]} not currently supported, skipping this dataset")
+                        continue
+                    # after all that PHEW! we can add to matched entries
+                    logger.info(f"found a match in {item.id} for {key}")
+                    new_world = MatchedWorld(
+                        data_id=item.id,
+                        world_type=world_type,
+                        domain=domain_type,
+                        dataset_name=parts[1],
+                        resolution=resolution,
+                        field_type=field_type,
+                        variable_alias={item.variables[i]:key},
+                        alternative_parameter={key:alternative_parameter},
+                        depth_levels=item.depth_levels
+                    )
+                    # check existing worlds to see if the new one is better and replace if it is
+                    for world_id2,world in self.entries.items():
+                        if set(new_world.variable_alias) & set(world.variable_alias):
+                            logger.info("found world with same variable alias, will assess which one to keep")
+                            if new_world.field_type.rank < world.field_type.rank or new_world.resolution.rank < world.resolution.rank:
+                                logger.info("new model is ranked higher, replacing....")
+                                # update new world with any existing variable aliases and alternative parameters
+                                try:
+                                    new_world.variable_alias.update(self.entries[world_id].variable_alias)
+                                    new_world.alternative_parameter.update(self.entries[world_id].alternative_parameter)
+                                except KeyError as e:
+                                    # this is raised if the world id doesn't already exist, i.e. if the model is better
+                                    # rather than if another variable has already created the better model
+                                    logger.debug(f"key {e} doesn't exist in world entries")
+                                    pass
+                                del self.entries[world_id2]
                                 self.entries[world_id] = new_world
-                                # add new variables if they aren't already present
-                                for key5, var5 in existing_vars.items():
-                                    if variables[i] not in self.entries[world_id].variable_alias.keys():
-                                        self.entries[world_id].variable_alias[key5] = var5
-                                for key6, var6 in existing_alts.items():
-                                    if variables[i] not in self.entries[
-                                        world_id].alternative_parameter.keys():
-                                        self.entries[world_id].alternative_parameter[key6] = var6
-                            else:
-                                # if ranking is not better than just update with the variable name
-                                logger.info(
-                                    f"updating {item.id} with key {key} for field type {field_type.field_type.name}")
+                                logger.info(f"replaced world {world.data_id} with new world {new_world.data_id}")
+                                break
+
+                    # check each world id to see if an entry needs updating for new variables etc.
+                    if world_id in self.entries:
+                        # if the rank of existing world is higher (and therefore not as good) replace
+                        if self.entries[world_id].field_type.rank > new_world.field_type.rank:
+                            # get any existing variables
+                            existing_vars = self.entries[world_id].variable_alias
+                            # get any existing alternative variables
+                            existing_alts = self.entries[world_id].alternative_parameter
+                            self.entries[world_id] = new_world
+                            # add new variables if they aren't already present
+                            for key5, var5 in existing_vars.items():
                                 if variables[i] not in self.entries[world_id].variable_alias.keys():
-                                    self.entries[world_id].variable_alias[variables[i]] = key
-                                if variables[i] not in self.entries[world_id].alternative_parameter.keys():
-                                    self.entries[world_id].alternative_parameter[key] = alternative_parameter
+                                    self.entries[world_id].variable_alias[key5] = var5
+                            for key6, var6 in existing_alts.items():
+                                if variables[i] not in self.entries[
+                                    world_id].alternative_parameter.keys():
+                                    self.entries[world_id].alternative_parameter[key6] = var6
                         else:
-                            # world doesn't exist yet so just add as a complete entry
-                            logger.info(f"creating new matched world {item.id} for key {key}")
-                            self.entries[world_id] = new_world
+                            # if ranking is not better than just update with the variable name
+                            logger.info(
+                                f"updating {item.id} with key {key} for field type {field_type.field_type.name}")
+                            if variables[i] not in self.entries[world_id].variable_alias.keys():
+                                self.entries[world_id].variable_alias[variables[i]] = key
+                            if variables[i] not in self.entries[world_id].alternative_parameter.keys():
+                                self.entries[world_id].alternative_parameter[key] = alternative_parameter
+                    else:
+                        # world doesn't exist yet so just add as a complete entry
+                        logger.info(f"creating new matched world {item.id} for key {key}")
+                        self.entries[world_id] = new_world
 
 
@@ -9,23 +9,43 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from mamma_mia.worlds import SourceConfig,SourceType, WorldsConf
+from mamma_mia.worlds import SourceConfig,SourceType, WorldsConf, MatchedWorld, WorldExtent
 from mamma_mia.catalog import Cats
 import numpy as np
 from loguru import logger
 import os
+import hashlib
 import copernicusmarine
 import zarr
 from mamma_mia.exceptions import UnknownSourceKey
+from mamma_mia.world_cache import WorldCacheIndex
+from mamma_mia.download import store_complete, write_resumable, store_lock, TIME_DIMS
+from mamma_mia.fetcher import WorldFetcher
+from functools import partial
 import xarray as xr
 
-def get_worlds(cat: Cats, worlds:WorldsConf,source:SourceConfig) -> dict:
+# names of the depth dimension of msm worlds, depending on the grid of the variable
+MSM_DEPTH_DIMS = ["deptht", "depthu", "depthv"]
+# directories worlds downloaded from each source are cached in
+CACHE_DIRS = {SourceType.MSM: "msm-data/", SourceType.CMEMS: "copernicus-data/"}
+
+
+def world_caches() -> dict[SourceType, WorldCacheIndex]:
+    """
+    Returns:
+        dictionary of source type and the index of its world cache
+    """
+    return {source_type: WorldCacheIndex(cache_dir=cache_dir) for source_type, cache_dir in CACHE_DIRS.items()}
+
+
+def get_worlds(cat: Cats, worlds:WorldsConf,source:SourceConfig,fetcher:WorldFetcher=None) -> dict:
     """
     function that will get the worlds/model data as specified in the matched worlds attribute in the provided world zarr group.
     Args:
         source:
         cat: initialised Cats object that contains all the source data available to download
         worlds:
+        fetcher: optional fetcher to get the worlds with, worlds are got concurrently by default
 
     Returns:
         dict: dictionary containing the locations of the downloaded model data zarr stores. The world zarr group is also
@@ -33,68 +53,129 @@ def get_worlds(cat: Cats, worlds:WorldsConf,source:SourceConfig) -> dict:
               valid for the specified sensors of the auv.
 
     """
-    zarr_stores = {}
-    for key, value in worlds.attributes.matched_worlds.items():
-        if source.source_type == SourceType.CMEMS:
-            zarr_store = __get_cmems_worlds(value=value,worlds=worlds)
-            zarr_stores[key] = zarr_store
-            worlds.worlds[key] = zarr.open(zarr_store, mode='r')
-        elif source.source_type == SourceType.MSM:
-            zarr_store = __get_msm_worlds(key=key, value=value, catalog=cat,worlds=worlds)
-            zarr_stores[key] = zarr_store
-            worlds.worlds[key] = zarr.open(zarr_store, mode='r')
-        elif source.source_type == SourceType.LOCAL:
-            zarr_stores[key] = value.local_dir + "/" + value.data_id
-            worlds.worlds[key] = xr.open_dataset(value.local_dir+"/"+value.data_id)
-        else:
-            logger.error(f"unknown model source {source.source_type}")
-            raise UnknownSourceKey
+    if fetcher is None:
+        fetcher = WorldFetcher()
+    zarr_stores = fetcher.fetch({key: partial(get_world, cat=cat, key=key, value=value,
+                                              extent=worlds.attributes.extent, source=source)
+                                 for key, value in worlds.attributes.matched_worlds.items()})
+    # keep the order of the matched worlds
+    zarr_stores = {key: zarr_stores[key] for key in worlds.attributes.matched_worlds.keys()}
+    for key in zarr_stores.keys():
+        worlds.worlds[key] = open_world(store=zarr_stores[key], source=source)
 
     return zarr_stores
 
-def __get_msm_worlds(key: str, value, catalog: Cats,worlds:WorldsConf) -> str:
+def get_world(cat: Cats, key: str, value: MatchedWorld, extent: WorldExtent, source: SourceConfig,
+              cache: WorldCacheIndex = None) -> str:
+    """
+    function that gets a single matched world for an extent, downloading it if it has not been cached
+    Args:
+        cat: initialised Cats object that contains all the source data available to download
+        key: catalog key of the matched world
+        value: matched world
+        extent: extent of the world to get
+        source: source of the world
+        cache: optional index of the world cache of the source, records cache hits and misses
+
+    Returns:
+        string that represents the location of the world data
+
+    """
+    if cache is None and source.source_type in CACHE_DIRS:
+        cache = WorldCacheIndex(cache_dir=CACHE_DIRS[source.source_type])
+    if source.source_type == SourceType.CMEMS:
+        return __get_cmems_worlds(value=value, extent=extent, index=cache)
+    elif source.source_type == SourceType.MSM:
+        return __get_msm_worlds(key=key, value=value, catalog=cat, extent=extent, index=cache)
+    elif source.source_type == SourceType.LOCAL:
+        return value.local_dir + "/" + value.data_id
+    else:
+        logger.error(f"unknown model source {source.source_type}")
+        raise UnknownSourceKey
+
+def open_world(store: str, source: SourceConfig):
+    """
+    function that opens a world that has been got
+    Args:
+        store: location of the world data
+        source: source of the world
+
+    Returns:
+        zarr group of the world, or xarray dataset for local worlds
+
+    """
+    if source.source_type == SourceType.LOCAL:
+        return xr.open_dataset(store)
+    return zarr.open(store, mode='r')
+
+def __get_msm_worlds(key: str, value, catalog: Cats,extent:WorldExtent,index:WorldCacheIndex) -> str:
     """
     Function that downloads the msm source model data that matches the required spatial and temporal extents and sensor
     specification of the auv.
     Args:
         key: model source
         value: object that contains the intake entry of the matched dataset
-        worlds:
+        extent: extent of the world to download
+        index: index of the msm world cache
 
     Returns:
-        string that represents the zarr store location of the downloaded data. The world zarr group is also updated with
-        the downloaded model data.
+        string that represents the zarr store location of the downloaded data.
     """
     # TODO add in a min depth parameter? or always assume its the surface?
-    zarr_f = (f"{value.data_id}_{worlds.attributes.extent.lon_max}_{worlds.attributes.extent.lon_min}_"
-              f"{worlds.attributes.extent.lat_max}_{worlds.attributes.extent.lat_min}_"
-              f"{worlds.attributes.extent.time_start}_{worlds.attributes.extent.time_end}.zarr")
-    zarr_d = "msm-data/"
+    variables = sorted(value.variable_alias.keys())
+    # only the variables of the matched world are downloaded, so they are part of the store name
+    variables_tag = hashlib.sha1("_".join(variables).encode()).hexdigest()[:8]
+    zarr_f = (f"{value.data_id}_{extent.lon_max}_{extent.lon_min}_"
+              f"{extent.lat_max}_{extent.lat_min}_{_depth_name(extent)}_"
+              f"{extent.time_start}_{extent.time_end}_{variables_tag}.zarr")
+    zarr_d = os.path.join(index.cache_dir, "")
     logger.info(f"getting msm world {zarr_f}")
-    if not os.path.isdir(zarr_d + zarr_f):
-        logger.info(f"{zarr_f} has not been cached, downloading now")
-        ds = catalog.msm_cat.open_dataset(id=key,
-                                  start_datetime=worlds.attributes.extent.time_start,
-                                  end_datetime=worlds.attributes.extent.time_end,
-                                  bbox=(worlds.attributes.extent.lon_min, worlds.attributes.extent.lat_min,
-                                        worlds.attributes.extent.lon_max,worlds.attributes.extent.lat_max),
-                                  )
-        ds.drop_encoding().to_zarr(store=zarr_d + zarr_f)
-        logger.success(f"{zarr_f} has been cached")
+    if store_complete(zarr_d + zarr_f, time_start=extent.time_start, time_end=extent.time_end):
+        index.record_hit(zarr_d + zarr_f)
+    else:
+        cached = index.find(data_id=value.data_id, extent=extent, variables=variables)
+        if cached is not None:
+            index.record_hit(cached)
+            return cached
+        with store_lock(zarr_d + zarr_f):
+            # another process may have downloaded the world while this one waited for the lock
+            if store_complete(zarr_d + zarr_f, time_start=extent.time_start, time_end=extent.time_end):
+                index.record_hit(zarr_d + zarr_f)
+                return zarr_d + zarr_f
+            index.record_miss()
+            logger.info(f"{zarr_f} has not been cached, downloading now")
+            ds = catalog.msm_datastore().open_dataset(id=key,
+                                      start_datetime=extent.time_start,
+                                      end_datetime=extent.time_end,
+                                      bbox=(extent.lon_min, extent.lat_min,
+                                            extent.lon_max,extent.lat_max),
+                                      )
+            # keep the matched variables and the variables describing the grid (those without a time dimension)
+            ds = ds[[var for var in ds.data_vars
+                     if var in variables or not set(TIME_DIMS) & set(ds[var].dims)]]
+            # only the depth levels the extent needs are downloaded, depths can be named t u or v depending on their grid.
+            # the slice leaves partial depth chunks, write_resumable rechunks them to the uniform chunks zarr needs
+            for depth_dim in [dim for dim in MSM_DEPTH_DIMS if dim in ds.indexes]:
+                ds = ds.sel({depth_dim: slice(extent.depth_min, extent.depth_max)})
+            # written slab by slab so a failed (and retried) download resumes from the slabs that are missing
+            write_resumable(ds=ds.drop_encoding(), store=zarr_d + zarr_f)
+            index.add(data_id=value.data_id, path=zarr_d + zarr_f, extent=extent,
+                      variables=list(ds.data_vars), all_variables=False)
+            logger.success(f"{zarr_f} has been cached")
     return zarr_d + zarr_f
 
 
-def __get_cmems_worlds(value,worlds:WorldsConf) -> str:
+def __get_cmems_worlds(value,extent:WorldExtent,index:WorldCacheIndex) -> str:
     """
     function that downloads model data from CMEMS, data must match the temporal and spatial extents of the auv, and also
     have the required variables to match the sensor arrays of the auv.
     Args:
         value: object that contains the intake entry of the matched dataset
-        worlds:
+        extent: extent of the world to download
+        index: index of the cmems world cache
 
     Returns:
-        string that represents the zarr store location of the downloaded data. The world zarr group is also updated with
-        the downloaded model data.
+        string that represents the zarr store location of the downloaded data.
 
     """
     # vars2 = []
@@ -102,29 +183,50 @@ def __get_cmems_worlds(value,worlds:WorldsConf) -> str:
     # for k2, v2 in value.items():
     #     vars2.append(v2)
 
-    zarr_f = (f"{value.data_id}_{worlds.attributes.extent.lon_max}_{worlds.attributes.extent.lon_min}_"
-              f"{worlds.attributes.extent.lat_max}_{worlds.attributes.extent.lat_min}_"
-              f"{worlds.attributes.extent.depth_max}_{worlds.attributes.extent.time_start}_"
-              f"{worlds.attributes.extent.time_end}.zarr")
-    zarr_d = "copernicus-data/"
+    zarr_f = (f"{value.data_id}_{extent.lon_max}_{extent.lon_min}_"
+              f"{extent.lat_max}_{extent.lat_min}_"
+              f"{_depth_name(extent)}_{extent.time_start}_"
+              f"{extent.time_end}.zarr")
+    zarr_d = os.path.join(index.cache_dir, "")
     logger.info(f"getting cmems world {zarr_f}")
-    if not os.path.isdir(zarr_d + zarr_f):
-        logger.info(f"{zarr_f} has not been cached, downloading now")
-        copernicusmarine.subset(
-            dataset_id=value.data_id,
-            variables=list(value.variable_alias.keys()),
-            minimum_longitude=float(worlds.attributes.extent.lon_min),
-            maximum_longitude=float(worlds.attributes.extent.lon_max),
-            minimum_latitude=float(worlds.attributes.extent.lat_min),
-            maximum_latitude=float(worlds.attributes.extent.lat_max),
-            start_datetime=str(worlds.attributes.extent.time_start),
-            end_datetime=str(worlds.attributes.extent.time_end),
-            minimum_depth=0,
-            maximum_depth=float(worlds.attributes.extent.depth_max),
-            output_filename=zarr_f,
-            output_directory=zarr_d,
-            file_format="zarr",
-            force_download=True
-        )
-        logger.success(f"{zarr_f} has been cached")
-    return zarr_d + zarr_f
\ No newline at end of file
+    if store_complete(zarr_d + zarr_f, time_start=extent.time_start, time_end=extent.time_end):
+        index.record_hit(zarr_d + zarr_f)
+    else:
+        cached = index.find(data_id=value.data_id, extent=extent, variables=list(value.variable_alias.keys()))
+        if cached is not None:
+            index.record_hit(cached)
+            return cached
+        with store_lock(zarr_d + zarr_f):
+            # another process may have downloaded the world while this one waited for the lock
+            if store_complete(zarr_d + zarr_f, time_start=extent.time_start, time_end=extent.time_end):
+                index.record_hit(zarr_d + zarr_f)
+                return zarr_d + zarr_f
+            index.record_miss()
+            logger.info(f"{zarr_f} has not been cached, downloading now")
+            ds = copernicusmarine.open_dataset(
+                dataset_id=value.data_id,
+                variables=list(value.variable_alias.keys()),
+                minimum_longitude=float(extent.lon_min),
+                maximum_longitude=float(extent.lon_max),
+                minimum_latitude=float(extent.lat_min),
+                maximum_latitude=float(extent.lat_max),
+                start_datetime=str(extent.time_start),
+                end_datetime=str(extent.time_end),
+                minimum_depth=float(extent.depth_min),
+                maximum_depth=float(extent.depth_max),
+            )
+            # written slab by slab so a failed (and retried) download resumes from the slabs that are missing
+            write_resumable(ds=ds.drop_encoding(), store=zarr_d + zarr_f)
+            index.add(data_id=value.data_id, path=zarr_d + zarr_f, extent=extent,
+                      variables=list(value.variable_alias.keys()), all_variables=False)
+            logger.success(f"{zarr_f} has been cached")
+    return zarr_d + zarr_f
+
+
+def _depth_name(extent: WorldExtent) -> str:
+    """
+    depth range part of the name of a store, worlds from the surface are named by their maximum depth only
+    """
+    if extent.depth_min == 0:
+        return f"{extent.depth_max}"
+    return f"{extent.depth_min}-{extent.depth_max}"
@@ -10,8 +10,14 @@
 # limitations under the License.
 
 import os
-import pickle
+import hashlib
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from enum import Enum
 from dataclasses import dataclass,field
+from functools import partial
+from typing import Callable
 import zarr
 import numpy as np
 import xarray as xr
@@ -19,30 +25,279 @@ import pyinterp
 import pyinterp.backends.xarray
 from loguru import logger
 import xesmf as xe
-import blosc
+from mamma_mia.chunked import ChunkedGrid4D
+from mamma_mia.curvilinear import CurvilinearGrid4D
 from mamma_mia.exceptions import UnknownSourceKey
 from mamma_mia.find_worlds import SourceType
-from mamma_mia.worlds import WorldsConf
+from mamma_mia.interpolator_cache import InterpolatorCache, TMP_MARKER
+from mamma_mia.interpolator_registry import InterpolatorRegistry
+from mamma_mia.stencil import Stencil, grid_signature
+from mamma_mia.worlds import WorldsConf, MatchedWorld, WorldExtent, Precision
+from attrs import asdict
+
+# method used to regrid curvilinear worlds on to regular grids
+REGRID_METHOD = "bilinear"
+# sub directory of the interpolator cache that regrid weights are stored in
+WEIGHTS_DIR = "weights"
+# number of grid cells kept around the flight when worlds are subset
+SUBSET_HALO = 2
+# a variable can be held up to three times while it is built (source, regridded copy and grid) which is used to
+# estimate how much memory a build task needs
+BUILD_MEMORY_FACTOR = 3
+# worker processes are spawned rather than forked, a forked worker can deadlock on the io thread zarr starts in the
+# parent when the worlds are opened
+PROCESS_CONTEXT = "spawn"
+
+
+def bracket(values: np.ndarray, low, high, halo: int = 0) -> slice:
+    """
+    finds the slice of a monotonically increasing coordinate that brackets a range, i.e. it includes the value at or
+    before the low end and at or after the high end of the range.
+
+    Args:
+        values: 1D monotonically increasing coordinate values
+        low: low end of the range
+        high: high end of the range
+        halo: number of extra values to include either side
+
+    Returns:
+        slice of the coordinate, always at least two values long if the coordinate allows it
+
+    """
+    start = max(int(np.searchsorted(values, low, side='right')) - 1 - halo, 0)
+    end = min(int(np.searchsorted(values, high, side='left')) + halo, values.size - 1)
+    # interpolation needs at least two values along each axis
+    if end - start < 1:
+        if end < values.size - 1:
+            end += 1
+        else:
+            start = max(start - 1, 0)
+    return slice(start, end + 1)
+
+
+def subset_curvilinear(ds: xr.Dataset, lat: str, lon: str, flight_extent: WorldExtent,
+                       halo: int = SUBSET_HALO) -> xr.Dataset:
+    """
+    Subsets a world on a curvilinear grid to the x/y index box, depth levels and time steps that bracket a flight
+
+    Args:
+        ds: world dataset with x and y dimensions and depth and time coordinates
+        lat: name of 2D latitude variable
+        lon: name of 2D longitude variable
+        flight_extent: extent of the flight
+        halo: number of grid cells to keep around the flight
+
+    Returns:
+        subset of the world
+
+    """
+    lat_values = ds[lat].values
+    lon_values = ds[lon].values
+    inside = ((lat_values >= flight_extent.lat_min) & (lat_values <= flight_extent.lat_max) &
+              (lon_values >= flight_extent.lon_min) & (lon_values <= flight_extent.lon_max))
+    y_dim, x_dim = ds[lat].dims
+    if inside.any():
+        y_index, x_index = np.nonzero(inside)
+    else:
+        # flight is smaller than a grid cell so use the cell closest to its centre
+        distance = ((lat_values - (flight_extent.lat_min + flight_extent.lat_max) / 2) ** 2 +
+                    (lon_values - (flight_extent.lon_min + flight_extent.lon_max) / 2) ** 2)
+        y_index, x_index = np.unravel_index(np.nanargmin(distance), distance.shape)
+    subset = {y_dim: bracket(np.arange(ds.sizes[y_dim]), np.min(y_index), np.max(y_index), halo=halo),
+              x_dim: bracket(np.arange(ds.sizes[x_dim]), np.min(x_index), np.max(x_index), halo=halo)}
+    subset.update(_bracket_depth_time(ds=ds, flight_extent=flight_extent))
+    ds = ds.isel(subset)
+    logger.info(f"subset world to flight: {dict(ds.sizes)}")
+    return ds
+
+
+def subset_rectilinear(data_array: xr.DataArray, flight_extent: WorldExtent,
+                       halo: int = SUBSET_HALO) -> xr.DataArray:
+    """
+    Subsets a world variable on a regular grid to the grid cells, depth levels and time steps that bracket a flight
+
+    Args:
+        data_array: world variable with 1D latitude, longitude, depth and time coordinates
+        flight_extent: extent of the flight
+        halo: number of grid cells to keep around the flight
+
+    Returns:
+        subset of the world variable
+
+    """
+    subset = {}
+    for dim, low, high in [("latitude", flight_extent.lat_min, flight_extent.lat_max),
+                           ("longitude", flight_extent.lon_min, flight_extent.lon_max)]:
+        if dim in data_array.dims and _increasing(data_array[dim].values):
+            subset[dim] = bracket(data_array[dim].values, low, high, halo=halo)
+    subset.update(_bracket_depth_time(ds=data_array, flight_extent=flight_extent))
+    data_array = data_array.isel(subset)
+    logger.info(f"subset world to flight: {dict(data_array.sizes)}")
+    return data_array
+
+
+def _bracket_depth_time(ds: xr.Dataset | xr.DataArray, flight_extent: WorldExtent) -> dict[str, slice]:
+    subset = {}
+    if "depth" in ds.dims and _increasing(ds["depth"].values):
+        subset["depth"] = bracket(ds["depth"].values, flight_extent.depth_min, flight_extent.depth_max)
+    if "time" in ds.dims and _increasing(ds["time"].values):
+        subset["time"] = bracket(ds["time"].values,
+                                 np.datetime64(flight_extent.time_start),
+                                 np.datetime64(flight_extent.time_end))
+    return subset
+
+
+def _increasing(values: np.ndarray) -> bool:
+    return values.ndim == 1 and values.size > 1 and bool(np.all(values[1:] > values[:-1]))
+
+
+class InterpolatorEngine(Enum):
+    """
+    Interpolator engine enumeration: this determines how worlds are interpolated. Regrid converts worlds on curvilinear
+    grids (MSM and LOCAL sources) on to a regular grid and loads every world into a pyinterp grid, curvilinear
+    interpolates curvilinear worlds directly and chunked keeps regular (CMEMS) worlds out of core, only loading the
+    chunks a flight passes through.
+    """
+    REGRID = "regrid"
+    CURVILINEAR = "curvilinear"
+    CHUNKED = "chunked"
+    @classmethod
+    def from_string(cls,enum_string:str) -> "InterpolatorEngine":
+        match enum_string:
+            case "regrid" | "REGRID":
+                return InterpolatorEngine.REGRID
+            case "curvilinear" | "CURVILINEAR":
+                return InterpolatorEngine.CURVILINEAR
+            case "chunked" | "CHUNKED":
+                return InterpolatorEngine.CHUNKED
+            case _:
+                raise ValueError(f"unknown interpolator engine {enum_string}")
+
+
+@dataclass
+class LazyInterpolator:
+    """
+    Proxy for an interpolator that is only built the first time it is queried. It exposes the same quadrivariate
+    method as a pyinterp Grid4D so missions and realities can use it interchangeably with an eagerly built one.
+
+    Args:
+        key: parameter key the interpolator is built for
+        loader: callable that builds and returns the interpolator, or None if it cannot be built
+        on_load: optional callable that is passed the interpolator every time it is queried, before and after the query
+    """
+    key: str
+    loader: Callable
+    grid: object = None
+    unavailable: bool = False
+    on_load: Callable | None = None
+
+    @property
+    def loaded(self) -> bool:
+        return self.grid is not None
+
+    def load(self):
+        """
+        builds the interpolator if it has not been built yet
+
+        Returns:
+            the built interpolator
+
+        Raises:
+            KeyError: if the interpolator could not be built from its world
+        """
+        if self.grid is None and not self.unavailable:
+            logger.info(f"building interpolator {self.key} on first use")
+            self.grid = self.loader()
+            if self.grid is None:
+                self.unavailable = True
+        if self.unavailable:
+            raise KeyError(self.key)
+        grid = self.grid
+        if self.on_load is not None:
+            self.on_load(grid)
+        return grid
+
+    def unload(self) -> None:
+        """
+        drops the built interpolator, it is built again the next time it is queried
+        """
+        self.grid = None
+
+    def quadrivariate(self, coords: dict, *args, **kwargs) -> np.ndarray:
+        grid = self.load()
+        values = grid.quadrivariate(coords, *args, **kwargs)
+        if self.on_load is not None:
+            # interpolators that load data as they are queried (i.e. the tiles of a chunked interpolator) have grown
+            self.on_load(grid)
+        return values
 
 
 @dataclass
 class Interpolators:
     interpolator: dict = field(default_factory=dict)
     cache: bool = False
+    lazy: bool = False
+    engine: InterpolatorEngine = InterpolatorEngine.REGRID
+    precision: Precision = Precision.FLOAT64
+    interpolator_cache: InterpolatorCache = field(default_factory=InterpolatorCache)
+    regridders: dict = field(default_factory=dict)
+    grids: dict = field(default_factory=dict)
+    owners: dict = field(default_factory=dict)
+    aliases: dict = field(default_factory=dict)
+    registry: InterpolatorRegistry | None = None
+    max_workers: int = 1
+    max_memory: int | None = None
+    use_processes: bool = False
+    regrid_lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def __getstate__(self) -> dict:
+        # worker processes only need the build settings, not built interpolators, regridders or locks
+        state = self.__dict__.copy()
+        state["interpolator"] = {}
+        state["regridders"] = {}
+        state["grids"] = {}
+        state["owners"] = {}
+        state["aliases"] = {}
+        state["registry"] = None
+        del state["regrid_lock"]
+        return state
 
-    def build(self,worlds:WorldsConf,mission:str,source_type:SourceType) -> ():
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self.regrid_lock = threading.Lock()
+
+    def build_settings(self) -> tuple:
+        """
+        Settings that change how interpolators are built and managed, interpolators are only built once for several
+        missions if they have the same settings
+
+        Returns:
+            hashable tuple of the settings
         """
-        Creates a 4D interpolator for each sensor that allows a world to be interpolated on to a trajectory
+        return (self.engine, self.precision, self.lazy, self.max_workers, self.max_memory, self.use_processes,
+                id(self.interpolator_cache) if self.cache else None,
+                None if self.registry is None else id(self.registry))
+
+    def build(self,worlds:WorldsConf,mission:str,source_type:SourceType,flight_extent:WorldExtent=None) -> ():
+        """
+        Creates a 4D interpolator for each sensor that allows a world to be interpolated on to a trajectory. If lazy is
+        set the interpolators are registered as proxies and only built when they are first queried, if a registry is
+        also set it is notified of every query so it can unload them again to stay within its memory budget. If max
+        workers is more than one each variable is built as an independent task on a thread (or process) pool, tasks
+        are only started while their estimated memory use fits within max memory.
 
         Args:
             source_type:
             mission:
             worlds (zarr.Group): a zarr group containing all the world data that has been downloaded
+            flight_extent: optional extent of the flight, if provided worlds are subset to the grid cells, depth levels
+                           and time steps that bracket it before interpolators are built
 
         Returns:
             void: Interpolator object has been populated with interpolators for each variable in the world group
 
         """
+        tasks = []
         # for every dataset
         for key in worlds.worlds.keys():
             logger.info(f"building worlds for dataset {key}")
@@ -51,149 +306,469 @@ class Interpolators:
                 # for each item in matched dictionary
                 world_attrs = worlds.attributes.matched_worlds[key]
                 if var in world_attrs.variable_alias.keys():
-                    logger.info(f"building world for variable {var}")
-                    if self.cache:
-                        logger.info(f"getting world for variable {var} for source {world_attrs['source']} from cache")
-                        imported = self.import_interp(key=world_attrs.variable_alias[var],
-                                                      source_type=source_type,
-                                                      mission=mission
-                                                      )
-                    else:
-                        imported = False
-                    if not imported:
-                        if source_type == SourceType.MSM:
-                            ds = xr.open_zarr(store=worlds.stores[key])
-                            # check that dimensions of lat and lon are at least larger than 1 as 1 degree models on glider scale deployments
-                            # are often too low a resolution to have multiple grid cells in the mission extent.
-                            if ds['nav_lat'].sizes['x'] == 1:
-                                logger.warning("dataset latitude dimension length = 1, cannot interpolate, likely too low resolution")
-                                continue
-                            if ds['nav_lon'].sizes['x'] == 1:
-                                logger.warning("dataset longitude dimension length = 1, cannot interpolate, likely too low resolution")
-                                continue
-                            if ds['time_counter'].sizes['time_counter'] <= 1:
-                                logger.warning("dataset time dimension length = 1, cannot interpolate, likely too low resolution")
-                                continue
-                            # rename time and depth dimensions to be consistent
-                            # depths can be named t u or v depending on their grid
-                            try:
-                                ds = ds.rename({"deptht": "depth", "time_counter": "time","nav_lon":"lon", "nav_lat":"lat"})
-                            except ValueError:
-                                try:
-                                    ds = ds.rename({"depthu": "depth", "time_counter": "time","nav_lon":"lon", "nav_lat":"lat"})
-                                except ValueError:
-                                    ds = ds.rename({"depthv": "depth", "time_counter": "time","nav_lon":"lon", "nav_lat":"lat"})
-                            lat = ds['lat']
-                            lon = ds['lon']
-
-                            # reduce arrays to get max and min values
-                            latmin = lat.reduce(np.min,dim=['x','y']).values
-                            latmax = lat.reduce(np.max,dim=['x','y']).values
-                            lonmin = lon.reduce(np.min,dim=['x','y']).values
-                            lonmax = lon.reduce(np.max,dim=['x','y']).values
-                            # Define a regular grid with 1D lat/lon arrays
-                            target_lat = np.linspace(latmin, latmax, lat.sizes['y'])
-                            target_lon = np.linspace(lonmin, lonmax, lon.sizes['x'])
-                            # Create a target grid dataset
-                            target_grid = xr.Dataset({
-                                'latitude': (['latitude'], target_lat),
-                                'longitude': (['longitude'], target_lon)
-                            })
-                            # Example: regrid only data variables that depend on lat/lon
-                            data_vars = [v for v in ds.data_vars if {'x', 'y'} <= set(ds[v].dims)]
-                            # Loop and regrid each variable
-                            ds_regridded = xr.Dataset()
-                            for var2 in data_vars:
-                                if 'time' in var2:
-                                    continue
-                                regridder = xe.Regridder(ds[var2], target_grid, method='bilinear',
-                                                         ignore_degenerate=True)
-                                ds_regridded[var2] = regridder(ds[var2])
-                            ds_regridded = ds_regridded.assign_coords(time=ds.time)
-
-                            # # Create a regridder object to go from curvilinear to regular grid
-                            # regridder = xe.Regridder(ds, target_grid, method='bilinear',ignore_degenerate=True)
-                            # # Regrid the entire dataset
-                            # ds_regridded = regridder(ds)
-                            # Add units to latitude and longitude coordinates
-                            ds_regridded['latitude'].attrs['units'] = 'degrees_north'
-                            ds_regridded['longitude'].attrs['units'] = 'degrees_east'
-                            # Convert all float32 variables in the dataset to float64
-                            ds_regridded = ds_regridded.astype('float64')
-                            ds_regridded['time'] = ds_regridded['time'].astype('datetime64[ns]')
-                            try:
-                                self.interpolator[world_attrs.variable_alias[var]] = pyinterp.backends.xarray.Grid4D(ds_regridded[var], geodetic=True)
-                            except KeyError:
-                                logger.warning(f"key {var} not found in world attributes variable aliases")
-                                continue
-                            if self.cache:
-                                self.export_interp(key=world_attrs["variable_alias"][var],source_type=source_type,mission=mission)
-                        elif source_type == SourceType.CMEMS:
-                            world = xr.open_zarr(store=worlds.stores[key])
-                            self.interpolator[world_attrs.variable_alias[var]] = pyinterp.backends.xarray.Grid4D(world[var],geodetic=True)
-                            if self.cache:
-                                self.export_interp(key=world_attrs["variable_alias"][var],source_type=source_type,mission=mission)
-                        elif source_type == SourceType.LOCAL:
-                            ds = xr.open_dataset(worlds.stores[key])
-                            # rename time and depth dimensions to be consistent
-                            ds = ds.rename({"deptht": "depth", "time_counter": "time"})
-                            lat = ds['nav_lat']
-                            lon = ds['nav_lon']
-                            # Define a regular grid with 1D lat/lon arrays
-                            # reduce arrays to get max and min values
-                            latmin = lat.reduce(np.min,dim=['x','y']).values
-                            latmax = lat.reduce(np.max,dim=['x','y']).values
-                            lonmin = lon.reduce(np.min,dim=['x','y']).values
-                            lonmax = lon.reduce(np.max,dim=['x','y']).values
-                            # Define a regular grid with 1D lat/lon arrays
-                            target_lat = np.linspace(latmin, latmax, lat.sizes['y'])
-                            target_lon = np.linspace(lonmin, lonmax, lon.sizes['x'])
-                            # Create a target grid dataset
-                            target_grid = xr.Dataset({
-                                 'latitude': (['latitude'], target_lat),
-                                 'longitude': (['longitude'], target_lon)
-                             })
-                            # Create a regridder object to go from curvilinear to regular grid
-                            regridder = xe.Regridder(ds, target_grid, method='bilinear',ignore_degenerate=True)
-                            # Regrid the entire dataset
-                            ds_regridded = regridder(ds)
-                            # Add units to latitude and longitude coordinates
-                            ds_regridded['latitude'].attrs['units'] = 'degrees_north'
-                            ds_regridded['longitude'].attrs['units'] = 'degrees_east'
-                            # Convert all float32 variables in the dataset to float64
-                            ds_regridded = ds_regridded.astype('float64')
-                            ds_regridded['time'] = ds_regridded['time'].astype('datetime64[ns]')
-                            self.interpolator[world_attrs.variable_alias[var]] = pyinterp.backends.xarray.Grid4D(ds_regridded[var],geodetic=True)
-                            if self.cache:
-                                self.export_interp(key=world_attrs["variable_alias"][var],source_type=source_type,mission=mission)
-                        else:
-                            logger.error(f"unknown model source {source_type.name}")
-                            raise UnknownSourceKey
-
-                        logger.info(f"built {var} from source {source_type.name} into interpolator: {world_attrs.variable_alias[var]}")
+                    alias = world_attrs.variable_alias[var]
+                    if self.lazy:
+                        logger.info(f"deferring build of {var} from source {source_type.name} into interpolator: {alias}")
+                        self.interpolator[alias] = LazyInterpolator(key=alias,
+                                                                    loader=partial(self.build_variable,
+                                                                                   store=worlds.stores[key],
+                                                                                   var=var,
+                                                                                   world_attrs=world_attrs,
+                                                                                   extent=worlds.attributes.extent,
+                                                                                   flight_extent=flight_extent,
+                                                                                   mission=mission,
+                                                                                   source_type=source_type),
+                                                                    on_load=None if self.registry is None else
+                                                                    partial(self.registry.loaded,
+                                                                            interpolators=self,
+                                                                            mission=mission,
+                                                                            key=alias,
+                                                                            world=world_attrs.data_id))
+                        continue
+                    tasks.append({"store": worlds.stores[key],
+                                  "var": var,
+                                  "world_attrs": world_attrs,
+                                  "extent": worlds.attributes.extent,
+                                  "flight_extent": flight_extent,
+                                  "mission": mission,
+                                  "source_type": source_type})
+        if self.max_workers > 1 and len(tasks) > 1:
+            self.__build_parallel(tasks=tasks)
+        else:
+            for task in tasks:
+                logger.info(f"building world for variable {task['var']}")
+                grid = self.build_variable(**task)
+                if grid is not None:
+                    self.interpolator[task['world_attrs'].variable_alias[task['var']]] = grid
+        if self.cache:
+            stats = self.interpolator_cache.stats()
+            logger.info(f"interpolator cache hits: {stats['hits']} misses: {stats['misses']} size: {stats['size']} bytes")
         logger.info("interpolators built successfully")
 
-    def import_interp(self,key:str,source_type:SourceType,mission:str):
-        if not os.path.isdir(f"interpolator_cache/{mission}"):
-            return False
-        import_loc = f"interpolator_cache/{mission}/{source_type.value}_{key}.lerp"
-        if os.path.exists(import_loc):
-            with open(import_loc, 'rb') as f:
-                compressed_pickle = f.read()
-            depressed_pickle = blosc.decompress(compressed_pickle)
-            self.interpolator[key] = pickle.loads(depressed_pickle)
-            logger.info(f"imported interpolator for {key} from source {source_type.name} for {mission}")
-            return True
+    def __build_parallel(self, tasks: list[dict]) -> None:
+        """
+        builds the interpolator of each task on a pool of workers, keeping the estimated memory of the running tasks
+        within max memory. At least one task always runs so a task larger than the budget is still built.
+        """
+        if self.use_processes:
+            pool = partial(ProcessPoolExecutor, mp_context=multiprocessing.get_context(PROCESS_CONTEXT))
         else:
-            logger.info(f"interpolator {key} not found for source {source_type.name} for {mission}")
-            return False
-
-    def export_interp(self,key:str,source_type:SourceType,mission:str):
-        if not os.path.isdir(f"interpolator_cache/{mission}"):
-            os.mkdir(f"interpolator_cache")
-            os.mkdir(f"interpolator_cache/{mission}")
-        pickled_data = pickle.dumps(self.interpolator[key])
-        compressed_pickle = blosc.compress(pickled_data)
-        with open(f"interpolator_cache/{mission}/{source_type.value}_{key}.lerp", 'wb') as f:
-            f.write(compressed_pickle)
-        logger.info(f"exported interpolator {key} for source {source_type.name} for {mission}")
+            pool = ThreadPoolExecutor
+        logger.info(f"building {len(tasks)} interpolators on {self.max_workers} {'processes' if self.use_processes else 'threads'}")
+        pending = [(task, self.__estimate_memory(store=task["store"], var=task["var"], source_type=task["source_type"]))
+                   for task in tasks]
+        running = {}
+        in_use = 0
+        with pool(max_workers=self.max_workers) as executor:
+            while pending or running:
+                while pending and len(running) < self.max_workers:
+                    task, estimate = pending[0]
+                    if running and self.max_memory is not None and in_use + estimate > self.max_memory:
+                        break
+                    pending.pop(0)
+                    logger.info(f"building world for variable {task['var']}")
+                    load = self.load_variable_in_worker if self.use_processes else self.load_variable
+                    running[executor.submit(load, **task)] = (task, estimate)
+                    in_use += estimate
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    task, estimate = running.pop(future)
+                    in_use -= estimate
+                    data = future.result()
+                    if self.use_processes:
+                        data = self.__from_worker(result=data, task=task)
+                    grid = self.__grid(data=data, var=task["var"], world_attrs=task["world_attrs"],
+                                       source_type=task["source_type"])
+                    if grid is not None:
+                        self.interpolator[task["world_attrs"].variable_alias[task["var"]]] = grid
+
+    def __from_worker(self, result: tuple, task: dict):
+        """
+        adds the cache hits and misses of a worker process to the cache stats and memory maps the variable it loaded if
+        it is in the cache, so the grid uses the shared page cached copy
+        """
+        data, cache_key, hits, misses = result
+        self.interpolator_cache.record(hits=hits, misses=misses)
+        if cache_key is None:
+            return data
+        data = self.interpolator_cache.open(key=cache_key)
+        if data is None:
+            # evicted between the worker caching it and now, it is loaded again here
+            logger.warning(f"interpolator {cache_key} was evicted before it was used, loading it again")
+            data = self.load_variable(**task)
+        return data
+
+    @staticmethod
+    def __estimate_memory(store: str, var: str, source_type: SourceType) -> int:
+        """
+        estimates the memory needed to build the interpolator of a variable from its size in the world store
+        """
+        try:
+            if source_type == SourceType.LOCAL:
+                ds = xr.open_dataset(store)
+            else:
+                ds = xr.open_zarr(store=store)
+            return int(ds[var].nbytes) * BUILD_MEMORY_FACTOR
+        except (KeyError, OSError, ValueError):
+            return 0
+
+    def quadrivariate_many(self, keys: list[str], coords: dict) -> dict[str, np.ndarray]:
+        """
+        Interpolates several variables on to the same set of points. Variables on the same regular grid share a single
+        stencil, so the cell lookup and weights are computed once per grid rather than once per variable, any other
+        interpolators are queried one by one.
+
+        Args:
+            keys: interpolator keys of the variables
+            coords: dictionary of longitude, latitude, depth and time arrays
+
+        Returns:
+            dictionary of key and interpolated values, keys without an interpolator are left out
+
+        """
+        tracks = {}
+        shared = {}
+        for key in keys:
+            if key not in self.interpolator:
+                continue
+            if isinstance(self.interpolator[key], LazyInterpolator):
+                try:
+                    self.interpolator[key].load()
+                except KeyError:
+                    continue
+            # interpolators shared from another mission keep their grids with the Interpolators that built them, under
+            # the key they were built for
+            owner = self.owners.get(key, self)
+            built_key = self.aliases.get(key, key)
+            if built_key in owner.grids:
+                # hold on to the data array in case a registry unloads the interpolator before it is used
+                signature, data_array = owner.grids[built_key]
+                shared.setdefault(signature, []).append((key, data_array))
+            else:
+                tracks[key] = self.interpolator[key].quadrivariate(coords)
+        for signature, grid_arrays in shared.items():
+            logger.info(f"interpolating {len(grid_arrays)} variables with a shared stencil: {[key for key, _ in grid_arrays]}")
+            stencil = Stencil.from_grid(data_array=grid_arrays[0][1], coords=coords)
+            for key, data_array in grid_arrays:
+                tracks[key] = stencil.apply(values=data_array.values)
+        return tracks
+
+    def share(self, builder: "Interpolators", keys: dict[str, str]) -> None:
+        """
+        Takes interpolators that have been built once for several missions. Missions can map the same variable to
+        different parameters, the interpolator of the variable is then built once and taken under each of their keys.
+
+        Args:
+            builder: Interpolators object the interpolators were built by
+            keys: interpolator keys to take, each mapped to the key the builder built it under
+
+        """
+        for key, built_key in keys.items():
+            if built_key in builder.interpolator:
+                self.interpolator[key] = builder.interpolator[built_key]
+                self.owners[key] = builder
+                if built_key != key:
+                    self.aliases[key] = built_key
+
+    def unload(self, key: str) -> None:
+        """
+        Unloads a lazily built interpolator, it is rebuilt (or reloaded from cache) the next time it is queried
+
+        Args:
+            key: interpolator key
+
+        """
+        if isinstance(self.interpolator.get(key), LazyInterpolator):
+            self.interpolator[key].unload()
+        # interpolators shared from another mission keep their grids with the Interpolators that built them
+        self.owners.get(key, self).grids.pop(self.aliases.get(key, key), None)
+
+    def build_variable(self, store: str, var: str, world_attrs: MatchedWorld, extent: WorldExtent, mission: str,
+                       source_type: SourceType, flight_extent: WorldExtent = None):
+        """
+        Builds (or imports from cache) the 4D interpolator for a single variable of a world
+
+        Args:
+            store: location of the downloaded world
+            var: variable name within the world
+            world_attrs: matched world the variable belongs to
+            extent: extent of the downloaded world
+            flight_extent: optional extent of the flight to subset the world to
+            mission: name of mission the interpolator is for
+            source_type: source of the world
+
+        Returns:
+            pyinterp Grid4D interpolator (or CurvilinearGrid4D / ChunkedGrid4D if the curvilinear / chunked engine is
+            selected for a world it applies to) or None if the world cannot be interpolated
+
+        """
+        data = self.load_variable(store=store, var=var, world_attrs=world_attrs, extent=extent, mission=mission,
+                                  source_type=source_type, flight_extent=flight_extent)
+        return self.__grid(data=data, var=var, world_attrs=world_attrs, source_type=source_type)
+
+    def __grid(self, data: xr.DataArray | CurvilinearGrid4D | ChunkedGrid4D | None, var: str,
+               world_attrs: MatchedWorld, source_type: SourceType):
+        """
+        creates the pyinterp grid of a loaded variable, curvilinear and chunked interpolators are already complete. The
+        variable is also registered by its grid so it can share interpolation stencils with the other variables on it.
+        """
+        if data is None or isinstance(data, (CurvilinearGrid4D, ChunkedGrid4D)):
+            return data
+        grid = pyinterp.backends.xarray.Grid4D(data, geodetic=True)
+        self.grids[world_attrs.variable_alias[var]] = (grid_signature(data_array=data), data)
+        logger.info(f"built {var} from source {source_type.name} into interpolator: {world_attrs.variable_alias[var]}")
+        return grid
+
+    def load_variable(self, store: str, var: str, world_attrs: MatchedWorld, extent: WorldExtent, mission: str,
+                      source_type: SourceType, flight_extent: WorldExtent = None):
+        """
+        Loads (or imports from cache) the world variable an interpolator is built from, this is the expensive part of a
+        build (open, subset and regrid) and is run on the workers of a parallel build
+
+        Args:
+            store: location of the downloaded world
+            var: variable name within the world
+            world_attrs: matched world the variable belongs to
+            extent: extent of the downloaded world
+            flight_extent: optional extent of the flight to subset the world to
+            mission: name of mission the interpolator is for
+            source_type: source of the world
+
+        Returns:
+            data array on regular 1D axes (or CurvilinearGrid4D / ChunkedGrid4D if the curvilinear / chunked engine is
+            selected for a world it applies to) or None if the world cannot be interpolated
+
+        """
+        key = world_attrs.variable_alias[var]
+        curvilinear = self.engine == InterpolatorEngine.CURVILINEAR and source_type in [SourceType.MSM, SourceType.LOCAL]
+        chunked = self.engine == InterpolatorEngine.CHUNKED and source_type == SourceType.CMEMS
+        cache_key = None
+        # the interpolator cache holds in memory grids, curvilinear interpolators only persist their spatial trees and
+        # chunked interpolators read directly from the world store
+        if self.cache and not curvilinear and not chunked:
+            logger.info(f"getting world for variable {var} for source {source_type.name} from cache for {mission}")
+            cache_key = self.__cache_key(var=var, world_attrs=world_attrs, extent=extent, source_type=source_type,
+                                         flight_extent=flight_extent)
+            data_array = self.interpolator_cache.get(key=cache_key)
+            if data_array is not None:
+                return data_array
+        # worlds can be served from a larger cached store, so they are always sliced to the extent that is needed
+        subset_extent = extent if flight_extent is None else flight_extent
+        if source_type == SourceType.MSM:
+            ds = xr.open_zarr(store=store)
+            # check that dimensions of lat and lon are at least larger than 1 as 1 degree models on glider scale deployments
+            # are often too low a resolution to have multiple grid cells in the mission extent.
+            if ds['nav_lat'].sizes['x'] == 1:
+                logger.warning("dataset latitude dimension length = 1, cannot interpolate, likely too low resolution")
+                return None
+            if ds['nav_lon'].sizes['x'] == 1:
+                logger.warning("dataset longitude dimension length = 1, cannot interpolate, likely too low resolution")
+                return None
+            if ds['time_counter'].sizes['time_counter'] <= 1:
+                logger.warning("dataset time dimension length = 1, cannot interpolate, likely too low resolution")
+                return None
+            # rename time and depth dimensions to be consistent
+            # depths can be named t u or v depending on their grid
+            try:
+                ds = ds.rename({"deptht": "depth", "time_counter": "time","nav_lon":"lon", "nav_lat":"lat"})
+            except ValueError:
+                try:
+                    ds = ds.rename({"depthu": "depth", "time_counter": "time","nav_lon":"lon", "nav_lat":"lat"})
+                except ValueError:
+                    ds = ds.rename({"depthv": "depth", "time_counter": "time","nav_lon":"lon", "nav_lat":"lat"})
+            if var not in ds.data_vars or not {'x', 'y'} <= set(ds[var].dims):
+                logger.warning(f"key {var} not found in world attributes variable aliases")
+                return None
+            ds = subset_curvilinear(ds=ds, lat="lat", lon="lon", flight_extent=subset_extent)
+            if curvilinear:
+                return self.__curvilinear(ds=ds, var=var, lat="lat", lon="lon", key=key, source_type=source_type)
+            # only the requested variable is regridded, the remaining variables get their own interpolators
+            data_array = self.__regrid(ds=ds, var=var, lat=ds['lat'], lon=ds['lon'])
+        elif source_type == SourceType.CMEMS:
+            world = xr.open_zarr(store=store)
+            data_array = world[var]
+            data_array = subset_rectilinear(data_array=data_array, flight_extent=subset_extent)
+            if chunked:
+                logger.info(f"built {var} from source {source_type.name} into chunked interpolator: {key}")
+                return ChunkedGrid4D(data_array=data_array, dtype=np.dtype(self.precision.value))
+            if self.precision == Precision.FLOAT32:
+                data_array = data_array.astype(self.precision.value)
+        elif source_type == SourceType.LOCAL:
+            ds = xr.open_dataset(store)
+            # rename time and depth dimensions to be consistent
+            ds = ds.rename({"deptht": "depth", "time_counter": "time"})
+            ds = subset_curvilinear(ds=ds, lat="nav_lat", lon="nav_lon", flight_extent=subset_extent)
+            if curvilinear:
+                return self.__curvilinear(ds=ds, var=var, lat="nav_lat", lon="nav_lon", key=key, source_type=source_type)
+            data_array = self.__regrid(ds=ds, var=var, lat=ds['nav_lat'], lon=ds['nav_lon'])
+        else:
+            logger.error(f"unknown model source {source_type.name}")
+            raise UnknownSourceKey
+
+        if self.cache:
+            # build from the memory mapped cache entry so the grid doesn't hold a private copy of the world
+            return self.interpolator_cache.put(key=cache_key, data_array=data_array.load())
+        return data_array.load()
+
+    def load_variable_in_worker(self, store: str, var: str, world_attrs: MatchedWorld, extent: WorldExtent,
+                                mission: str, source_type: SourceType, flight_extent: WorldExtent = None) -> tuple:
+        """
+        Loads a world variable on a worker process of a parallel build. A variable that is in the interpolator cache is
+        returned by its cache key rather than pickled back to the parent as an in memory copy, the parent memory maps
+        the cache entry itself. The cache hits and misses of the worker are returned so the parent can count them.
+
+        Args:
+            store: location of the downloaded world
+            var: variable name within the world
+            world_attrs: matched world the variable belongs to
+            extent: extent of the downloaded world
+            flight_extent: optional extent of the flight to subset the world to
+            mission: name of mission the interpolator is for
+            source_type: source of the world
+
+        Returns:
+            loaded variable (None if it is cached), cache key of the variable (None if it isn't cached), cache hits and
+            cache misses
+
+        """
+        hits, misses = self.interpolator_cache.hits, self.interpolator_cache.misses
+        data = self.load_variable(store=store, var=var, world_attrs=world_attrs, extent=extent, mission=mission,
+                                  source_type=source_type, flight_extent=flight_extent)
+        hits, misses = self.interpolator_cache.hits - hits, self.interpolator_cache.misses - misses
+        if self.cache and isinstance(data, xr.DataArray):
+            cache_key = self.__cache_key(var=var, world_attrs=world_attrs, extent=extent, source_type=source_type,
+                                         flight_extent=flight_extent)
+            # the entry may already have been evicted again if the cache is over budget
+            if self.interpolator_cache.open(key=cache_key) is not None:
+                return None, cache_key, hits, misses
+        return data, None, hits, misses
+
+    def __cache_key(self, var: str, world_attrs: MatchedWorld, extent: WorldExtent, source_type: SourceType,
+                    flight_extent: WorldExtent = None) -> str:
+        """
+        interpolator cache key of a world variable
+        """
+        return self.interpolator_cache.cache_key(world=world_attrs, var=var, extent=extent,
+                                                 settings=self.__settings(source_type=source_type,
+                                                                          flight_extent=flight_extent,
+                                                                          precision=self.precision))
+
+    def __curvilinear(self, ds: xr.Dataset, var: str, lat: str, lon: str, key: str,
+                      source_type: SourceType) -> CurvilinearGrid4D:
+        """
+        builds an interpolator that works directly on the curvilinear grid of a world, skipping the regrid
+        """
+        grid = CurvilinearGrid4D.from_dataset(ds=ds, var=var, lat=lat, lon=lon,
+                                              cache=self.interpolator_cache if self.cache else None,
+                                              dtype=np.dtype(self.precision.value))
+        logger.info(f"built {var} from source {source_type.name} into curvilinear interpolator: {key}")
+        return grid
+
+    @staticmethod
+    def __settings(source_type: SourceType, flight_extent: WorldExtent = None,
+                   precision: Precision = Precision.FLOAT64) -> dict:
+        """
+        settings that change how an interpolator is built, these form part of the interpolator cache key
+        """
+        return {"source": source_type.value,
+                "regrid_method": REGRID_METHOD,
+                "geodetic": True,
+                "flight_extent": None if flight_extent is None else asdict(flight_extent),
+                "precision": precision.value,
+                }
+
+    def __regrid(self, ds: xr.Dataset, var: str, lat: xr.DataArray, lon: xr.DataArray) -> xr.DataArray:
+        """
+        regrids a variable on a curvilinear grid on to a regular grid spanning the same extent
+
+        Args:
+            ds: dataset containing the variable
+            var: variable to regrid
+            lat: 2D latitude array of the curvilinear grid
+            lon: 2D longitude array of the curvilinear grid
+
+        Returns:
+            regridded variable on 1D latitude and longitude axes
+
+        """
+        regridder = self.__regridder(ds=ds, var=var, lat=lat, lon=lon)
+        regridded = regridder(ds[var])
+        # Add units to latitude and longitude coordinates
+        regridded['latitude'].attrs['units'] = 'degrees_north'
+        regridded['longitude'].attrs['units'] = 'degrees_east'
+        # convert to the interpolator precision, model output is usually float32
+        regridded = regridded.astype(self.precision.value)
+        regridded['time'] = regridded['time'].astype('datetime64[ns]')
+        return regridded
+
+    def __regridder(self, ds: xr.Dataset, var: str, lat: xr.DataArray, lon: xr.DataArray) -> xe.Regridder:
+        """
+        gets the regridder from the curvilinear grid to its regular target grid. Regridders are created once per source
+        grid, target grid and method and shared by every variable on that grid. If the interpolator cache is enabled the
+        weights are also stored on disk so later builds over the same model domain don't need to recompute them.
+
+        Args:
+            ds: dataset containing the variable
+            var: variable the regridder will be used for
+            lat: 2D latitude array of the curvilinear grid
+            lon: 2D longitude array of the curvilinear grid
+
+        Returns:
+            xesmf regridder
+
+        """
+        target_grid = self.__target_grid(lat=lat, lon=lon)
+        grid_hash = hashlib.sha256()
+        for array in [lat.values, lon.values, target_grid['latitude'].values, target_grid['longitude'].values]:
+            grid_hash.update(str(array.shape).encode())
+            grid_hash.update(np.ascontiguousarray(array, dtype=np.float64).tobytes())
+        grid_hash.update(REGRID_METHOD.encode())
+        grid_key = grid_hash.hexdigest()
+        # variables on the same grid are built in parallel, only the first creates the regridder
+        with self.regrid_lock:
+            if grid_key not in self.regridders:
+                self.regridders[grid_key] = self.__create_regridder(ds=ds, var=var, target_grid=target_grid,
+                                                                    grid_key=grid_key)
+            return self.regridders[grid_key]
+
+    def __create_regridder(self, ds: xr.Dataset, var: str, target_grid: xr.Dataset, grid_key: str) -> xe.Regridder:
+        weights_file = None
+        if self.cache:
+            weights_file = self.interpolator_cache.file_path(kind=WEIGHTS_DIR, name=f"{grid_key}.nc")
+        # touching the weights marks them as recently used so they are evicted after weights that haven't been reused
+        if weights_file is not None and self.interpolator_cache.touch(path=weights_file):
+            logger.info(f"reusing regrid weights {weights_file}")
+            regridder = xe.Regridder(ds[var], target_grid, method=REGRID_METHOD, ignore_degenerate=True,
+                                     filename=weights_file, reuse_weights=True)
+        else:
+            logger.info(f"creating regrid weights for grid {grid_key}")
+            # Create a regridder object to go from curvilinear to regular grid
+            regridder = xe.Regridder(ds[var], target_grid, method=REGRID_METHOD, ignore_degenerate=True)
+            if weights_file is not None:
+                # write to a temporary file first so other processes never read partially written weights
+                tmp_file = os.path.join(os.path.dirname(weights_file), f"{grid_key}{TMP_MARKER}{os.getpid()}.nc")
+                regridder.to_netcdf(tmp_file)
+                os.replace(tmp_file, weights_file)
+                logger.info(f"stored regrid weights {weights_file}")
+                # weights count towards the disk budget of the interpolator cache
+                self.interpolator_cache.evict()
+        return regridder
+
+    @staticmethod
+    def __target_grid(lat: xr.DataArray, lon: xr.DataArray) -> xr.Dataset:
+        """
+        creates a regular grid with the same extent and number of points as a curvilinear grid
+        """
+        # reduce arrays to get max and min values
+        latmin = lat.reduce(np.min,dim=['x','y']).values
+        latmax = lat.reduce(np.max,dim=['x','y']).values
+        lonmin = lon.reduce(np.min,dim=['x','y']).values
+        lonmax = lon.reduce(np.max,dim=['x','y']).values
+        # Define a regular grid with 1D lat/lon arrays
+        target_lat = np.linspace(latmin, latmax, lat.sizes['y'])
+        target_lon = np.linspace(lonmin, lonmax, lon.sizes['x'])
+        # Create a target grid dataset
+        return xr.Dataset({
+            'latitude': (['latitude'], target_lat),
+            'longitude': (['longitude'], target_lon)
+        })
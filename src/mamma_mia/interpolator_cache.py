@@ -0,0 +1,320 @@
+# Copyright 2025 National Oceanography Centre
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#  http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import json
+import hashlib
+import shutil
+import threading
+from importlib.metadata import version, PackageNotFoundError
+import numpy as np
+import xarray as xr
+from attrs import define, asdict
+from loguru import logger
+from mamma_mia.worlds import MatchedWorld, WorldExtent
+
+# libraries whose version changes could alter a built interpolator
+CACHE_LIBRARIES = ["mamma-mia", "pyinterp", "xesmf", "xarray", "numpy"]
+# each cache entry is a directory of raw arrays plus a json description of the data array they make up
+META_FILE = "meta.json"
+VALUES_FILE = "values.npy"
+# marks entries and files that are still being written
+TMP_MARKER = ".tmp-"
+# interpolators are built on several threads at once, so the cache hits and misses are counted under a lock
+STATS_LOCK = threading.Lock()
+
+
+def library_versions() -> dict[str, str]:
+    """
+    Gets the installed versions of the libraries that are used to build interpolators
+
+    Returns:
+        dictionary of library name and version string
+
+    """
+    versions = {}
+    for library in CACHE_LIBRARIES:
+        try:
+            versions[library] = version(library)
+        except PackageNotFoundError:
+            versions[library] = "unknown"
+    return versions
+
+
+@define
+class InterpolatorCache:
+    """
+    Content addressed interpolator cache. Interpolators are stored under a hash of everything that goes into building
+    them (matched world, variable, world extent, regrid settings and library versions) so the cache can be shared
+    between missions and campaigns, and a change in any of the inputs results in a rebuild rather than a stale
+    interpolator. The cache is bounded by a disk budget, least recently used interpolators are evicted first.
+
+    Each entry holds the regridded world variable as uncompressed .npy arrays, these are memory mapped when read so
+    reloading an interpolator does not copy the world and worker processes share a single page cached copy. Files
+    that are reused when building interpolators (e.g. regrid weights) are kept in sub directories of the cache, each
+    file is an entry of its own that counts towards the disk budget and is evicted in the same way.
+
+    Parameters
+    ----------
+    cache_dir: str, optional
+        directory interpolators are cached in
+    max_size: int, optional
+        disk budget of the cache in bytes, None for an unbounded cache
+
+    Attributes
+    ----------
+    hits: int
+        number of interpolators served from the cache
+    misses: int
+        number of interpolators that were not found in the cache
+    """
+    cache_dir: str = "interpolator_cache"
+    max_size: int | None = 10 * 1024 ** 3
+    hits: int = 0
+    misses: int = 0
+
+    @staticmethod
+    def cache_key(world: MatchedWorld, var: str, extent: WorldExtent, settings: dict) -> str:
+        """
+        Creates the cache key for an interpolator
+
+        Args:
+            world: matched world the interpolator is built from
+            var: variable name within the world
+            extent: extent of the world
+            settings: any settings used to build the interpolator e.g. regrid method
+
+        Returns:
+            hex digest identifying the interpolator
+
+        """
+        description = {
+            "data_id": world.data_id,
+            "local_dir": world.local_dir,
+            "variable": var,
+            "extent": asdict(extent),
+            "settings": settings,
+            "versions": library_versions(),
+        }
+        return hashlib.sha256(json.dumps(description, sort_keys=True, default=str).encode()).hexdigest()
+
+    def __path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key)
+
+    def get(self, key: str) -> xr.DataArray | None:
+        """
+        Gets the world variable an interpolator is built from out of the cache. The values and coordinates are memory
+        mapped rather than read, so no copy is made and processes using the same cached world share the OS page cache.
+
+        Args:
+            key: cache key of interpolator
+
+        Returns:
+            memory mapped data array if it is cached, otherwise None
+
+        """
+        data_array = self.open(key=key)
+        if data_array is None:
+            self.record(misses=1)
+            logger.info(f"interpolator {key} not found in cache")
+            return None
+        # update modification time so eviction is least recently used rather than least recently written
+        os.utime(os.path.join(self.__path(key), META_FILE))
+        self.record(hits=1)
+        logger.info(f"imported interpolator {key} from cache")
+        return data_array
+
+    def record(self, hits: int = 0, misses: int = 0) -> None:
+        """
+        Adds to the cache hits and misses, e.g. the hits and misses of a worker process of a parallel build
+
+        Args:
+            hits: number of interpolators served from the cache
+            misses: number of interpolators that were not found in the cache
+
+        """
+        with STATS_LOCK:
+            self.hits += hits
+            self.misses += misses
+
+    def open(self, key: str) -> xr.DataArray | None:
+        """
+        Memory maps a cache entry without recording a hit or miss, e.g. to reopen an entry a worker process of a
+        parallel build has already got (or put) and counted
+
+        Args:
+            key: cache key of interpolator
+
+        Returns:
+            memory mapped data array if it is cached, otherwise None
+
+        """
+        path = self.__path(key)
+        try:
+            return self.__open(path=path)
+        except FileNotFoundError:
+            # not cached, or evicted in the meantime
+            return None
+
+    def put(self, key: str, data_array: xr.DataArray) -> xr.DataArray:
+        """
+        Adds the world variable an interpolator is built from to the cache as raw arrays and evicts the least recently
+        used entries if the cache is over budget.
+
+        Args:
+            key: cache key of interpolator
+            data_array: world variable to cache, must have 1D dimension coordinates
+
+        Returns:
+            memory mapped copy of the cached data array
+
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self.__path(key)
+        # write to a temporary directory first so other missions never read a partially written entry
+        tmp_path = f"{path}{TMP_MARKER}{os.getpid()}-{threading.get_ident()}"
+        os.makedirs(tmp_path, exist_ok=True)
+        np.save(os.path.join(tmp_path, VALUES_FILE), np.ascontiguousarray(data_array.values))
+        coords = {}
+        for i, dim in enumerate(data_array.dims):
+            np.save(os.path.join(tmp_path, f"coord_{i}.npy"), data_array[dim].values)
+            coords[dim] = {"file": f"coord_{i}.npy", "attrs": _serialisable(data_array[dim].attrs)}
+        meta = {"name": data_array.name,
+                "dims": list(data_array.dims),
+                "coords": coords,
+                "attrs": _serialisable(data_array.attrs),
+                }
+        with open(os.path.join(tmp_path, META_FILE), "w") as f:
+            json.dump(meta, f)
+        try:
+            os.replace(tmp_path, path)
+        except OSError:
+            # another process has cached the same entry in the meantime
+            shutil.rmtree(tmp_path, ignore_errors=True)
+        logger.info(f"exported interpolator {key} to cache")
+        self.evict()
+        if os.path.isdir(path):
+            return self.__open(path=path)
+        return data_array
+
+    @staticmethod
+    def __open(path: str) -> xr.DataArray:
+        with open(os.path.join(path, META_FILE), "r") as f:
+            meta = json.load(f)
+        values = np.load(os.path.join(path, VALUES_FILE), mmap_mode="r")
+        coords = {}
+        for dim, coord in meta["coords"].items():
+            coords[dim] = xr.Variable(dims=dim, data=np.load(os.path.join(path, coord["file"])), attrs=coord["attrs"])
+        return xr.DataArray(values, coords=coords, dims=meta["dims"], name=meta["name"], attrs=meta["attrs"])
+
+    def file_path(self, kind: str, name: str) -> str:
+        """
+        Gets the location of a file kept in the cache alongside the interpolators
+
+        Args:
+            kind: sub directory of the cache the file is kept in e.g. weights
+            name: name of the file
+
+        Returns:
+            path of the file, its directory is created if it doesn't exist
+        """
+        directory = os.path.join(self.cache_dir, kind)
+        os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, name)
+
+    def touch(self, path: str) -> bool:
+        """
+        Marks a cached file as used so it is evicted after files that have been used less recently
+
+        Args:
+            path: path of the file
+
+        Returns:
+            True if the file is cached, False if it doesn't exist (or has been evicted)
+        """
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def size(self) -> int:
+        """
+        Returns:
+            total size of the cached interpolators and files in bytes
+        """
+        return sum(size for _, _, size in self.__entries())
+
+    def evict(self) -> None:
+        """
+        Removes least recently used interpolators and files until the cache is within its disk budget
+        """
+        if self.max_size is None:
+            return
+        entries = sorted(self.__entries())
+        total = sum(size for _, _, size in entries)
+        for _, path, size in entries:
+            if total <= self.max_size:
+                break
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            total -= size
+            logger.info(f"evicted {path} from interpolator cache")
+
+    def stats(self) -> dict:
+        """
+        Returns:
+            dictionary of cache hits, misses, hit rate and size in bytes
+        """
+        requests = self.hits + self.misses
+        return {"hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / requests if requests else 0.0,
+                "size": self.size(),
+                }
+
+    def __entries(self) -> list[tuple[float, str, int]]:
+        if not os.path.isdir(self.cache_dir):
+            return []
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            # entries that are still being written are left alone
+            if not entry.is_dir() or TMP_MARKER in entry.name:
+                continue
+            meta_file = os.path.join(entry.path, META_FILE)
+            if os.path.exists(meta_file):
+                size = sum(f.stat().st_size for f in os.scandir(entry.path) if f.is_file())
+                entries.append((os.stat(meta_file).st_mtime, entry.path, size))
+            else:
+                # a sub directory of cached files, each file is an entry
+                for f in os.scandir(entry.path):
+                    if f.is_file() and TMP_MARKER not in f.name:
+                        stat = f.stat()
+                        entries.append((stat.st_mtime, f.path, stat.st_size))
+        return entries
+
+
+def _serialisable(attrs: dict) -> dict:
+    """
+    keeps the attributes that can be stored as json, numpy scalars are converted to python types
+    """
+    serialisable = {}
+    for key, value in attrs.items():
+        if isinstance(value, np.generic):
+            value = value.item()
+        if isinstance(value, (str, int, float, bool)):
+            serialisable[key] = value
+    return serialisable
@@ -0,0 +1,156 @@
+# Copyright 2025 National Oceanography Centre
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#  http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from collections import OrderedDict
+import numpy as np
+from attrs import define, field
+from loguru import logger
+
+
+def interpolator_nbytes(grid) -> int:
+    """
+    Estimates the memory an interpolator holds
+
+    Args:
+        grid: pyinterp Grid4D, CurvilinearGrid4D or ChunkedGrid4D interpolator
+
+    Returns:
+        size of the interpolator's values in bytes
+
+    """
+    # curvilinear interpolators hold their values, chunked ones their loaded tiles and pyinterp grids their array
+    for attribute in ["values", "array"]:
+        values = getattr(grid, attribute, None)
+        if isinstance(values, np.ndarray):
+            return int(values.nbytes)
+    return int(getattr(grid, "tiles_size", 0))
+
+
+@define
+class InterpolatorRegistry:
+    """
+    Campaign wide registry of the interpolators that are loaded in memory. Interpolators are registered when they are
+    loaded and the least recently used ones are unloaded once the registry is over its memory budget, an unloaded
+    interpolator is rebuilt (or reloaded from the interpolator cache) the next time it is queried.
+
+    An interpolator built once for several missions is registered under the mission it was built for, the missions it
+    is shared with are declared as its consumers and it is only released once every one of them has been flown.
+
+    Parameters
+    ----------
+    max_memory: int, optional
+        memory budget of the loaded interpolators in bytes, None for no budget
+
+    Attributes
+    ----------
+    entries: OrderedDict
+        loaded interpolators keyed by mission and interpolator key, least recently used first
+    resident: int
+        total size of the loaded interpolators in bytes
+    consumers: dict
+        missions that use each shared interpolator and haven't been released, keyed by the mission it was built for and
+        interpolator key
+    """
+    max_memory: int | None = None
+    entries: OrderedDict = field(factory=OrderedDict, repr=False)
+    resident: int = 0
+    consumers: dict = field(factory=dict, repr=False)
+
+    def loaded(self, grid, interpolators, mission: str, key: str, world: str) -> None:
+        """
+        Registers that an interpolator has been queried, marking it as most recently used and unloading the least
+        recently used interpolators of the campaign if the budget is exceeded. Interpolators that are already registered
+        are measured again, as chunked interpolators grow (and shrink) with the tiles their queries load.
+
+        Args:
+            grid: interpolator that has been loaded
+            interpolators: Interpolators object the interpolator belongs to
+            mission: name of the mission the interpolator is for
+            key: key of the interpolator
+            world: data id of the world the interpolator is built from
+
+        """
+        entry_key = (mission, key)
+        nbytes = interpolator_nbytes(grid)
+        if entry_key in self.entries:
+            self.entries.move_to_end(entry_key)
+            entry = self.entries[entry_key]
+            if nbytes == entry["nbytes"]:
+                return
+            self.resident += nbytes - entry["nbytes"]
+            entry["nbytes"] = nbytes
+        else:
+            self.entries[entry_key] = {"interpolators": interpolators, "world": world, "nbytes": nbytes}
+            self.resident += nbytes
+        logger.debug(f"registered interpolator {key} of {mission} ({nbytes} bytes), {self.resident} bytes resident")
+        if self.max_memory is None:
+            return
+        # the interpolator that was just queried is always kept
+        while self.resident > self.max_memory and len(self.entries) > 1:
+            self.unload(*next(iter(self.entries)))
+
+    def unload(self, mission: str, key: str) -> None:
+        """
+        Unloads an interpolator, it will be rebuilt or reloaded from cache when it is next queried
+
+        Args:
+            mission: name of the mission the interpolator is for
+            key: key of the interpolator
+
+        """
+        entry = self.entries.pop((mission, key), None)
+        if entry is None:
+            return
+        entry["interpolators"].unload(key)
+        self.resident -= entry["nbytes"]
+        logger.info(f"unloaded interpolator {key} of {mission} ({entry['nbytes']} bytes)")
+
+    def share(self, mission: str, key: str, consumer: str) -> None:
+        """
+        Declares a mission that uses an interpolator built for another (or the same) mission
+
+        Args:
+            mission: name of the mission the interpolator is built and registered for
+            key: key of the interpolator
+            consumer: name of the mission using it
+
+        """
+        self.consumers.setdefault((mission, key), set()).add(consumer)
+
+    def release(self, mission: str) -> None:
+        """
+        Releases the interpolators a mission uses, e.g. once it has been flown. Shared interpolators are unloaded once
+        every mission using them has been released, the mission's other interpolators straight away.
+
+        Args:
+            mission: name of the mission
+
+        """
+        for entry_key, consumers in list(self.consumers.items()):
+            if mission not in consumers:
+                continue
+            consumers.discard(mission)
+            if not consumers:
+                del self.consumers[entry_key]
+                self.unload(*entry_key)
+        for entry_mission, key in list(self.entries.keys()):
+            if entry_mission == mission and (entry_mission, key) not in self.consumers:
+                self.unload(mission=entry_mission, key=key)
+
+    def report(self) -> dict[str, int]:
+        """
+        Returns:
+            dictionary of world data id and the size in bytes of its loaded interpolators
+        """
+        worlds = {}
+        for entry in self.entries.values():
+            worlds[entry["world"]] = worlds.get(entry["world"], 0) + entry["nbytes"]
+        return worlds
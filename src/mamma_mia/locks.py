@@ -0,0 +1,189 @@
+# Copyright 2025 National Oceanography Centre
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#  http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import json
+import time
+import socket
+import threading
+from attrs import define, field
+from loguru import logger
+
+
+@define
+class FileLock:
+    """
+    Lock shared between processes, including processes on other hosts using the same shared filesystem. The lock is a
+    file hard linked into place, which is atomic on local disks and NFS. While the lock is held its file is touched
+    regularly, a lock whose holder has died (its process is gone or its file has not been touched for stale_after
+    seconds) is taken over. A takeover renames the abandoned lock file out of the way first, so when several waiters
+    find the same abandoned lock only one of them removes it. Threads of the same process wait on each other like other
+    processes do.
+
+    Parameters
+    ----------
+    path: str
+        location of the lock file
+    stale_after: float, optional
+        seconds after which a lock file that has not been touched is treated as abandoned
+    poll: float, optional
+        seconds to wait between attempts to take the lock
+    timeout: float, optional
+        seconds to wait for the lock before raising TimeoutError, None waits until the lock is free
+    """
+    path: str
+    stale_after: float = 120.0
+    poll: float = 0.5
+    timeout: float | None = None
+    _heartbeat: threading.Thread | None = field(default=None, init=False, repr=False)
+    _stop: threading.Event = field(factory=threading.Event, init=False, repr=False)
+
+    def acquire(self) -> None:
+        """
+        Takes the lock, waiting until it is free
+
+        Raises:
+            TimeoutError: if the lock is not free within the timeout
+        """
+        start = time.monotonic()
+        waiting = False
+        while not self.__try_create():
+            holder = self.holder()
+            if self.__stale(holder=holder):
+                self.__take_over(holder=holder)
+                continue
+            if self.timeout is not None and time.monotonic() - start > self.timeout:
+                raise TimeoutError(f"timed out waiting for lock {self.path}")
+            if not waiting:
+                logger.info(f"waiting for lock {self.path} held by {holder}")
+                waiting = True
+            time.sleep(self.poll)
+        self._stop.clear()
+        self._heartbeat = threading.Thread(target=self.__beat, daemon=True)
+        self._heartbeat.start()
+
+    def release(self) -> None:
+        """
+        Releases the lock
+        """
+        self._stop.set()
+        if self._heartbeat is not None:
+            self._heartbeat.join()
+            self._heartbeat = None
+        self.__remove()
+
+    def holder(self) -> dict | None:
+        """
+        Returns:
+            host, process id and time the lock was taken by its holder, None if the lock is free or unreadable
+        """
+        return _read_holder(path=self.path)
+
+    def stale(self) -> bool:
+        """
+        Returns:
+            True if the lock file has been abandoned by its holder, False if the lock is free or still held
+        """
+        return self.__stale(holder=self.holder())
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
+    def __try_create(self) -> bool:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        # the holder is written to a file of this thread first and linked into place, so the lock file is never seen
+        # without its holder
+        tmp_file = self.__own_path(suffix="tmp")
+        with open(tmp_file, "w") as f:
+            json.dump({"host": socket.gethostname(), "pid": os.getpid(), "time": time.time()}, f)
+        try:
+            os.link(tmp_file, self.path)
+        except FileExistsError:
+            return False
+        finally:
+            os.remove(tmp_file)
+        return True
+
+    def __take_over(self, holder: dict | None) -> None:
+        """
+        removes an abandoned lock file. It is renamed out of the way first, which only one waiter can do, and is then
+        checked to still be the lock of the dead holder. If another waiter has taken over and created a lock of its own
+        in the meantime that lock is put back.
+        """
+        taken = self.__own_path(suffix="stale")
+        try:
+            os.rename(self.path, taken)
+        except FileNotFoundError:
+            # another waiter has already removed it
+            return
+        if _read_holder(path=taken) == holder:
+            logger.warning(f"taking over abandoned lock {self.path} held by {holder}")
+            os.remove(taken)
+            return
+        try:
+            os.link(taken, self.path)
+        except FileExistsError:
+            logger.error(f"lock {self.path} was taken while it was being put back, it may have two holders")
+        os.remove(taken)
+
+    def __own_path(self, suffix: str) -> str:
+        """
+        file next to the lock file that only this thread uses
+        """
+        return f"{self.path}.{suffix}-{socket.gethostname()}-{os.getpid()}-{threading.get_ident()}"
+
+    def __stale(self, holder: dict | None) -> bool:
+        """
+        checks whether the holder of the lock has died
+        """
+        try:
+            age = time.time() - os.path.getmtime(self.path)
+        except FileNotFoundError:
+            return False
+        if holder is not None and holder.get("host") == socket.gethostname():
+            try:
+                os.kill(holder["pid"], 0)
+            except ProcessLookupError:
+                return True
+            except PermissionError:
+                pass
+        return age > self.stale_after
+
+    def __beat(self) -> None:
+        """
+        touches the lock file while it is held so other processes can tell it is not abandoned
+        """
+        while not self._stop.wait(timeout=self.stale_after / 4):
+            try:
+                os.utime(self.path)
+            except FileNotFoundError:
+                return
+
+    def __remove(self) -> None:
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def _read_holder(path: str) -> dict | None:
+    """
+    reads the host, process id and time of the holder of a lock file, None if the file is missing or unreadable
+    """
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
@@ -27,10 +27,11 @@ from mamma_mia.interpolator import Interpolators
 from mamma_mia.worlds import SourceConfig
 from mamma_mia.find_worlds import FindWorlds
 from mamma_mia.get_worlds import get_worlds
+from mamma_mia.segments import corridor_segments, SegmentedInterpolators
 from mamma_mia.exceptions import CriticalParameterMissing,NoValidSource
 from scipy.interpolate import interp1d
 from mamma_mia.gsw_funcs import ConvertedTSP, ConvertedP
-from mamma_mia.worlds import WorldsConf, WorldExtent, WorldsAttributes
+from mamma_mia.worlds import WorldsConf, WorldExtent, WorldsAttributes, Precision
 from mamma_mia.sim_error import simulate_sensor_error
 
 @frozen
@@ -439,6 +440,9 @@ class Mission:
                       standard_name_vocabulary,
                       mission_time_step: int,
                       apply_obs_error: bool,
+                      precision: Precision = Precision.FLOAT64,
+                      segment_length: float | None = None,
+                      segment_duration: float | None = None,
                       ):
         platform = Platform(attrs=platform_attributes,behaviour=np.empty((0,)))
         instruments = []
@@ -532,19 +536,34 @@ class Mission:
             featureType="Trajectory"
         )
 
+        time_padding = np.timedelta64(30, 'D')
         extent = WorldExtent(
             lat_max=np.around(np.nanmax(trajectory.latitude), 2) + excess_space,
             lat_min=np.around(np.nanmin(trajectory.latitude), 2) - excess_space,
             lon_max=np.around(np.nanmax(trajectory.longitude), 2) + excess_space,
             lon_min=np.around(np.nanmin(trajectory.longitude), 2) - excess_space,
-            time_start=str(np.datetime_as_string(trajectory.time[0] - np.timedelta64(30, 'D'), unit="D")),
-            time_end=str(np.datetime_as_string(trajectory.time[-1] + np.timedelta64(30, 'D'), unit="D")),
+            time_start=str(np.datetime_as_string(trajectory.time[0] - time_padding, unit="D")),
+            time_end=str(np.datetime_as_string(trajectory.time[-1] + time_padding, unit="D")),
             depth_max=np.around(np.nanmax(trajectory.depth), 2) + extra_depth,
         )
+        # worlds are matched for the whole extent but can be got per along track (and in time) segment
+        segments = []
+        if segment_length is not None or segment_duration is not None:
+            segments = corridor_segments(latitude=np.asarray(trajectory.latitude),
+                                         longitude=np.asarray(trajectory.longitude),
+                                         depth=np.asarray(trajectory.depth),
+                                         time=np.asarray(trajectory.time),
+                                         excess_space=excess_space,
+                                         extra_depth=extra_depth,
+                                         time_padding=time_padding,
+                                         segment_length=segment_length,
+                                         segment_duration=None if segment_duration is None else
+                                         np.timedelta64(int(segment_duration * 86400), 's'))
         worlds = WorldsConf(
             attributes=WorldsAttributes(extent=extent,
                                                  matched_worlds={},
-                                                 interpolator_priorities={}
+                                                 interpolator_priorities={},
+                                                 segments=segments
                                                  ),
             worlds={},
             stores={}
@@ -554,8 +573,10 @@ class Mission:
         mission_total_time_seconds = (trajectory.time[-1] - trajectory.time[0]).astype('timedelta64[s]')
         mission_total_time_steps = np.ceil(mission_total_time_seconds.astype(int) / mission_time_step).astype(int)
         for name, sensor in platform.attrs.sensors.items():
+            # navigation parameters (e.g. time, position) always stay double precision
+            dtype = np.float64 if sensor.instrument_type == "data_logger" else np.dtype(precision.value)
             for name2, specification in sensor.specification.items():
-                payload[name2] = np.empty(shape=mission_total_time_steps, dtype=np.float64)
+                payload[name2] = np.empty(shape=mission_total_time_steps, dtype=dtype)
         return cls(platform=platform,
                    attrs=attrs,
                    geospatial_attrs=geospatial_attrs,
@@ -600,6 +621,38 @@ class Mission:
 
         return parameter_units
 
+    def flight_extent(self) -> WorldExtent:
+        """
+        extent of the trajectory itself without any excess space, depth or time added. This is what interpolators
+        need to cover for the mission to be flown.
+
+        Returns:
+            WorldExtent of the trajectory
+        """
+        return WorldExtent(lat_max=float(np.nanmax(self.trajectory.latitude)),
+                           lat_min=float(np.nanmin(self.trajectory.latitude)),
+                           lon_max=float(np.nanmax(self.trajectory.longitude)),
+                           lon_min=float(np.nanmin(self.trajectory.longitude)),
+                           time_start=str(np.datetime_as_string(self.trajectory.time[0], unit="s")),
+                           time_end=str(np.datetime_as_string(self.trajectory.time[-1], unit="s")),
+                           depth_max=float(np.nanmax(self.trajectory.depth)),
+                           depth_min=float(np.nanmin(self.trajectory.depth)),
+                           )
+
+    def match_worlds(self, cat: Cats):
+        """
+        searches for worlds that match the payload and extent of the mission
+        Args:
+            cat: Initialised Cats object, this contains catalogs for all source data
+
+        Returns:
+            void: matched worlds attribute is updated with the worlds that match the sensors and trajectory
+
+        """
+        matched_worlds = FindWorlds()
+        matched_worlds.search_worlds(cat=cat, payload=self.payload, extent=self.worlds.attributes.extent,source=self.attrs.source_config)
+        self.worlds.attributes.matched_worlds = matched_worlds.entries
+
     def build_mission(self, cat: Cats):
         """
         build missions, this searches for relevant data, downloads and updates attributes as needed
@@ -611,18 +664,17 @@ class Mission:
                   and zarr store attributes are updated with the new values (what worlds match sensors and trajectory etc)
 
         """
-        matched_worlds = FindWorlds()
-        matched_worlds.search_worlds(cat=cat, payload=self.payload, extent=self.worlds.attributes.extent,source=self.attrs.source_config)
-        self.worlds.attributes.matched_worlds = matched_worlds.entries
+        self.match_worlds(cat=cat)
         data_stores = get_worlds(cat=cat, worlds=self.worlds,source=self.attrs.source_config)
         self.worlds.stores = data_stores
 
-    def fly(self, interpolator: Interpolators):
+    def fly(self, interpolator: Interpolators | SegmentedInterpolators):
         """
 
         Args:
 
-            interpolator: Interpolator object with interpolators to fly through
+            interpolator: Interpolator object with interpolators to fly through, or the segmented interpolators of a
+                          mission whose worlds were got per along track segment
 
         Returns:
             void: mission object with filled reality arrays of interpolated data, i.e. AUV has flown its
@@ -665,10 +717,12 @@ class Mission:
                         if nav_key == parameter["meta_data"].parameter_id:
                             navigation_alias[nav_key] = parameter["meta_data"].alternate_labels
         marked_keys = []
+        # variables that share a grid are interpolated together so the flight's cells and weights are found once
+        tracks = interpolator.quadrivariate_many(keys=list(self.payload.keys()), coords=flight_subset)
         for key in self.payload.keys():
             try:
                 logger.info(f"flying through {key} world and creating interpolated data for flight")
-                track = interpolator.interpolator[key].quadrivariate(flight_subset)
+                track = tracks[key]
             except KeyError:
                 track = None
                 # pressure is kind of a special case as its not found in the models and is derived from trajectory depth
@@ -0,0 +1,194 @@
+# Copyright 2025 National Oceanography Centre
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#  http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import numpy as np
+from attrs import define
+from loguru import logger
+from mamma_mia.interpolator import Interpolators
+from mamma_mia.worlds import WorldExtent, WorldSegment
+
+# mean radius of the earth in kilometres
+EARTH_RADIUS = 6371.0
+
+
+def along_track_distance(latitude: np.ndarray, longitude: np.ndarray) -> np.ndarray:
+    """
+    Cumulative great circle distance along a trajectory
+
+    Args:
+        latitude: latitudes of the trajectory in decimal degrees
+        longitude: longitudes of the trajectory in decimal degrees
+
+    Returns:
+        distance in kilometres from the start of the trajectory to each of its points
+    """
+    lat = np.radians(np.asarray(latitude, dtype=np.float64))
+    lon = np.radians(np.asarray(longitude, dtype=np.float64))
+    a = (np.sin(np.diff(lat) / 2) ** 2 +
+         np.cos(lat[:-1]) * np.cos(lat[1:]) * np.sin(np.diff(lon) / 2) ** 2)
+    steps = 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+    # positions that are missing don't add any distance
+    return np.concatenate([[0.0], np.cumsum(np.nan_to_num(steps))])
+
+
+def corridor_segments(latitude: np.ndarray, longitude: np.ndarray, depth: np.ndarray, time: np.ndarray,
+                      excess_space: float, extra_depth: float, time_padding: np.timedelta64,
+                      segment_length: float | None = None,
+                      segment_duration: np.timedelta64 | None = None) -> list[WorldSegment]:
+    """
+    Splits a trajectory into along track segments, each with its own extent padded in the same way as the extent of a
+    whole mission. The extents follow the trajectory so the area downloaded scales with its length rather than with
+    the area of its bounding box, and the time range of each segment only covers the time it is flown. Neighbouring
+    segments share the point between them so every point of the flight is covered.
+
+    Args:
+        latitude: latitudes of the trajectory in decimal degrees
+        longitude: longitudes of the trajectory in decimal degrees
+        depth: depths of the trajectory in metres
+        time: times of the trajectory
+        excess_space: excess space added around each segment in decimal degrees
+        extra_depth: excess depth added below each segment in metres
+        time_padding: time added before and after each segment
+        segment_length: maximum length of each segment in kilometres, None to not split by length
+        segment_duration: maximum duration of each segment, None to not split by time
+
+    Returns:
+        list of segments in the order they are flown
+    """
+    distance = along_track_distance(latitude=latitude, longitude=longitude)
+    time = np.asarray(time, dtype="datetime64[ns]")
+    # a new segment starts every time the trajectory passes a multiple of the segment length or duration
+    segment_id = np.zeros((distance.size, 2), dtype=np.int64)
+    if segment_length is not None:
+        segment_id[:, 0] = np.floor(distance / segment_length)
+    if segment_duration is not None:
+        segment_id[:, 1] = (time - time[0]) // np.asarray(segment_duration, dtype="timedelta64[ns]")
+    bounds = np.flatnonzero(np.any(np.diff(segment_id, axis=0) != 0, axis=1)) + 1
+    bounds = bounds[bounds < distance.size - 1]
+    starts = np.concatenate([[0], bounds])
+    ends = np.concatenate([bounds, [distance.size - 1]])
+    segments = []
+    for start, end in zip(starts, ends):
+        selected = slice(start, end + 1)
+        lat = latitude[selected]
+        lon = longitude[selected]
+        dep = depth[selected]
+        extent = WorldExtent(
+            lat_max=np.around(np.nanmax(lat), 2) + excess_space,
+            lat_min=np.around(np.nanmin(lat), 2) - excess_space,
+            lon_max=np.around(np.nanmax(lon), 2) + excess_space,
+            lon_min=np.around(np.nanmin(lon), 2) - excess_space,
+            time_start=str(np.datetime_as_string(time[start] - time_padding, unit="D")),
+            time_end=str(np.datetime_as_string(time[end] + time_padding, unit="D")),
+            depth_max=np.around(np.nanmax(dep), 2) + extra_depth,
+        )
+        flight_extent = WorldExtent(lat_max=float(np.nanmax(lat)),
+                                    lat_min=float(np.nanmin(lat)),
+                                    lon_max=float(np.nanmax(lon)),
+                                    lon_min=float(np.nanmin(lon)),
+                                    time_start=str(np.datetime_as_string(time[start], unit="s")),
+                                    time_end=str(np.datetime_as_string(time[end], unit="s")),
+                                    depth_max=float(np.nanmax(dep)),
+                                    depth_min=float(np.nanmin(dep)),
+                                    )
+        segments.append(WorldSegment(extent=extent, flight_extent=flight_extent))
+    logger.info(f"split {distance[-1]:.1f} km, {(time[-1] - time[0]) / np.timedelta64(1, 'D'):.1f} day trajectory "
+                f"into {len(segments)} segments")
+    return segments
+
+
+def segment_name(mission: str, index: int) -> str:
+    """
+    name a segment of a mission is registered under in the world and interpolator registries
+    """
+    return f"{mission}_segment{index}"
+
+
+@define
+class SegmentedInterpolators:
+    """
+    Interpolators of a mission whose worlds are got per along track segment. Each point of the flight is routed (by
+    its time) to the interpolators of the segment it lies in, the tracks of the segments are then stitched together.
+    It has the same quadrivariate_many method as Interpolators so a mission flies through it in the same way.
+
+    Segments are flown in sequence, lazily built interpolators are only built when their segment is flown and are
+    unloaded again once it has been flown (unless the next segment shares them or a registry manages their memory), so
+    only the interpolators of one segment are held at a time.
+
+    Parameters
+    ----------
+    starts: np.ndarray
+        time each segment starts, in the order they are flown
+    segments: list[Interpolators]
+        interpolators of each segment
+    """
+    starts: np.ndarray
+    segments: list[Interpolators]
+
+    @classmethod
+    def from_segments(cls, segments: list[WorldSegment], interpolators: list[Interpolators]) -> "SegmentedInterpolators":
+        starts = np.array([np.datetime64(segment.flight_extent.time_start) for segment in segments],
+                          dtype="datetime64[ns]")
+        return cls(starts=starts, segments=interpolators)
+
+    def route(self, time: np.ndarray) -> np.ndarray:
+        """
+        Finds the segment of each point of a flight, points before the first segment or after the last are routed to
+        the first or last segment
+
+        Args:
+            time: times of the flight
+
+        Returns:
+            index of the segment of each point
+        """
+        index = np.searchsorted(self.starts, np.asarray(time, dtype="datetime64[ns]"), side="right") - 1
+        return np.clip(index, 0, len(self.segments) - 1)
+
+    def quadrivariate_many(self, keys: list[str], coords: dict) -> dict[str, np.ndarray]:
+        """
+        Interpolates several variables on to the same set of points, each point using the interpolators of its segment
+
+        Args:
+            keys: interpolator keys of the variables
+            coords: dictionary of longitude, latitude, depth and time arrays
+
+        Returns:
+            dictionary of key and interpolated values, keys without an interpolator in any segment are left out. Points
+            in segments without an interpolator for a key are NaN
+        """
+        index = self.route(time=coords["time"])
+        tracks = {}
+        for i, interpolators in enumerate(self.segments):
+            selected = index == i
+            if not np.any(selected):
+                continue
+            segment_tracks = interpolators.quadrivariate_many(keys=keys,
+                                                              coords={dim: np.asarray(values)[selected]
+                                                                      for dim, values in coords.items()})
+            for key, track in segment_tracks.items():
+                if key not in tracks:
+                    tracks[key] = np.full(index.shape, np.nan, dtype=np.result_type(track.dtype, np.float32))
+                tracks[key][selected] = track
+            self.__release(index=i)
+        return tracks
+
+    def __release(self, index: int) -> None:
+        """
+        unloads the lazily built interpolators of a segment that has been flown
+        """
+        interpolators = self.segments[index]
+        if interpolators.registry is not None:
+            return
+        following = self.segments[index + 1].interpolator if index + 1 < len(self.segments) else {}
+        for key, interpolator in interpolators.interpolator.items():
+            if following.get(key) is not interpolator:
+                interpolators.unload(key)
@@ -0,0 +1,170 @@
+# Copyright 2025 National Oceanography Centre
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#  http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+from itertools import product
+import numpy as np
+import xarray as xr
+from attrs import frozen
+
+# degrees in a circle of longitude
+LONGITUDE_PERIOD = 360.0
+# tolerance of the axis comparisons, the default of a pyinterp axis
+AXIS_EPSILON = 1e-6
+
+
+def grid_signature(data_array: xr.DataArray) -> str:
+    """
+    Creates a signature of the grid a world variable is on, variables with the same signature can share stencils
+
+    Args:
+        data_array: world variable on 1D dimension coordinates
+
+    Returns:
+        hex digest of the dimension names and coordinate values
+
+    """
+    signature = hashlib.sha256()
+    for dim in data_array.dims:
+        values = np.asarray(data_array[dim].values)
+        signature.update(dim.encode())
+        signature.update(str(values.dtype).encode())
+        signature.update(np.ascontiguousarray(values).tobytes())
+    return signature.hexdigest()
+
+
+def _axis_stencil(axis: np.ndarray, points: np.ndarray,
+                  period: float | None = None) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    finds the lower and upper index and linear weight of the upper index for each point along a monotonic axis, points
+    outside the axis are flagged as invalid. Points on a periodic axis (i.e. longitude) are compared within the period
+    starting at the first value of the axis, and if the axis is a whole circle points between its last and first value
+    are interpolated across the seam.
+    """
+    if axis.size > 1 and axis[-1] < axis[0]:
+        # descending axes are searched as ascending ones
+        axis = -axis
+        points = -points
+    if period is not None:
+        points = axis[0] + np.mod(points - axis[0], period)
+    if axis.size == 1:
+        index = np.zeros(points.size, dtype=np.intp)
+        return index, index, np.zeros(points.size), points == axis[0]
+    lower = np.clip(np.searchsorted(axis, points, side='right') - 1, 0, axis.size - 2)
+    upper = lower + 1
+    weight = (points - axis[lower]) / (axis[upper] - axis[lower])
+    valid = (points >= axis[0]) & (points <= axis[-1])
+    if period is not None and _circle(axis=axis, period=period):
+        seam = points > axis[-1]
+        lower[seam] = axis.size - 1
+        upper[seam] = 0
+        weight[seam] = (points[seam] - axis[-1]) / (axis[0] + period - axis[-1])
+        valid |= seam
+    return lower, upper, weight, valid
+
+
+def _circle(axis: np.ndarray, period: float) -> bool:
+    """
+    checks whether an ascending axis goes all the way round its period, with the same test a pyinterp axis uses: a
+    regular axis has to fit the period a whole number of steps, an irregular one must not leave a gap between its last
+    and first value larger than its mean step
+    """
+    steps = np.diff(axis)
+    step = (axis[-1] - axis[0]) / (axis.size - 1)
+    if np.all(np.abs(steps - steps[0]) <= AXIS_EPSILON):
+        return bool(abs(axis.size * step - period) <= AXIS_EPSILON * period)
+    return bool(period - (axis[-1] - axis[0]) <= step + AXIS_EPSILON)
+
+
+@frozen
+class Stencil:
+    """
+    Quadrilinear interpolation stencil of a set of points on a regular 4D grid: the lower index and weight of the
+    points along each dimension. It is computed once per grid and applied to every variable on that grid, so flying
+    a mission costs a cell lookup per grid rather than per variable. Interpolation is bilinear horizontally and linear
+    in depth and time, the same as a geodetic pyinterp Grid4D, points outside the grid are NaN. Longitude wraps round
+    global grids, so points between the last and first longitude are interpolated across the seam.
+
+    Attributes
+    ----------
+    dims: tuple
+        dimension names of the grid, in the order of the arrays the stencil is applied to
+    lower: tuple
+        lower index of each point along each dimension
+    upper: tuple
+        upper index of each point along each dimension, the first index for points across the seam of a global grid
+    weight: tuple
+        weight of the upper index of each point along each dimension
+    valid: np.ndarray
+        points that are within the grid
+    """
+    dims: tuple
+    lower: tuple
+    upper: tuple
+    weight: tuple
+    valid: np.ndarray
+
+    @classmethod
+    def from_grid(cls, data_array: xr.DataArray, coords: dict) -> "Stencil":
+        """
+        Creates the stencil of a set of points on the grid of a world variable
+
+        Args:
+            data_array: world variable with time, depth, latitude and longitude dimension coordinates
+            coords: dictionary of longitude, latitude, depth and time arrays
+
+        Returns:
+            Stencil object
+
+        """
+        lower = []
+        upper = []
+        weight = []
+        valid = None
+        for dim in data_array.dims:
+            axis = np.asarray(data_array[dim].values)
+            points = np.asarray(coords[dim])
+            if dim == "time":
+                axis = axis.astype('datetime64[ns]').astype(np.int64).astype(np.float64)
+                points = points.astype('datetime64[ns]').astype(np.int64).astype(np.float64)
+            else:
+                axis = axis.astype(np.float64)
+                points = points.astype(np.float64)
+            dim_lower, dim_upper, dim_weight, dim_valid = _axis_stencil(
+                axis=axis, points=points, period=LONGITUDE_PERIOD if dim == "longitude" else None)
+            lower.append(dim_lower)
+            upper.append(dim_upper)
+            weight.append(dim_weight)
+            valid = dim_valid if valid is None else valid & dim_valid
+        return cls(dims=tuple(data_array.dims), lower=tuple(lower), upper=tuple(upper), weight=tuple(weight),
+                   valid=valid)
+
+    def apply(self, values: np.ndarray) -> np.ndarray:
+        """
+        Interpolates a variable on to the points of the stencil
+
+        Args:
+            values: variable values with the dimensions of the stencil's grid
+
+        Returns:
+            interpolated values, NaN outside the grid or if any surrounding value is missing
+
+        """
+        result = np.zeros(self.valid.size, dtype=np.float64)
+        for offsets in product((0, 1), repeat=len(self.dims)):
+            corner_weight = np.ones(self.valid.size, dtype=np.float64)
+            index = []
+            for dim, offset in enumerate(offsets):
+                corner_weight *= self.weight[dim] if offset else 1.0 - self.weight[dim]
+                index.append(self.upper[dim] if offset else self.lower[dim])
+            result += corner_weight * values[tuple(index)]
+        result[~self.valid] = np.nan
+        return result
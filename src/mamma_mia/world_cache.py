@@ -0,0 +1,342 @@
+# Copyright 2025 National Oceanography Centre
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#  http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import json
+import time
+import socket
+import threading
+from contextlib import contextmanager
+import numpy as np
+from attrs import define, field
+from loguru import logger
+from mamma_mia.worlds import WorldExtent
+from mamma_mia.download import store_complete, store_size, remove_store, store_locked
+from mamma_mia.locks import FileLock
+
+# name of the index file kept in each world cache directory
+INDEX_FILE = "index.json"
+# worlds are downloaded concurrently, index updates are read-modify-write so they are serialised between threads and
+# (with a lock file next to the index) between processes
+INDEX_LOCK = threading.Lock()
+# seconds after which a pin that has not been refreshed is expired, pins are refreshed by the process that holds them
+# while it is running so a pin made on another host sharing the cache (whose process can't be checked) still expires
+# once that host's campaign is gone
+PIN_TTL = 3600.0
+
+
+@define
+class WorldCacheIndex:
+    """
+    Index of the worlds downloaded into a cache directory, recording the extent and variables of each store. A request
+    for a world that lies entirely within a cached store is served from that store (interpolators slice it down to the
+    extent they need) so only requests that are not covered go to the network.
+
+    The index also records the size and last access of each store so the cache can be kept within a disk budget, the
+    least recently used stores are evicted first. Stores pinned by a running process (e.g. the worlds of an active
+    campaign) are never evicted. A pin records the host and process that made it and is refreshed while that process
+    is running, it is released when the process exits on this host or when it hasn't been refreshed for PIN_TTL seconds.
+
+    Parameters
+    ----------
+    cache_dir: str
+        directory the worlds are downloaded into
+    max_size: int, optional
+        disk budget of the cache in bytes, None for an unbounded cache
+
+    Attributes
+    ----------
+    hits: int
+        number of worlds served from the cache
+    misses: int
+        number of worlds that had to be downloaded
+    """
+    cache_dir: str
+    max_size: int | None = None
+    hits: int = 0
+    misses: int = 0
+    _heartbeat: threading.Thread | None = field(default=None, init=False, repr=False)
+
+    @property
+    def index_file(self) -> str:
+        return os.path.join(self.cache_dir, INDEX_FILE)
+
+    @contextmanager
+    def __lock(self):
+        """
+        serialises updates of the index between the threads and processes sharing the cache
+        """
+        with INDEX_LOCK, FileLock(path=f"{self.index_file}.lock"):
+            yield
+
+    def entries(self) -> list[dict]:
+        """
+        Returns:
+            list of cached worlds, stores that no longer exist or are incomplete are left out
+        """
+        if not os.path.exists(self.index_file):
+            return []
+        with open(self.index_file, "r") as f:
+            entries = json.load(f)["entries"]
+        return [entry for entry in entries if store_complete(entry["path"], time_start=entry["extent"]["time_start"],
+                                                             time_end=entry["extent"]["time_end"])]
+
+    def find(self, data_id: str, extent: WorldExtent, variables: list[str] | None = None) -> str | None:
+        """
+        Finds a cached store that covers a request
+
+        Args:
+            data_id: data id of the world
+            extent: extent that is requested
+            variables: variables that are requested, None if the store needs every variable of the world
+
+        Returns:
+            path of the smallest covering store, or None if no store covers the request
+
+        """
+        covering = []
+        for entry in self.entries():
+            if entry["data_id"] != data_id:
+                continue
+            if variables is None and not entry["all_variables"]:
+                continue
+            if variables is not None and not set(variables) <= set(entry["variables"]):
+                continue
+            if _covers(cached=entry["extent"], requested=extent):
+                covering.append(entry)
+        if not covering:
+            return None
+        best = min(covering, key=lambda entry: _extent_area(entry["extent"]))
+        logger.info(f"world {data_id} is covered by cached store {best['path']}")
+        return best["path"]
+
+    def record_hit(self, path: str) -> None:
+        """
+        Records that a world has been served from a cached store, marking the store as most recently used
+
+        Args:
+            path: location of the store
+
+        """
+        with self.__lock():
+            self.hits += 1
+            self.__update(path=path, last_access=time.time())
+
+    def record_miss(self) -> None:
+        """
+        Records that a world was not cached and has to be downloaded
+        """
+        with INDEX_LOCK:
+            self.misses += 1
+
+    def pin(self, path: str) -> None:
+        """
+        Pins a store so it is not evicted while this process is running
+
+        Args:
+            path: location of the store
+
+        """
+        with self.__lock():
+            entry = next((entry for entry in self.entries() if entry["path"] == path), None)
+            if entry is None:
+                return
+            self.__update(path=path, pins=_repinned(entry))
+        logger.debug(f"pinned world store {path}")
+        if self._heartbeat is None or not self._heartbeat.is_alive():
+            self._heartbeat = threading.Thread(target=self.__beat, daemon=True)
+            self._heartbeat.start()
+
+    def __beat(self) -> None:
+        """
+        refreshes the pins of this process while it is running, stops once the process has no pins left
+        """
+        while True:
+            time.sleep(PIN_TTL / 4)
+            with self.__lock():
+                entries = self.entries()
+                pinned = False
+                for entry in entries:
+                    if any(_is_own(pin) for pin in entry.get("pins", [])):
+                        entry["pins"] = _repinned(entry)
+                        pinned = True
+                if not pinned:
+                    return
+                self.__write(entries=entries)
+
+    def add(self, data_id: str, path: str, extent: WorldExtent, variables: list[str], all_variables: bool) -> None:
+        """
+        Adds a downloaded store to the index
+
+        Args:
+            data_id: data id of the world
+            path: location of the store
+            extent: extent the store was downloaded for
+            variables: variables in the store
+            all_variables: whether the store holds every variable of the world
+
+        """
+        with self.__lock():
+            self.__add(data_id=data_id, path=path, extent=extent, variables=variables, all_variables=all_variables)
+        logger.info(f"added {path} to world cache index")
+
+    def __add(self, data_id: str, path: str, extent: WorldExtent, variables: list[str], all_variables: bool) -> None:
+        entries = [entry for entry in self.entries() if entry["path"] != path]
+        entries.append({"data_id": data_id,
+                        "path": path,
+                        "extent": {"lat_max": float(extent.lat_max),
+                                   "lat_min": float(extent.lat_min),
+                                   "lon_max": float(extent.lon_max),
+                                   "lon_min": float(extent.lon_min),
+                                   "depth_max": float(extent.depth_max),
+                                   "depth_min": float(extent.depth_min),
+                                   "time_start": str(extent.time_start),
+                                   "time_end": str(extent.time_end)},
+                        "variables": sorted(variables),
+                        "all_variables": all_variables,
+                        "size": store_size(path),
+                        "last_access": time.time(),
+                        "pins": [],
+                        })
+        self.__write(entries=entries)
+
+    def __update(self, path: str, **values) -> None:
+        """
+        updates the fields of the entry of a store, stores that are not indexed are ignored
+        """
+        entries = self.entries()
+        for entry in entries:
+            if entry["path"] == path:
+                entry.update(values)
+                self.__write(entries=entries)
+                return
+
+    def __write(self, entries: list[dict]) -> None:
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # write to a temporary file first so a reader never sees a partially written index
+        tmp_file = f"{self.index_file}.tmp-{os.getpid()}"
+        with open(tmp_file, "w") as f:
+            json.dump({"entries": entries}, f, indent=1)
+        os.replace(tmp_file, self.index_file)
+
+    def size(self) -> int:
+        """
+        Returns:
+            total size of the indexed stores in bytes
+        """
+        return sum(entry.get("size", 0) for entry in self.entries())
+
+    def evict(self) -> None:
+        """
+        Removes least recently used stores that are not pinned or being downloaded until the cache is within its disk
+        budget
+        """
+        if self.max_size is None:
+            return
+        with self.__lock():
+            entries = sorted(self.entries(), key=lambda entry: entry.get("last_access", 0.0))
+            total = sum(entry.get("size", 0) for entry in entries)
+            kept = []
+            for entry in entries:
+                if (total <= self.max_size or _live_pins(entry) or
+                        store_locked(entry["path"])):
+                    kept.append(entry)
+                    continue
+                remove_store(entry["path"])
+                total -= entry.get("size", 0)
+                logger.info(f"evicted {entry['path']} from world cache")
+            self.__write(entries=kept)
+        if total > self.max_size:
+            logger.warning(f"world cache {self.cache_dir} is {total} bytes, over its budget of {self.max_size} bytes, "
+                           f"the remaining stores are in use")
+
+    def stats(self) -> dict:
+        """
+        Returns:
+            dictionary of cache hits, misses, hit rate, number of stores and size in bytes
+        """
+        requests = self.hits + self.misses
+        entries = self.entries()
+        return {"hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / requests if requests else 0.0,
+                "stores": len(entries),
+                "size": sum(entry.get("size", 0) for entry in entries),
+                }
+
+
+def _covers(cached: dict, requested: WorldExtent) -> bool:
+    """
+    checks whether a cached extent covers a requested extent
+    """
+    return (cached["lat_min"] <= requested.lat_min and cached["lat_max"] >= requested.lat_max and
+            cached["lon_min"] <= requested.lon_min and cached["lon_max"] >= requested.lon_max and
+            cached["depth_min"] <= requested.depth_min and cached["depth_max"] >= requested.depth_max and
+            np.datetime64(cached["time_start"]) <= np.datetime64(requested.time_start) and
+            np.datetime64(cached["time_end"]) >= np.datetime64(requested.time_end))
+
+
+def _own_pin() -> dict:
+    """
+    pin of this process
+    """
+    return {"host": socket.gethostname(), "pid": os.getpid(), "time": time.time()}
+
+
+def _is_own(pin) -> bool:
+    """
+    checks whether a pin was made by this process
+    """
+    return isinstance(pin, dict) and pin["host"] == socket.gethostname() and pin["pid"] == os.getpid()
+
+
+def _repinned(entry: dict) -> list[dict]:
+    """
+    live pins of an index entry with the pin of this process added or refreshed
+    """
+    return [pin for pin in _live_pins(entry) if not _is_own(pin)] + [_own_pin()]
+
+
+def _live_pins(entry: dict) -> list[dict]:
+    """
+    pins of an index entry that are still held, a pin expires when it hasn't been refreshed for PIN_TTL seconds and a
+    pin made on this host is released as soon as its process exits (processes on other hosts can't be checked)
+    """
+    live = []
+    for pin in entry.get("pins", []):
+        # pins written before the host was recorded can't be checked
+        if not isinstance(pin, dict) or time.time() - pin["time"] > PIN_TTL:
+            continue
+        if pin["host"] == socket.gethostname() and not _alive(pin["pid"]):
+            continue
+        live.append(pin)
+    return live
+
+
+def _alive(pid: int) -> bool:
+    """
+    checks whether the process that pinned a store is still running
+    """
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # the process exists but belongs to another user
+        return True
+    return True
+
+
+def _extent_area(extent: dict) -> float:
+    """
+    horizontal area of a cached extent in degrees squared, used to pick the smallest covering store
+    """
+    return (extent["lat_max"] - extent["lat_min"]) * (extent["lon_max"] - extent["lon_min"])
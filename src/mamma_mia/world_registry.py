@@ -0,0 +1,365 @@
+# Copyright 2025 National Oceanography Centre
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#  http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import dataclasses
+import numpy as np
+from attrs import define, field, evolve
+from loguru import logger
+from mamma_mia.catalog import Cats
+from mamma_mia.fetcher import WorldFetcher
+from functools import partial
+from mamma_mia.get_worlds import get_world, open_world
+from mamma_mia.world_cache import WorldCacheIndex
+from mamma_mia.interpolator import Interpolators
+from mamma_mia.worlds import MatchedWorld, WorldExtent, SourceConfig, SourceType, WorldsConf, WorldsAttributes
+
+# missions only share a download if its merged extent is at most this many times the size of their separate extents
+MAX_MERGE_OVERHEAD = 1.5
+
+
+def extent_volume(extent: WorldExtent) -> float:
+    """
+    Size of an extent in degrees squared, metres and days, used to compare how much data downloads of different
+    extents of the same world would transfer
+
+    Args:
+        extent: extent of a world
+
+    Returns:
+        volume of the extent
+
+    """
+    days = (np.datetime64(extent.time_end) - np.datetime64(extent.time_start)) / np.timedelta64(1, 'D')
+    return (float(extent.lat_max - extent.lat_min) * float(extent.lon_max - extent.lon_min) *
+            float(extent.depth_max - extent.depth_min) * max(float(days), 1.0))
+
+
+def pad_time(extent: WorldExtent, flight_extent: WorldExtent, world: MatchedWorld) -> WorldExtent:
+    """
+    Narrows the time range of an extent to the flight padded by the field interval of a world (see FieldType.padding)
+    rather than the fixed padding worlds are matched with, rounded out to whole days. The result is never wider than
+    the extent the world was matched for.
+
+    Args:
+        extent: extent the world was matched for
+        flight_extent: extent of the flight
+        world: matched world
+
+    Returns:
+        WorldExtent with the padded time range of the flight
+    """
+    padding = world.field_type.field_type.padding
+    start = (np.datetime64(flight_extent.time_start) - padding).astype("datetime64[D]")
+    end = (np.datetime64(flight_extent.time_end) + padding).astype("datetime64[D]") + np.timedelta64(1, 'D')
+    start = max(start, np.datetime64(extent.time_start).astype("datetime64[D]"))
+    end = min(end, np.datetime64(extent.time_end).astype("datetime64[D]"))
+    return evolve(extent, time_start=str(start), time_end=str(end))
+
+
+def bracket_depth(extent: WorldExtent, flight_extent: WorldExtent, world: MatchedWorld) -> WorldExtent:
+    """
+    Narrows the depth range of an extent to the depth levels of a world that bracket the flight, i.e. the levels
+    within its depth range plus one level above and one below. The bounds are set halfway to the neighbouring levels
+    so exactly these levels are selected whatever the rounding of the level values. Worlds without depth levels in
+    their catalog metadata keep the extent they were matched for.
+
+    Args:
+        extent: extent the world was matched for
+        flight_extent: extent of the flight
+        world: matched world
+
+    Returns:
+        WorldExtent with the depth range of the levels bracketing the flight
+    """
+    if not world.depth_levels:
+        return extent
+    levels = np.unique(np.asarray(world.depth_levels, dtype=np.float64))
+    first = max(int(np.searchsorted(levels, flight_extent.depth_min, side="right")) - 1, 0)
+    last = min(int(np.searchsorted(levels, flight_extent.depth_max, side="left")), levels.size - 1)
+    depth_min = 0.0 if first == 0 else float((levels[first - 1] + levels[first]) / 2)
+    depth_max = float((levels[last] + levels[last + 1]) / 2) if last + 1 < levels.size else float(levels[last]) + 1.0
+    return evolve(extent, depth_min=round(depth_min, 3), depth_max=round(depth_max, 3))
+
+
+def merge_extents(first: WorldExtent | None, second: WorldExtent | None) -> WorldExtent | None:
+    """
+    Merges two extents into the smallest extent that covers both
+
+    Args:
+        first: extent to merge, None is ignored
+        second: extent to merge, None is ignored
+
+    Returns:
+        WorldExtent covering both extents
+
+    """
+    if first is None:
+        return second
+    if second is None:
+        return first
+    # keep the original time strings so download requests and store names are formatted as they would be for one mission
+    time_start = min(first.time_start, second.time_start, key=np.datetime64)
+    time_end = max(first.time_end, second.time_end, key=np.datetime64)
+    return WorldExtent(lat_max=max(first.lat_max, second.lat_max),
+                       lat_min=min(first.lat_min, second.lat_min),
+                       lon_max=max(first.lon_max, second.lon_max),
+                       lon_min=min(first.lon_min, second.lon_min),
+                       time_start=time_start,
+                       time_end=time_end,
+                       depth_max=max(first.depth_max, second.depth_max),
+                       depth_min=min(first.depth_min, second.depth_min))
+
+
+@define
+class RegisteredWorld:
+    """
+    A matched world that is shared between the missions of a campaign
+
+    Attributes
+    ----------
+    key: str
+        catalog key of the world
+    world: MatchedWorld
+        matched world with the variables of every mission that uses it
+    source: SourceConfig
+        source of the world
+    extent: WorldExtent
+        merged extent of every mission that uses the world
+    flight_extent: WorldExtent
+        merged flight extent of every mission that uses the world
+    missions: dict
+        name of each mission that uses the world and the key it uses for it
+    parents: set
+        missions the world is used by, a mission whose worlds are got per segment registers each segment under its own
+        name but they all have the mission as their parent
+    volume: float
+        summed volume of the separate extents of every mission that uses the world
+    store: str
+        location of the world once it has been got
+    opened: object
+        opened world, shared by every mission
+    """
+    key: str
+    world: MatchedWorld
+    source: SourceConfig
+    extent: WorldExtent
+    flight_extent: WorldExtent | None = None
+    missions: dict = field(factory=dict)
+    parents: set = field(factory=set)
+    volume: float = 0.0
+    store: str | None = None
+    opened: object = None
+
+
+@define
+class WorldRegistry:
+    """
+    Campaign wide registry of matched worlds. Missions that match the same world (same source and data id) share a
+    single entry with their merged extent, so the world is downloaded once, opened once and its interpolators are
+    built once and handed to every mission that needs them. Missions that are far apart (i.e. the merged extent would
+    be more than MAX_MERGE_OVERHEAD times the size of their separate extents) get separate entries of the same world.
+    The segments of a mission are never merged with each other, they are split so each is got and built on its own.
+
+    Attributes
+    ----------
+    entries: dict
+        registered worlds keyed by world id and entry number
+    assignments: dict
+        entry key of each mission's world keyed by mission name and world id
+    """
+    entries: dict = field(factory=dict)
+    assignments: dict = field(factory=dict)
+
+    @staticmethod
+    def world_id(world: MatchedWorld, source: SourceConfig) -> tuple:
+        """
+        identity of a world, missions with the same world id share it
+        """
+        return source.source_type, world.data_id, world.local_dir
+
+    def register(self, mission: str, worlds: WorldsConf, source: SourceConfig,
+                 flight_extent: WorldExtent | None = None, parent: str | None = None) -> None:
+        """
+        Registers the matched worlds of a mission, the time range of each world is narrowed to the flight padded by
+        the field interval of the world and its depth range to the depth levels bracketing the flight
+
+        Args:
+            mission: name of the mission
+            worlds: worlds of the mission with its matched worlds and extent
+            source: source of the mission's worlds
+            flight_extent: extent of the mission's flight
+            parent: mission a segment belongs to, None if the mission isn't split into segments
+
+        """
+        if parent is None:
+            parent = mission
+        for key, world in worlds.attributes.matched_worlds.items():
+            extent = worlds.attributes.extent
+            if flight_extent is not None:
+                extent = pad_time(extent=extent, flight_extent=flight_extent, world=world)
+                extent = bracket_depth(extent=extent, flight_extent=flight_extent, world=world)
+            volume = extent_volume(extent)
+            world_id = self.world_id(world=world, source=source)
+            entry_key = self.__plan(world_id=world_id, extent=extent, volume=volume, parent=parent)
+            if entry_key not in self.entries:
+                self.entries[entry_key] = RegisteredWorld(key=key, world=world, source=source,
+                                                          extent=extent, flight_extent=flight_extent)
+            else:
+                entry = self.entries[entry_key]
+                # the shared world needs the variables and extent of every mission. A variable is built once under the
+                # parameter key it was first registered with, missions that map it to another parameter take it under
+                # their own key (see build_interpolators)
+                for var, alias in world.variable_alias.items():
+                    if entry.world.variable_alias.get(var, alias) != alias:
+                        logger.info(f"mission {mission} maps {var} of world {world.data_id} to {alias} rather than "
+                                    f"{entry.world.variable_alias[var]}, it will be shared under both")
+                entry.world = evolve(entry.world,
+                                     variable_alias={**world.variable_alias, **entry.world.variable_alias},
+                                     alternative_parameter={**(entry.world.alternative_parameter or {}),
+                                                            **(world.alternative_parameter or {})})
+                entry.extent = merge_extents(entry.extent, extent)
+                entry.flight_extent = merge_extents(entry.flight_extent, flight_extent)
+                logger.info(f"mission {mission} shares world {world.data_id} with {list(entry.missions.keys())}")
+            self.entries[entry_key].missions[mission] = key
+            self.entries[entry_key].parents.add(parent)
+            self.entries[entry_key].volume += volume
+            self.assignments[mission, world_id] = entry_key
+
+    def __plan(self, world_id: tuple, extent: WorldExtent, volume: float, parent: str) -> tuple:
+        """
+        picks the entry of a world a mission extent is merged into, the entry that grows the least as long as the merge
+        isn't wasteful, otherwise a new entry. Entries holding another segment of the same mission are left out so the
+        split of the mission isn't undone.
+        """
+        best = None
+        best_growth = None
+        count = 0
+        for entry_key, entry in self.entries.items():
+            if entry_key[0] != world_id:
+                continue
+            count += 1
+            if parent in entry.parents:
+                continue
+            merged_volume = extent_volume(merge_extents(entry.extent, extent))
+            if merged_volume > MAX_MERGE_OVERHEAD * (entry.volume + volume):
+                continue
+            growth = merged_volume - extent_volume(entry.extent)
+            if best is None or growth < best_growth:
+                best = entry_key
+                best_growth = growth
+        if best is None:
+            return world_id, count
+        return best
+
+    def plan(self) -> dict:
+        """
+        Returns:
+            dictionary of each download (data id and entry number) and the missions it is shared by
+        """
+        return {(entry.world.data_id, entry_key[1]): list(entry.missions.keys())
+                for entry_key, entry in self.entries.items()}
+
+    def get_worlds(self, cat: Cats, fetcher: WorldFetcher = None,
+                   caches: dict[SourceType, WorldCacheIndex] = None) -> None:
+        """
+        Gets (downloading if needed) and opens every registered world once for its merged extent, cached stores that
+        are used are pinned so they are not evicted while the campaign is running
+
+        Args:
+            cat: initialised Cats object that contains all the source data available to download
+            fetcher: optional fetcher to get the worlds with, worlds are got concurrently by default
+            caches: optional world cache index of each source type
+
+        """
+        if caches is None:
+            caches = {}
+        if fetcher is None:
+            fetcher = WorldFetcher()
+        logger.info(f"getting {len(self.entries)} worlds for {len(self.assignments)} mission worlds")
+        requests = {}
+        for entry_key, entry in self.entries.items():
+            if entry.store is None:
+                logger.info(f"getting world {entry.world.data_id} for missions {list(entry.missions.keys())}")
+                requests[entry_key] = partial(get_world, cat=cat, key=entry.key, value=entry.world,
+                                              extent=entry.extent, source=entry.source,
+                                              cache=caches.get(entry.source.source_type))
+        for entry_key, store in fetcher.fetch(requests).items():
+            entry = self.entries[entry_key]
+            entry.store = store
+            entry.opened = open_world(store=store, source=entry.source)
+            if entry.source.source_type in caches:
+                caches[entry.source.source_type].pin(store)
+
+    def assign(self, mission: str, worlds: WorldsConf) -> None:
+        """
+        Hands the registered worlds to a mission
+
+        Args:
+            mission: name of the mission
+            worlds: worlds of the mission, its stores and opened worlds are set
+
+        """
+        for entry in self.entries.values():
+            if mission in entry.missions:
+                key = entry.missions[mission]
+                worlds.stores[key] = entry.store
+                worlds.worlds[key] = entry.opened
+
+    def build_interpolators(self, interpolators: dict[str, Interpolators], worlds: dict[str, WorldsConf]) -> None:
+        """
+        Builds the interpolators of every registered world once and hands them to each mission using it. Missions are
+        grouped by their interpolator settings (see Interpolators.build_settings), each group gets its own build so
+        no mission's interpolators are built or managed with the settings of another.
+
+        Args:
+            interpolators: interpolators of each mission
+            worlds: worlds of each mission, interpolators are handed over in the order of its matched worlds
+
+        """
+        builders = {}
+        for entry_key, entry in self.entries.items():
+            groups = {}
+            for mission in entry.missions:
+                interpol = interpolators[mission]
+                groups.setdefault(interpol.build_settings(), []).append(mission)
+            for settings, missions in groups.items():
+                template = interpolators[missions[0]]
+                # every mission of the group has the same settings (cache, engine, workers etc.), the builder takes them
+                # but has its own interpolators
+                builder = dataclasses.replace(template, interpolator={}, grids={}, owners={}, aliases={})
+                shared_worlds = WorldsConf(attributes=WorldsAttributes(extent=entry.extent,
+                                                                       interpolator_priorities={},
+                                                                       matched_worlds={entry.key: entry.world}),
+                                           worlds={entry.key: entry.opened},
+                                           stores={entry.key: entry.store})
+                logger.info(f"building interpolators of world {entry.world.data_id} for missions {missions}")
+                builder.build(worlds=shared_worlds, mission=missions[0], source_type=entry.source.source_type,
+                              flight_extent=entry.flight_extent)
+                builders[entry_key, settings] = builder, missions[0]
+        for mission, interpol in interpolators.items():
+            for world in worlds[mission].attributes.matched_worlds.values():
+                entry_key = self.__entry_key(mission=mission, world=world)
+                builder, built_for = builders[entry_key, interpol.build_settings()]
+                # each variable is taken under the mission's own parameter key from the key it was built under
+                built_aliases = self.entries[entry_key].world.variable_alias
+                keys = {alias: built_aliases.get(var, alias) for var, alias in world.variable_alias.items()}
+                interpol.share(builder=builder, keys=keys)
+                if interpol.registry is not None:
+                    # the interpolators are registered under the mission they were built for, they are only released
+                    # once every mission sharing them has been flown
+                    for built_key in keys.values():
+                        interpol.registry.share(mission=built_for, key=built_key, consumer=mission)
+
+    def __entry_key(self, mission: str, world: MatchedWorld) -> tuple:
+        for (assigned_mission, world_id), entry_key in self.assignments.items():
+            if assigned_mission == mission and world_id[1:] == (world.data_id, world.local_dir):
+                return entry_key
+        raise KeyError(mission)
@@ -9,10 +9,11 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from attrs import frozen, define
+from attrs import frozen, define, field
 from loguru import logger
 from enum import Enum
 import os
+import numpy as np
 
 class ResolutionType(Enum):
     """
@@ -79,6 +80,24 @@ class SourceType(Enum):
             case _:
                 raise ValueError(f"unknown source type {enum_string}")
 
+class Precision(Enum):
+    """
+    Precision enumeration: this determines the floating point precision worlds, interpolators and payloads are held in.
+    Single precision halves their memory, its rounding error is at most 2**-24 (~6e-8) of the magnitude of the values
+    being interpolated, e.g. ~2e-6 degC for a 30 degC temperature, which is well below any sensor resolution.
+    """
+    FLOAT64 = "float64"
+    FLOAT32 = "float32"
+    @classmethod
+    def from_string(cls,enum_string:str) -> "Precision":
+        match enum_string:
+            case "float64" | "FLOAT64" | "double":
+                return Precision.FLOAT64
+            case "float32" | "FLOAT32" | "single":
+                return Precision.FLOAT32
+            case _:
+                raise ValueError(f"unknown precision {enum_string}")
+
 @frozen
 class SourceConfig:
     """
@@ -113,6 +132,36 @@ class FieldType(Enum):
     five_day_mean = "P5D-m"
     monthly_mean = "P1M-m"
     annual_mean = "P1A-m"
+
+    @property
+    def interval(self) -> np.timedelta64:
+        """
+        time between the fields of the world
+        """
+        match self:
+            case FieldType.one_hour_instant:
+                return np.timedelta64(1, 'h')
+            case FieldType.six_hour_instant | FieldType.six_hour_mean:
+                return np.timedelta64(6, 'h')
+            case FieldType.daily_mean:
+                return np.timedelta64(1, 'D')
+            case FieldType.five_day_mean:
+                return np.timedelta64(5, 'D')
+            case FieldType.monthly_mean:
+                return np.timedelta64(31, 'D')
+            case FieldType.annual_mean:
+                return np.timedelta64(366, 'D')
+
+    @property
+    def padding(self) -> np.timedelta64:
+        """
+        time a world needs either side of a flight so every point of it is bracketed by fields, one interval for
+        instantaneous fields and two for means as their time stamp can be anywhere within the averaging period
+        """
+        if self.value.endswith("-i"):
+            return self.interval
+        return 2 * self.interval
+
     @classmethod
     def from_string(cls,enum_string:str) -> "FieldType":
         match enum_string:
@@ -229,12 +278,23 @@ class WorldExtent:
     time_start: str
     time_end: str
     depth_max: float
+    depth_min: float = 0.0
+
+@frozen
+class WorldSegment:
+    """
+    Along track segment of a trajectory, downloaded with its own padded extent rather than one bounding box of the
+    whole trajectory
+    """
+    extent: WorldExtent
+    flight_extent: WorldExtent
 
 @define
 class WorldsAttributes:
     extent: WorldExtent
     interpolator_priorities: dict
     matched_worlds: dict
+    segments: list[WorldSegment] = field(factory=list)
 
 @define
 class WorldsConf:
@@ -257,6 +317,8 @@ class MatchedWorld:
     field_type: FieldTypeWithRank
     variable_alias: dict
     local_dir: str = None
+    # depth levels of the world from its catalog metadata, None if the catalog doesn't list them
+    depth_levels: tuple[float, ...] | None = None
 
     def __attrs_post_init__(self):
         # TODO add some validation here
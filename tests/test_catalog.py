@@ -0,0 +1,218 @@
+# Copyright 2025 National Oceanography Centre
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#  http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+import numpy as np
+import pytest
+from mamma_mia import catalog
+from mamma_mia.catalog import Cats
+from mamma_mia.catalog_cache import CmemsCatalog, load_cmems_catalog, save_cmems_catalog, CATALOG_TTL, MsmCatalog, \
+    MsmItem, load_msm_catalog, save_msm_catalog
+from mamma_mia.worlds import SourceType, WorldExtent
+
+
+def cmems_catalogue() -> SimpleNamespace:
+    """
+    catalogue as returned by copernicusmarine.describe, with a model and an observation product
+    """
+    coordinates = [SimpleNamespace(coordinate_id="time", values=[0, 3600, 7200], minimum_value=None,
+                                   maximum_value=None),
+                   SimpleNamespace(coordinate_id="depth", values=[0.5, 10.0], minimum_value=None, maximum_value=None),
+                   SimpleNamespace(coordinate_id="latitude", values=None, minimum_value=-80.0, maximum_value=90.0)]
+    variables = [SimpleNamespace(short_name=name, bbox=[-180.0, -80.0, 180.0, 90.0], coordinates=coordinates)
+                 for name in ["thetao", "so", "uo"]]
+    services = [SimpleNamespace(service_format="arco-time-series", variables=[]),
+                SimpleNamespace(service_format="zarr", variables=variables)]
+    dataset = SimpleNamespace(dataset_id="cmems_mod_glo_phy_anfc_0.083deg_PT1H-m",
+                              versions=[SimpleNamespace(parts=[SimpleNamespace(services=services)])])
+    return SimpleNamespace(products=[SimpleNamespace(sources=["Numerical models"], datasets=[dataset]),
+                                     SimpleNamespace(sources=["In situ observations"], datasets=[dataset])])
+
+
+@pytest.fixture
+def describes(monkeypatch) -> list:
+    """
+    records every time the cmems catalogue is fetched
+    """
+    calls = []
+
+    def describe(**kwargs):
+        calls.append(kwargs)
+        return cmems_catalogue()
+
+    monkeypatch.setattr(catalog, "describe", describe)
+    return calls
+
+
+def use_inventory(monkeypatch, source_names: list[str]) -> None:
+    entries = {name: SimpleNamespace(source_names=[name]) for name in source_names}
+    monkeypatch.setattr(catalog, "inventory", SimpleNamespace(parameters=SimpleNamespace(entries=entries)))
+
+
+def test_cmems_catalog_round_trip(tmp_path):
+    cmems_cat = CmemsCatalog.from_catalogue(catalogue=cmems_catalogue(), source_names={"thetao", "so"})
+    assert len(cmems_cat.products) == 1
+    variables = cmems_cat.products[0].datasets[0].versions[0].parts[0].services[0].variables
+    assert [variable.short_name for variable in variables] == ["thetao", "so"]
+    # only the time and depth coordinates are kept, time as its first and last value
+    time_coordinate, depth_coordinate = variables[0].coordinates
+    assert (time_coordinate.minimum_value, time_coordinate.maximum_value, time_coordinate.values) == (0, 7200, None)
+    assert depth_coordinate.values == [0.5, 10.0]
+    path = str(tmp_path / "cmems_catalog.json.gz")
+    save_cmems_catalog(catalog=cmems_cat, path=path)
+    assert load_cmems_catalog(path=path) == cmems_cat
+
+
+def test_cmems_catalog_expires(tmp_path):
+    path = str(tmp_path / "cmems_catalog.json.gz")
+    save_cmems_catalog(catalog=CmemsCatalog.from_catalogue(catalogue=cmems_catalogue(), source_names={"thetao"}),
+                       path=path)
+    stale = time.time() - 2 * CATALOG_TTL
+    os.utime(path, (stale, stale))
+    assert load_cmems_catalog(path=path) is None
+    assert load_cmems_catalog(path=path, ttl=None) is not None
+
+
+def test_cmems_catalog_is_refetched_for_another_inventory(tmp_path, monkeypatch, describes):
+    cmems_file = str(tmp_path / "cmems_catalog.json.gz")
+    use_inventory(monkeypatch=monkeypatch, source_names=["thetao"])
+    Cats(cmems_file=cmems_file).init_catalog(source_type=SourceType.CMEMS)
+    Cats(cmems_file=cmems_file).init_catalog(source_type=SourceType.CMEMS)
+    assert len(describes) == 1
+    # an inventory with another parameter can't be matched against the catalog cached for the first one
+    use_inventory(monkeypatch=monkeypatch, source_names=["thetao", "so"])
+    cats = Cats(cmems_file=cmems_file)
+    cats.init_catalog(source_type=SourceType.CMEMS)
+    assert len(describes) == 2
+    variables = cats.cmems_cat.products[0].datasets[0].versions[0].parts[0].services[0].variables
+    assert [variable.short_name for variable in variables] == ["thetao", "so"]
+
+
+def test_offline_cmems_catalog(tmp_path, monkeypatch, describes):
+    cmems_file = str(tmp_path / "cmems_catalog.json.gz")
+    use_inventory(monkeypatch=monkeypatch, source_names=["thetao"])
+    with pytest.raises(FileNotFoundError):
+        Cats(cmems_file=cmems_file, offline=True).init_catalog(source_type=SourceType.CMEMS)
+    Cats(cmems_file=cmems_file).init_catalog(source_type=SourceType.CMEMS)
+    # offline the cached catalog is used however old it is, and even if it was made for another inventory
+    stale = time.time() - 2 * CATALOG_TTL
+    os.utime(cmems_file, (stale, stale))
+    use_inventory(monkeypatch=monkeypatch, source_names=["thetao", "so"])
+    cats = Cats(cmems_file=cmems_file, offline=True)
+    cats.init_catalog(source_type=SourceType.CMEMS)
+    assert len(describes) == 1
+    assert cats.cmems_cat is not None
+
+
+def msm_items() -> list[SimpleNamespace]:
+    """
+    stac items of the msm catalog, a global item with depth levels and a regional one without an end time
+    """
+    return [SimpleNamespace(id="eorca025_P1M-m", bbox=[-180.0, -90.0, 180.0, 90.0],
+                            properties={"start_datetime": "1976-01-01T00:00:00Z",
+                                        "end_datetime": "2024-12-31T00:00:00Z", "variables": ["thetao", "so"],
+                                        "operation_frequency": "P1M-m",
+                                        "cube:dimensions": {"deptht": {"values": [0.5, 10.0, 50.0]}}}),
+            SimpleNamespace(id="amm_P1D-m", bbox=[-20.0, 40.0, 10.0, 65.0],
+                            properties={"start_datetime": "2000-01-01T00:00:00Z", "variables": ["thetao"],
+                                        "operation_frequency": "P1D-m"})]
+
+
+@pytest.fixture
+def msm_server(monkeypatch) -> SimpleNamespace:
+    """
+    stands in for the msm catalog server, recording every connection made to it
+    """
+    server = SimpleNamespace(items=msm_items(), last_update="2025-01-01T00:00:00", connections=0)
+
+    def connect(catalog_name: str) -> SimpleNamespace:
+        server.connections += 1
+        return SimpleNamespace(search=lambda collection: None, Items=list(server.items),
+                               Catalog=SimpleNamespace(extra_fields={"last_update": server.last_update}))
+
+    monkeypatch.setattr(catalog, "OceanDataCatalog", connect)
+    return server
+
+
+def test_msm_catalog_round_trip(tmp_path, msm_server):
+    msm_cat = MsmCatalog.from_catalog(catalog=catalog.OceanDataCatalog(catalog_name="msm"))
+    path = str(tmp_path / "msm_catalog.npz")
+    save_msm_catalog(catalog=msm_cat, path=path)
+    loaded = load_msm_catalog(path=path)
+    assert len(loaded) == 2
+    assert loaded.last_update == "2025-01-01T00:00:00"
+    assert loaded.item(index=0) == MsmItem(id="eorca025_P1M-m", bbox=[-180.0, -90.0, 180.0, 90.0],
+                                           start_datetime=np.datetime64("1976-01-01T00:00:00"),
+                                           end_datetime=np.datetime64("2024-12-31T00:00:00"),
+                                           variables=["thetao", "so"], operation_frequency="P1M-m",
+                                           depth_levels=(0.5, 10.0, 50.0))
+    assert loaded.item(index=1).depth_levels is None
+    # an item without an end time never matches
+    extent = WorldExtent(lat_max=51.0, lat_min=50.0, lon_max=-19.0, lon_min=-20.0, time_start="2023-01-01",
+                         time_end="2023-01-20", depth_max=100.0)
+    assert [item.id for item in loaded.search(extent=extent)] == ["eorca025_P1M-m"]
+
+
+def test_msm_catalog_is_only_refetched_when_the_server_changes(tmp_path, msm_server):
+    msm_file = str(tmp_path / "msm_catalog.npz")
+    Cats(msm_file=msm_file).init_catalog(source_type=SourceType.MSM)
+    Cats(msm_file=msm_file).init_catalog(source_type=SourceType.MSM)
+    assert msm_server.connections == 1
+    # a stale catalog is checked against the server, it is kept if the server catalog hasn't been updated
+    stale = time.time() - 2 * CATALOG_TTL
+    os.utime(msm_file, (stale, stale))
+    Cats(msm_file=msm_file).init_catalog(source_type=SourceType.MSM)
+    assert msm_server.connections == 2
+    assert time.time() - os.path.getmtime(msm_file) < CATALOG_TTL
+    os.utime(msm_file, (stale, stale))
+    msm_server.items = msm_items()[:1]
+    msm_server.last_update = "2025-02-01T00:00:00"
+    cats = Cats(msm_file=msm_file)
+    cats.init_catalog(source_type=SourceType.MSM)
+    assert len(cats.msm_cat) == 1
+    assert len(load_msm_catalog(path=msm_file)) == 1
+
+
+def test_offline_msm_catalog(tmp_path, msm_server):
+    msm_file = str(tmp_path / "msm_catalog.npz")
+    with pytest.raises(FileNotFoundError):
+        Cats(msm_file=msm_file, offline=True).init_catalog(source_type=SourceType.MSM)
+    Cats(msm_file=msm_file).init_catalog(source_type=SourceType.MSM)
+    stale = time.time() - 2 * CATALOG_TTL
+    os.utime(msm_file, (stale, stale))
+    cats = Cats(msm_file=msm_file, offline=True)
+    cats.init_catalog(source_type=SourceType.MSM)
+    assert len(cats.msm_cat) == 2
+    assert msm_server.connections == 1
+    with pytest.raises(ConnectionError):
+        cats.msm_datastore()
+
+
+def test_catalogs_are_initialised_once(tmp_path, monkeypatch, describes, msm_server):
+    use_inventory(monkeypatch=monkeypatch, source_names=["thetao"])
+    cats = Cats(cmems_file=str(tmp_path / "cmems_catalog.json.gz"), msm_file=str(tmp_path / "msm_catalog.npz"))
+    # every mission of a campaign asks for the catalogs of its sources, concurrently
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        for future in [executor.submit(cats.init_catalogs, source_types=[SourceType.CMEMS, SourceType.MSM])
+                       for _ in range(8)]:
+            future.result()
+    assert (len(describes), msm_server.connections) == (1, 1)
+    cmems_cat, msm_cat = cats.cmems_cat, cats.msm_cat
+    cats.init_catalog(source_type=SourceType.CMEMS)
+    assert cats.cmems_cat is cmems_cat
+    # a refresh fetches the catalogs again even though they are cached and fresh
+    cats.init_catalogs(source_types=[SourceType.CMEMS, SourceType.MSM], refresh=True)
+    assert (len(describes), msm_server.connections) == (2, 2)
+    assert cats.cmems_cat is not cmems_cat
+    assert cats.msm_cat is not msm_cat
@@ -0,0 +1,82 @@
+# Copyright 2025 National Oceanography Centre
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#  http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+import pyinterp.backends.xarray
+from mamma_mia.chunked import ChunkedGrid4D
+
+
+@pytest.fixture
+def world(tmp_path) -> xr.DataArray:
+    """
+    lazily opened world in chunks of 2 time steps, every depth level and 10 by 10 grid cells
+    """
+    rng = np.random.default_rng(0)
+    store = str(tmp_path / "world.zarr")
+    xr.Dataset({"thetao": (("time", "depth", "latitude", "longitude"), rng.random((4, 4, 20, 20)))},
+               coords={"time": pd.date_range("2023-01-01", periods=4), "depth": [0.0, 10.0, 20.0, 50.0],
+                       "latitude": xr.Variable("latitude", np.arange(40.0, 60.0), {"units": "degrees_north"}),
+                       "longitude": xr.Variable("longitude", np.arange(-20.0, 0.0), {"units": "degrees_east"})}
+               ).to_zarr(store, mode="w", encoding={"thetao": {"chunks": (2, 4, 10, 10)}})
+    return xr.open_zarr(store)["thetao"]
+
+
+def flight(latitude: np.ndarray, longitude: np.ndarray) -> dict:
+    return {"longitude": longitude, "latitude": latitude, "depth": np.full(latitude.size, 15.0),
+            "time": np.full(latitude.size, np.datetime64("2023-01-01T12:00:00", "ns"))}
+
+
+class TileGrid:
+    """
+    stands in for the pyinterp grid of a tile, checking every point it is queried for is bracketed by the tile
+    """
+    loaded = []
+
+    def __init__(self, data_array: xr.DataArray, geodetic: bool):
+        self.data_array = data_array
+        TileGrid.loaded.append(data_array)
+
+    def quadrivariate(self, coords: dict) -> np.ndarray:
+        for dim, values in coords.items():
+            axis = self.data_array[dim].values
+            assert np.all((axis[0] <= values) & (values <= axis[-1]))
+        return np.zeros(len(coords["time"]))
+
+
+def test_only_the_tiles_flown_through_are_loaded(world, monkeypatch):
+    monkeypatch.setattr(pyinterp.backends.xarray, "Grid4D", TileGrid)
+    monkeypatch.setattr(TileGrid, "loaded", [])
+    # a tile is a chunk and a halo of one grid cell, so points between two chunks are bracketed by the first
+    tile_nbytes = 2 * 4 * 11 * 11 * 8
+    grid = ChunkedGrid4D(data_array=world, cache_size=tile_nbytes)
+    grid.quadrivariate(flight(latitude=np.array([41.5, 45.0, 49.5]), longitude=np.array([-18.5, -15.0, -10.5])))
+    assert [dict(tile.sizes) for tile in TileGrid.loaded] == [{"time": 3, "depth": 4, "latitude": 11, "longitude": 11}]
+    assert grid.tiles_size == 3 * 4 * 11 * 11 * 8
+    # the next tile takes the grid over budget, so the first is evicted
+    grid.quadrivariate(flight(latitude=np.array([50.5, 55.0]), longitude=np.array([-18.5, -15.0])))
+    assert len(TileGrid.loaded) == 2
+    assert list(grid.tiles.keys()) == [(0, 0, 1, 0)]
+    assert TileGrid.loaded[1]["latitude"].values.tolist() == list(np.arange(49.0, 60.0))
+
+
+def test_matches_grid4d(world):
+    rng = np.random.default_rng(1)
+    size = 1000
+    days = rng.uniform(0.0, 3.0, size)
+    coords = {"longitude": rng.uniform(-19.0, -1.0, size), "latitude": rng.uniform(41.0, 59.0, size),
+              "depth": rng.uniform(0.0, 50.0, size),
+              "time": np.datetime64("2023-01-01", "ns") + (days * 86400e9).astype("timedelta64[ns]")}
+    expected = pyinterp.backends.xarray.Grid4D(world.load(), geodetic=True).quadrivariate(coords)
+    grid = ChunkedGrid4D(data_array=world, cache_size=0)
+    np.testing.assert_allclose(grid.quadrivariate(coords), expected)
@@ -0,0 +1,59 @@
+# Copyright 2025 National Oceanography Centre
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#  http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import numpy as np
+import pytest
+import xarray as xr
+from mamma_mia.curvilinear import CurvilinearGrid4D
+
+TIME = np.array(["2023-01-01", "2023-01-02", "2023-01-03"], dtype="datetime64[ns]")
+DEPTH = np.array([0.0, 10.0, 50.0, 100.0])
+
+
+def linear_field(lat, lon, depth, time) -> np.ndarray:
+    days = (np.asarray(time, dtype="datetime64[ns]") - TIME[0]) / np.timedelta64(1, "D")
+    return 2.0 * lon - 3.0 * lat + 0.05 * depth + 0.5 * days
+
+
+@pytest.fixture
+def grid() -> CurvilinearGrid4D:
+    """
+    skewed and stretched grid so its cells aren't parallelograms
+    """
+    y, x = np.meshgrid(np.arange(20.0), np.arange(25.0), indexing="ij")
+    lon = -20.0 + 0.25 * x + 0.05 * y + 0.002 * x * y
+    lat = 45.0 + 0.2 * y - 0.04 * x + 0.001 * x ** 2
+    values = linear_field(lat=lat[None, None], lon=lon[None, None], depth=DEPTH[None, :, None, None],
+                          time=TIME[:, None, None, None])
+    ds = xr.Dataset({"thetao": (("time", "depth", "y", "x"), values),
+                     "nav_lat": (("y", "x"), lat),
+                     "nav_lon": (("y", "x"), lon)},
+                    coords={"time": TIME, "depth": DEPTH})
+    return CurvilinearGrid4D.from_dataset(ds=ds, var="thetao", lat="nav_lat", lon="nav_lon")
+
+
+def test_linear_field_is_exact(grid):
+    rng = np.random.default_rng(0)
+    lon = rng.uniform(-18.0, -16.0, 200)
+    lat = rng.uniform(46.0, 48.0, 200)
+    depth = rng.uniform(0.0, 100.0, 200)
+    time = TIME[0] + (rng.uniform(0.0, 2.0, 200) * 86400e9).astype("timedelta64[ns]")
+    values = grid.quadrivariate({"longitude": lon, "latitude": lat, "depth": depth, "time": time})
+    np.testing.assert_allclose(values, linear_field(lat=lat, lon=lon, depth=depth, time=time), atol=1e-8)
+
+
+def test_outside_grid_is_nan(grid):
+    values = grid.quadrivariate({"longitude": np.array([-17.0, -30.0]),
+                                 "latitude": np.array([47.0, 47.0]),
+                                 "depth": np.array([5.0, 5.0]),
+                                 "time": TIME[[1, 1]]})
+    assert np.isfinite(values[0])
+    assert np.isnan(values[1])
@@ -0,0 +1,133 @@
+# Copyright 2025 National Oceanography Centre
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#  http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+from mamma_mia.download import write_resumable, store_complete, _read_manifest
+
+
+@pytest.fixture
+def source(tmp_path) -> str:
+    """
+    chunked store standing in for a remote world, its chunks don't line up with the subsets taken from it
+    """
+    rng = np.random.default_rng(0)
+    ds = xr.Dataset({"thetao": (("time", "depth", "y", "x"), rng.random((30, 12, 15, 15))),
+                     "nav_lat": (("y", "x"), rng.random((15, 15)))},
+                    coords={"time": np.arange(30), "depth": np.arange(12.0)})
+    store = str(tmp_path / "source.zarr")
+    ds.to_zarr(store, mode="w", encoding={"thetao": {"chunks": (10, 5, 8, 8)}, "nav_lat": {"chunks": (8, 8)}})
+    return store
+
+
+def interrupt_after(monkeypatch, regions: int) -> None:
+    """
+    makes the write of a region fail once the given number of regions have been written
+    """
+    to_zarr = xr.Dataset.to_zarr
+    written = []
+
+    def failing_to_zarr(self, *args, **kwargs):
+        if "region" in kwargs:
+            if len(written) == regions:
+                raise OSError("connection lost")
+            written.append(kwargs["region"])
+        return to_zarr(self, *args, **kwargs)
+
+    monkeypatch.setattr(xr.Dataset, "to_zarr", failing_to_zarr)
+
+
+def test_resume_unaligned_subset(source, tmp_path, monkeypatch):
+    ds = xr.open_zarr(source).isel(time=slice(3, 25), y=slice(5, 20), x=slice(5, 20)).drop_encoding()
+    store = str(tmp_path / "world.zarr")
+    # a slab of 7 time steps doesn't line up with the source chunks either
+    max_slab_bytes = 7 * 12 * 10 * 10 * 8
+    with monkeypatch.context() as m:
+        interrupt_after(monkeypatch=m, regions=1)
+        with pytest.raises(OSError):
+            write_resumable(ds=ds, store=store, max_slab_bytes=max_slab_bytes)
+    assert not store_complete(store)
+    assert len(_read_manifest(store)["written"]) == 2
+    write_resumable(ds=ds, store=store, max_slab_bytes=max_slab_bytes)
+    assert store_complete(store)
+    xr.testing.assert_identical(xr.open_zarr(store).load(), ds.load())
+
+
+
+def test_slabs_are_bounded(source, tmp_path, monkeypatch):
+    ds = xr.open_zarr(source).drop_encoding()
+    store = str(tmp_path / "world.zarr")
+    to_zarr = xr.Dataset.to_zarr
+    regions = []
+
+    def recording_to_zarr(self, *args, **kwargs):
+        if "region" in kwargs:
+            regions.append((kwargs["region"]["time"], self.nbytes))
+        return to_zarr(self, *args, **kwargs)
+
+    monkeypatch.setattr(xr.Dataset, "to_zarr", recording_to_zarr)
+    # the source chunks are 10 time steps, a slab of 4 time steps is all that fits
+    step_bytes = 12 * 15 * 15 * 8
+    write_resumable(ds=ds, store=store, max_slab_bytes=4 * step_bytes + 100)
+    assert [(region.start, region.stop) for region, _ in regions] == [(0, 4), (4, 8), (8, 12), (12, 16), (16, 20),
+                                                                      (20, 24), (24, 28), (28, 30)]
+    assert all(nbytes <= 4 * step_bytes + 100 for _, nbytes in regions)
+    xr.testing.assert_identical(xr.open_zarr(store).load(), ds.load())
+
+
+def test_depth_subset(source, tmp_path):
+    # msm worlds are cut to the depth levels of the flight, which leaves a partial leading depth chunk
+    ds = xr.open_zarr(source).rename(depth="deptht").sel(deptht=slice(3.0, 9.0)).drop_encoding()
+    store = str(tmp_path / "world.zarr")
+    write_resumable(ds=ds, store=store)
+    assert store_complete(store)
+    xr.testing.assert_identical(xr.open_zarr(store).load(), ds.load())
+
+
+def legacy_world() -> xr.Dataset:
+    """
+    daily world with chunks of 2 days, partly land so some of its chunks are never written
+    """
+    values = np.random.default_rng(0).random((10, 4, 4))
+    values[:, :2, :2] = np.nan
+    return xr.Dataset({"thetao": (("time", "y", "x"), values)},
+                      coords={"time": pd.date_range("2023-01-01", periods=10)}).chunk(time=2, y=2, x=2)
+
+
+def test_legacy_store_is_validated(tmp_path):
+    # stores written in one go before manifests existed
+    store = str(tmp_path / "world.zarr")
+    legacy_world().to_zarr(store)
+    assert not store_complete(store, time_start="2024-01-01", time_end="2024-01-10")
+    assert store_complete(store, time_start="2023-01-01", time_end="2023-01-10")
+    assert _read_manifest(store)["complete"]
+
+
+def test_partial_legacy_store_is_downloaded_again(tmp_path, monkeypatch):
+    # the metadata and time coordinates are written before the data, so a failed download leaves them behind
+    store = str(tmp_path / "world.zarr")
+    ds = legacy_world()
+
+    def lose_connection(block, block_info=None):
+        if block_info[0]["chunk-location"][0] == 3:
+            raise OSError("connection lost")
+        return block
+
+    failing = ds.copy()
+    failing["thetao"] = ds["thetao"].copy(data=ds["thetao"].data.map_blocks(lose_connection, dtype=float))
+    with pytest.raises(OSError):
+        failing.to_zarr(store)
+    assert not store_complete(store, time_start="2023-01-01", time_end="2023-01-10")
+    write_resumable(ds=ds, store=store)
+    assert store_complete(store, time_start="2023-01-01", time_end="2023-01-10")
+    xr.testing.assert_identical(xr.open_zarr(store).load(), ds.load())
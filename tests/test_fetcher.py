@@ -0,0 +1,87 @@
+# Copyright 2025 National Oceanography Centre
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#  http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+import threading
+from functools import partial
+import pytest
+from mamma_mia import fetcher
+from mamma_mia.exceptions import UnknownSourceKey
+from mamma_mia.fetcher import WorldFetcher
+
+
+@pytest.fixture
+def waits(monkeypatch) -> list:
+    """
+    records the backoff waits instead of sleeping
+    """
+    waited = []
+    monkeypatch.setattr(fetcher.time, "sleep", waited.append)
+    return waited
+
+
+def failing(failures: int, error: Exception = ConnectionError("connection lost")):
+    """
+    request that fails the given number of times before it succeeds
+    """
+    attempts = []
+
+    def request():
+        attempts.append(len(attempts))
+        if len(attempts) <= failures:
+            raise error
+        return "store.zarr"
+
+    request.attempts = attempts
+    return request
+
+
+def test_failed_download_is_retried_with_backoff(waits):
+    request = failing(failures=2)
+    assert WorldFetcher(retries=3, backoff=2.0).fetch({"world": request}) == {"world": "store.zarr"}
+    assert len(request.attempts) == 3
+    assert waits == [2.0, 4.0]
+
+
+def test_error_is_raised_once_retries_are_used_up(waits):
+    request = failing(failures=4)
+    with pytest.raises(ConnectionError):
+        WorldFetcher(retries=3, backoff=1.0).fetch({"world": request})
+    assert len(request.attempts) == 4
+    assert waits == [1.0, 2.0, 4.0]
+
+
+def test_unknown_source_is_not_retried(waits):
+    request = failing(failures=1, error=UnknownSourceKey("unknown source"))
+    with pytest.raises(UnknownSourceKey):
+        WorldFetcher().fetch({"world": request})
+    assert len(request.attempts) == 1
+    assert waits == []
+
+
+def test_concurrent_downloads_are_limited():
+    lock = threading.Lock()
+    active = []
+    concurrent = []
+
+    def download(name: str) -> str:
+        with lock:
+            active.append(name)
+            concurrent.append(len(active))
+        time.sleep(0.05)
+        with lock:
+            active.remove(name)
+        return f"{name}.zarr"
+
+    requests = {f"world{i}": partial(download, f"world{i}") for i in range(10)}
+    results = WorldFetcher(max_concurrent=3).fetch(requests)
+    assert results == {name: f"{name}.zarr" for name in requests}
+    assert max(concurrent) == 3
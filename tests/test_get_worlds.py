@@ -0,0 +1,74 @@
+# Copyright 2025 National Oceanography Centre
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#  http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+from attrs import define, field
+from mamma_mia.get_worlds import get_world
+from mamma_mia.world_cache import WorldCacheIndex
+from mamma_mia.worlds import MatchedWorld, WorldExtent, SourceConfig, SourceType
+
+EXTENT = WorldExtent(lat_max=50.0, lat_min=45.0, lon_max=-10.0, lon_min=-20.0, time_start="2023-01-01",
+                     time_end="2023-01-10", depth_max=100.0)
+
+
+@define
+class MsmDatastore:
+    """
+    stands in for the msm OceanDataCatalog, recording the worlds opened from it
+    """
+    opened: list = field(factory=list)
+
+    def open_dataset(self, **kwargs) -> xr.Dataset:
+        self.opened.append(kwargs)
+        rng = np.random.default_rng(0)
+        dims = ("time_counter", "deptht", "y", "x")
+        return xr.Dataset({**{var: (dims, rng.random((10, 6, 8, 8))) for var in ["thetao", "so", "uo"]},
+                           "nav_lat": (("y", "x"), rng.random((8, 8))),
+                           "nav_lon": (("y", "x"), rng.random((8, 8)))},
+                          coords={"time_counter": pd.date_range("2023-01-01", periods=10),
+                                  "deptht": [0.5, 10.0, 50.0, 100.0, 200.0, 500.0]}
+                          ).chunk(time_counter=5, deptht=6, y=8, x=8)
+
+
+@define
+class MsmCats:
+    datastore: MsmDatastore = field(factory=MsmDatastore)
+
+    def msm_datastore(self) -> MsmDatastore:
+        return self.datastore
+
+
+def msm_world(variables: list[str]) -> MatchedWorld:
+    return MatchedWorld(data_id="msm_world", world_type=None, domain=None, dataset_name="world", resolution=None,
+                        alternative_parameter=None, field_type=None,
+                        variable_alias={var: var.upper() for var in variables})
+
+
+def test_only_matched_msm_variables_are_downloaded(tmp_path):
+    cat = MsmCats()
+    cache = WorldCacheIndex(cache_dir=str(tmp_path / "msm-data"), max_size=None)
+    source = SourceConfig(source_type=SourceType.MSM)
+    store = get_world(cat=cat, key="msm_key", value=msm_world(["thetao"]), extent=EXTENT, source=source, cache=cache)
+    # the grid variables without a time dimension are kept with the matched variables
+    assert sorted(xr.open_zarr(store).data_vars) == ["nav_lat", "nav_lon", "thetao"]
+    assert cache.find(data_id="msm_world", extent=EXTENT, variables=["thetao"]) == store
+    # a world with other variables is downloaded to its own store
+    other = get_world(cat=cat, key="msm_key", value=msm_world(["so", "thetao"]), extent=EXTENT, source=source,
+                      cache=cache)
+    assert other != store
+    assert sorted(xr.open_zarr(other).data_vars) == ["nav_lat", "nav_lon", "so", "thetao"]
+    assert len(cat.datastore.opened) == 2
+    # and a world with a subset of its variables is served from it
+    assert get_world(cat=cat, key="msm_key", value=msm_world(["so"]), extent=EXTENT, source=source,
+                     cache=cache) == other
+    assert len(cat.datastore.opened) == 2
@@ -0,0 +1,96 @@
+# Copyright 2025 National Oceanography Centre
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#  http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+from mamma_mia.worlds import MatchedWorld, WorldExtent, WorldsConf, WorldsAttributes, SourceType
+from mamma_mia.interpolator import Interpolators, bracket, subset_curvilinear, subset_rectilinear
+from mamma_mia.interpolator_cache import InterpolatorCache
+
+
+@pytest.mark.parametrize("use_processes", [False, True], ids=["threads", "processes"])
+def test_parallel_build_uses_cache(tmp_path, use_processes):
+    rng = np.random.default_rng(0)
+    store = str(tmp_path / "world.zarr")
+    xr.Dataset({var: (("time", "depth", "latitude", "longitude"), rng.random((3, 2, 6, 6))) for var in ["a", "b"]},
+               coords={"time": pd.date_range("2023-01-01", periods=3), "depth": [0.0, 10.0],
+                       "latitude": np.arange(6.0), "longitude": np.arange(6.0)}).to_zarr(store, mode="w")
+    world = MatchedWorld(data_id="world", world_type=None, domain=None, dataset_name="world", resolution=None,
+                         alternative_parameter=None, field_type=None, variable_alias={"a": "A", "b": "B"})
+    extent = WorldExtent(lat_max=4.0, lat_min=1.0, lon_max=4.0, lon_min=1.0, time_start="2023-01-01",
+                         time_end="2023-01-03", depth_max=10.0)
+    worlds = WorldsConf(attributes=WorldsAttributes(extent=extent, interpolator_priorities={},
+                                                    matched_worlds={"world": world}),
+                        worlds={"world": ["a", "b"]}, stores={"world": store})
+    cache = InterpolatorCache(cache_dir=str(tmp_path / "cache"))
+    for hits, misses in [(0, 2), (2, 2)]:
+        interpolators = Interpolators(cache=True, interpolator_cache=cache, max_workers=2,
+                                      use_processes=use_processes)
+        interpolators.build(worlds=worlds, mission="mission", source_type=SourceType.CMEMS)
+        # the stats of every worker thread (or process) are counted
+        assert (cache.hits, cache.misses) == (hits, misses)
+        # the grids memory map the cache entries the workers wrote rather than holding copies sent back from them
+        for _, data_array in interpolators.grids.values():
+            assert data_array.variable._data.filename.startswith(cache.cache_dir)
+
+
+FLIGHT = WorldExtent(lat_max=12.5, lat_min=10.2, lon_max=-3.1, lon_min=-6.5, time_start="2023-01-02T06:00:00",
+                     time_end="2023-01-03T12:00:00", depth_min=15.0, depth_max=40.0)
+
+
+@pytest.mark.parametrize("low, high, halo, expected", [(2.5, 4.0, 0, slice(2, 5)),
+                                                       (2.5, 4.5, 1, slice(1, 7)),
+                                                       (-1.0, 20.0, 2, slice(0, 10)),
+                                                       (3.0, 3.0, 0, slice(3, 5)),
+                                                       (9.0, 9.0, 0, slice(8, 10))])
+def test_bracket(low, high, halo, expected):
+    assert bracket(np.arange(10.0), low, high, halo=halo) == expected
+
+
+def test_subset_rectilinear():
+    data_array = xr.DataArray(np.zeros((5, 6, 20, 20)), dims=("time", "depth", "latitude", "longitude"),
+                              coords={"time": pd.date_range("2023-01-01", periods=5),
+                                      "depth": [0.0, 10.0, 20.0, 50.0, 100.0, 200.0],
+                                      "latitude": np.arange(0.0, 20.0), "longitude": np.arange(-10.0, 10.0)})
+    subset = subset_rectilinear(data_array=data_array, flight_extent=FLIGHT, halo=1)
+    # the values either side of the flight and a halo of one grid cell
+    assert subset["latitude"].values.tolist() == [9.0, 10.0, 11.0, 12.0, 13.0, 14.0]
+    assert subset["longitude"].values.tolist() == [-8.0, -7.0, -6.0, -5.0, -4.0, -3.0, -2.0]
+    # depth and time are bracketed without a halo
+    assert subset["depth"].values.tolist() == [10.0, 20.0, 50.0]
+    assert subset["time"].values.tolist() == pd.date_range("2023-01-02", periods=3).values.tolist()
+
+
+def test_subset_curvilinear():
+    # grid rotated by 30 degrees with a spacing of one degree
+    y, x = np.meshgrid(np.arange(40.0), np.arange(40.0), indexing="ij")
+    angle = np.radians(30.0)
+    ds = xr.Dataset({"nav_lat": (("y", "x"), x * np.sin(angle) + y * np.cos(angle)),
+                     "nav_lon": (("y", "x"), -20.0 + x * np.cos(angle) - y * np.sin(angle)),
+                     "thetao": (("time_counter", "y", "x"), np.zeros((5, 40, 40)))},
+                    coords={"time_counter": pd.date_range("2023-01-01", periods=5), "y": np.arange(40),
+                            "x": np.arange(40)})
+    subset = subset_curvilinear(ds=ds, lat="nav_lat", lon="nav_lon", flight_extent=FLIGHT, halo=1)
+    inside = ((ds["nav_lat"] >= FLIGHT.lat_min) & (ds["nav_lat"] <= FLIGHT.lat_max) &
+              (ds["nav_lon"] >= FLIGHT.lon_min) & (ds["nav_lon"] <= FLIGHT.lon_max))
+    y_index, x_index = np.nonzero(inside.values)
+    # every grid point within the flight is kept, with a halo of one grid cell
+    assert subset["y"].values.tolist() == list(range(y_index.min() - 1, y_index.max() + 2))
+    assert subset["x"].values.tolist() == list(range(x_index.min() - 1, x_index.max() + 2))
+    # a flight within a single grid cell keeps the cell around its closest grid point
+    point = WorldExtent(lat_max=10.31, lat_min=10.3, lon_max=-5.0, lon_min=-5.01, time_start="2023-01-02",
+                        time_end="2023-01-03", depth_max=10.0)
+    subset = subset_curvilinear(ds=ds, lat="nav_lat", lon="nav_lon", flight_extent=point, halo=0)
+    assert subset.sizes["y"] == 2 and subset.sizes["x"] == 2
+    distance = np.hypot(subset["nav_lat"] - 10.3, subset["nav_lon"] + 5.0)
+    assert float(distance.min()) < 1.0
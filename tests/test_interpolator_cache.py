@@ -0,0 +1,111 @@
+# Copyright 2025 National Oceanography Centre
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#  http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import numpy as np
+import pytest
+import xarray as xr
+from mamma_mia.interpolator_cache import InterpolatorCache
+from mamma_mia.worlds import MatchedWorld, WorldExtent, FieldTypeWithRank
+
+EXTENT = WorldExtent(lat_max=50.0, lat_min=45.0, lon_max=-10.0, lon_min=-20.0, time_start="2023-01-01",
+                     time_end="2023-01-10", depth_max=100.0)
+
+
+@pytest.fixture
+def world() -> MatchedWorld:
+    return MatchedWorld(data_id="cmems_mod_glo_phy_anfc_0.083deg_PT1H-m", world_type=None, domain=None,
+                        dataset_name="world", resolution=None, alternative_parameter=None,
+                        field_type=FieldTypeWithRank.from_string("PT1H-i"), variable_alias={"thetao": "TEMP"})
+
+
+def world_variable(size: int = 10) -> xr.DataArray:
+    return xr.DataArray(np.random.default_rng(0).random((size, size)), dims=("latitude", "longitude"), name="thetao",
+                        coords={"latitude": np.arange(float(size)), "longitude": np.arange(float(size))})
+
+
+def test_cached_files_are_evicted(tmp_path):
+    cache = InterpolatorCache(cache_dir=str(tmp_path / "cache"), max_size=None)
+    data_array = xr.DataArray(np.zeros((10, 10)), dims=("latitude", "longitude"), name="thetao",
+                              coords={"latitude": np.arange(10.0), "longitude": np.arange(10.0)})
+    cache.put(key="interpolator", data_array=data_array)
+    interpolator_size = cache.size()
+    weights_file = cache.file_path(kind="weights", name="grid.nc")
+    with open(weights_file, "wb") as f:
+        f.write(bytes(5000))
+    # the weights haven't been used since long before the interpolator was cached
+    os.utime(weights_file, (0, 0))
+    assert cache.size() == interpolator_size + 5000
+    cache.max_size = interpolator_size
+    cache.evict()
+    assert not cache.touch(path=weights_file)
+    assert cache.size() == interpolator_size
+    assert cache.get(key="interpolator") is not None
+
+
+def test_cache_key(world):
+    key = InterpolatorCache.cache_key(world=world, var="thetao", extent=EXTENT, settings={"method": "bilinear"})
+    assert key == InterpolatorCache.cache_key(world=world, var="thetao", extent=EXTENT,
+                                              settings={"method": "bilinear"})
+    # anything that goes into building the interpolator changes its key
+    wider = WorldExtent(lat_max=51.0, lat_min=45.0, lon_max=-10.0, lon_min=-20.0, time_start="2023-01-01",
+                        time_end="2023-01-10", depth_max=100.0)
+    assert key != InterpolatorCache.cache_key(world=world, var="thetao", extent=wider,
+                                              settings={"method": "bilinear"})
+    assert key != InterpolatorCache.cache_key(world=world, var="so", extent=EXTENT, settings={"method": "bilinear"})
+    assert key != InterpolatorCache.cache_key(world=world, var="thetao", extent=EXTENT, settings={"method": "nearest"})
+
+
+def test_least_recently_used_interpolator_is_evicted(tmp_path):
+    cache = InterpolatorCache(cache_dir=str(tmp_path / "cache"), max_size=None)
+    cache.put(key="first", data_array=world_variable())
+    entry_size = cache.size()
+    cache.put(key="second", data_array=world_variable())
+    for i, key in enumerate(["first", "second"]):
+        meta_file = os.path.join(cache.cache_dir, key, "meta.json")
+        os.utime(meta_file, (i, i))
+    # getting the first interpolator makes it the most recently used
+    assert cache.get(key="first") is not None
+    assert cache.get(key="missing") is None
+    cache.max_size = 2 * entry_size
+    cache.put(key="third", data_array=world_variable())
+    assert cache.get(key="second") is None
+    assert cache.get(key="first") is not None
+    assert cache.get(key="third") is not None
+    assert cache.stats()["hits"] == 3
+    assert cache.stats()["misses"] == 2
+    assert cache.size() == 2 * entry_size
+
+
+def test_entries_are_memory_mapped(tmp_path):
+    cache = InterpolatorCache(cache_dir=str(tmp_path / "cache"), max_size=None)
+    data_array = world_variable()
+    data_array.attrs = {"units": "degrees_C", "scale_factor": np.float32(0.5), "history": ["not", "serialisable"]}
+    data_array["longitude"].attrs = {"units": "degrees_east"}
+    cache.put(key="interpolator", data_array=data_array)
+    cached = cache.get(key="interpolator")
+    assert isinstance(cached.data, np.memmap)
+    xr.testing.assert_equal(cached, data_array)
+    assert cached.attrs == {"units": "degrees_C", "scale_factor": 0.5}
+    assert cached["longitude"].attrs == {"units": "degrees_east"}
+
+
+def test_partly_written_entries_are_ignored(tmp_path):
+    cache = InterpolatorCache(cache_dir=str(tmp_path / "cache"), max_size=0)
+    # another process is still writing the entry
+    tmp_entry = os.path.join(cache.cache_dir, "interpolator.tmp-1-1")
+    os.makedirs(tmp_entry)
+    with open(os.path.join(tmp_entry, "values.npy"), "wb") as f:
+        f.write(bytes(1000))
+    assert cache.get(key="interpolator") is None
+    assert cache.size() == 0
+    cache.evict()
+    assert os.path.isdir(tmp_entry)
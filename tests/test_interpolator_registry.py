@@ -0,0 +1,75 @@
+# Copyright 2025 National Oceanography Centre
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#  http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from functools import partial
+import numpy as np
+from attrs import define, field
+from mamma_mia.interpolator import LazyInterpolator
+from mamma_mia.interpolator_registry import InterpolatorRegistry
+
+
+@define
+class FakeInterpolators:
+    """
+    records the interpolators the registry unloads
+    """
+    unloaded: list = field(factory=list)
+
+    def unload(self, key: str) -> None:
+        self.unloaded.append(key)
+
+
+@define
+class TiledGrid:
+    """
+    interpolator that loads a tile of 100 bytes with every query, like a chunked interpolator
+    """
+    tiles_size: int = 0
+
+    def quadrivariate(self, coords: dict) -> np.ndarray:
+        self.tiles_size += 100
+        return np.zeros(len(coords["time"]))
+
+
+def test_shared_interpolator_is_released_by_its_last_consumer():
+    registry = InterpolatorRegistry()
+    builder = FakeInterpolators()
+    # TEMP is built once for missions a, b and c, b and c load their own SALT
+    registry.loaded(grid=np.zeros(10), interpolators=builder, mission="a", key="TEMP", world="world")
+    for mission in ["a", "b", "c"]:
+        registry.share(mission="a", key="TEMP", consumer=mission)
+    own = FakeInterpolators()
+    registry.loaded(grid=np.zeros(10), interpolators=own, mission="b", key="SALT", world="world")
+    registry.release(mission="a")
+    assert builder.unloaded == []
+    registry.release(mission="b")
+    assert builder.unloaded == []
+    assert own.unloaded == ["SALT"]
+    registry.release(mission="c")
+    assert builder.unloaded == ["TEMP"]
+    assert registry.resident == 0
+
+
+def test_chunked_interpolators_are_measured_as_they_load_tiles():
+    registry = InterpolatorRegistry(max_memory=250)
+    owners = {key: FakeInterpolators() for key in ["TEMP", "SALT"]}
+    lazy = {key: LazyInterpolator(key=key, loader=TiledGrid,
+                                  on_load=partial(registry.loaded, interpolators=owners[key], mission="a", key=key,
+                                                  world="world"))
+            for key in ["TEMP", "SALT"]}
+    coords = {"time": np.zeros(3)}
+    lazy["TEMP"].quadrivariate(coords)
+    lazy["TEMP"].quadrivariate(coords)
+    assert registry.resident == 200
+    # the tiles SALT loads take the campaign over budget, so TEMP is unloaded
+    lazy["SALT"].quadrivariate(coords)
+    assert owners["TEMP"].unloaded == ["TEMP"]
+    assert registry.resident == 100
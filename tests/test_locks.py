@@ -0,0 +1,52 @@
+# Copyright 2025 National Oceanography Centre
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#  http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import json
+import time
+import threading
+from mamma_mia.locks import FileLock
+
+
+def test_abandoned_lock_is_taken_over_once(tmp_path, monkeypatch):
+    path = str(tmp_path / "world.zarr.lock")
+    with open(path, "w") as f:
+        json.dump({"host": "other-host", "pid": 1, "time": 0.0}, f)
+    os.utime(path, (0, 0))
+    # waiters are slow to act on the holder they read, so both find the abandoned lock before either takes it over
+    holder = FileLock.holder
+
+    def slow_holder(self):
+        read = holder(self)
+        time.sleep(0.05)
+        return read
+
+    monkeypatch.setattr(FileLock, "holder", slow_holder)
+    barrier = threading.Barrier(2)
+    active = []
+    overlaps = []
+
+    def contend():
+        barrier.wait()
+        with FileLock(path=path, poll=0.01):
+            active.append(threading.get_ident())
+            overlaps.append(len(active))
+            time.sleep(0.2)
+            active.remove(threading.get_ident())
+
+    contenders = [threading.Thread(target=contend) for _ in range(2)]
+    for contender in contenders:
+        contender.start()
+    for contender in contenders:
+        contender.join()
+    assert overlaps == [1, 1]
+    assert not os.path.exists(path)
+    assert os.listdir(tmp_path) == []
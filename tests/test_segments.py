@@ -0,0 +1,97 @@
+# Copyright 2025 National Oceanography Centre
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#  http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import numpy as np
+from attrs import define, field
+from mamma_mia.segments import corridor_segments, SegmentedInterpolators, along_track_distance
+from mamma_mia.worlds import WorldExtent, WorldSegment
+
+
+@define
+class SegmentInterpolators:
+    """
+    stands in for the interpolators of a segment, every point is interpolated to the number of the segment
+    """
+    number: int
+    interpolator: dict = field(factory=dict)
+    registry: object = None
+    unloaded: list = field(factory=list)
+
+    def quadrivariate_many(self, keys: list[str], coords: dict) -> dict[str, np.ndarray]:
+        return {key: np.full(len(coords["time"]), float(self.number)) for key in keys if key in self.interpolator}
+
+    def unload(self, key: str) -> None:
+        self.unloaded.append(key)
+
+
+def diagonal_track(days: int = 10) -> dict:
+    """
+    hourly track heading north east at about 2.5 km an hour
+    """
+    time = np.arange("2023-01-01", np.datetime64("2023-01-01") + np.timedelta64(days, "D"), dtype="datetime64[h]")
+    return {"latitude": np.linspace(50.0, 51.5, time.size), "longitude": np.linspace(-20.0, -18.0, time.size),
+            "depth": np.tile(np.concatenate([np.linspace(0.0, 200.0, 12), np.linspace(200.0, 0.0, 12)]), days),
+            "time": time}
+
+
+def test_corridor_segments():
+    track = diagonal_track()
+    distance = along_track_distance(latitude=track["latitude"], longitude=track["longitude"])
+    segments = corridor_segments(**track, excess_space=0.1, extra_depth=50.0, time_padding=np.timedelta64(1, "D"),
+                                 segment_length=50.0)
+    assert len(segments) == int(np.ceil(distance[-1] / 50.0))
+    # neighbouring segments share the point between them, so every point is flown within a segment
+    assert segments[0].flight_extent.time_start == "2023-01-01T00:00:00"
+    assert segments[-1].flight_extent.time_end == "2023-01-10T23:00:00"
+    for segment, following in zip(segments[:-1], segments[1:]):
+        assert segment.flight_extent.time_end == following.flight_extent.time_start
+    for segment in segments:
+        flight, extent = segment.flight_extent, segment.extent
+        assert extent.lat_min < flight.lat_min and flight.lat_max < extent.lat_max
+        assert extent.lon_min < flight.lon_min and flight.lon_max < extent.lon_max
+        assert flight.depth_max < extent.depth_max
+        assert np.datetime64(extent.time_start) < np.datetime64(flight.time_start)
+        assert np.datetime64(extent.time_end) > np.datetime64(flight.time_end)
+    # the corridor is much smaller than the bounding box of the track
+    corridor = sum((segment.extent.lat_max - segment.extent.lat_min) * (segment.extent.lon_max - segment.extent.lon_min)
+                   for segment in segments)
+    assert corridor < 0.5 * (1.5 + 0.2) * (2.0 + 0.2)
+
+
+def test_segments_by_duration():
+    segments = corridor_segments(**diagonal_track(), excess_space=0.1, extra_depth=50.0,
+                                 time_padding=np.timedelta64(1, "D"), segment_duration=np.timedelta64(3, "D"))
+    assert [(segment.flight_extent.time_start, segment.flight_extent.time_end) for segment in segments] == [
+        ("2023-01-01T00:00:00", "2023-01-04T00:00:00"), ("2023-01-04T00:00:00", "2023-01-07T00:00:00"),
+        ("2023-01-07T00:00:00", "2023-01-10T00:00:00"), ("2023-01-10T00:00:00", "2023-01-10T23:00:00")]
+
+
+def test_points_are_routed_to_their_segment():
+    starts = ["2023-01-01", "2023-01-04", "2023-01-07"]
+    extents = [WorldExtent(lat_max=1.0, lat_min=0.0, lon_max=1.0, lon_min=0.0, time_start=start, time_end=start,
+                           depth_max=1.0) for start in starts]
+    shared = object()
+    segments = [SegmentInterpolators(number=0, interpolator={"TEMP": shared, "SALT": object()}),
+                SegmentInterpolators(number=1, interpolator={"TEMP": shared}),
+                SegmentInterpolators(number=2, interpolator={"TEMP": object(), "SALT": object()})]
+    interpolators = SegmentedInterpolators.from_segments(
+        segments=[WorldSegment(extent=extent, flight_extent=extent) for extent in extents], interpolators=segments)
+    time = np.array(["2022-12-31", "2023-01-01", "2023-01-03T23", "2023-01-04", "2023-01-08", "2023-02-01"],
+                    dtype="datetime64[ns]")
+    coords = {"longitude": np.zeros(time.size), "latitude": np.zeros(time.size), "depth": np.zeros(time.size),
+              "time": time}
+    tracks = interpolators.quadrivariate_many(keys=["TEMP", "SALT"], coords=coords)
+    # points before the first segment and after the last are routed to the first and last segments
+    np.testing.assert_array_equal(tracks["TEMP"], [0, 0, 0, 1, 2, 2])
+    # the second segment has no SALT interpolator
+    np.testing.assert_array_equal(tracks["SALT"], [0, 0, 0, np.nan, 2, 2])
+    # interpolators are unloaded once their segment has been flown, unless the next segment uses them
+    assert [segment.unloaded for segment in segments] == [["SALT"], ["TEMP"], ["TEMP", "SALT"]]
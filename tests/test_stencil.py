@@ -0,0 +1,43 @@
+# Copyright 2025 National Oceanography Centre
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#  http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+import pyinterp.backends.xarray
+from mamma_mia.stencil import Stencil
+
+
+@pytest.mark.parametrize("longitude", [np.arange(-180.0, 180.0, 2.5),
+                                       np.arange(0.0, 360.0, 2.5),
+                                       np.arange(-30.0, 30.1, 2.5),
+                                       np.arange(0.0, 350.1, 2.5)],
+                         ids=["global", "global_0_360", "regional", "almost_global"])
+def test_matches_grid4d(longitude):
+    rng = np.random.default_rng(0)
+    latitude = np.arange(-80.0, 81.0, 2.0)
+    data_array = xr.DataArray(rng.random((4, 3, latitude.size, longitude.size)),
+                              dims=("time", "depth", "latitude", "longitude"),
+                              coords={"time": pd.date_range("2023-01-01", periods=4), "depth": [0.0, 10.0, 50.0],
+                                      "latitude": xr.Variable("latitude", latitude, {"units": "degrees_north"}),
+                                      "longitude": xr.Variable("longitude", longitude, {"units": "degrees_east"})})
+    # points cover the seam of global grids and fall outside the grid in every dimension
+    size = 5000
+    days = rng.uniform(-0.5, 3.5, size)
+    coords = {"longitude": rng.uniform(-400.0, 400.0, size),
+              "latitude": rng.uniform(-85.0, 85.0, size),
+              "depth": rng.uniform(-5.0, 55.0, size),
+              "time": np.datetime64("2023-01-01", "ns") + (days * 86400e9).astype("timedelta64[ns]")}
+    expected = pyinterp.backends.xarray.Grid4D(data_array, geodetic=True).quadrivariate(coords)
+    values = Stencil.from_grid(data_array=data_array, coords=coords).apply(values=data_array.values)
+    np.testing.assert_array_equal(np.isnan(values), np.isnan(expected))
+    np.testing.assert_allclose(values, expected, atol=1e-10)
@@ -0,0 +1,151 @@
+# Copyright 2025 National Oceanography Centre
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#  http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import json
+import time
+import socket
+import subprocess
+import sys
+import pytest
+from mamma_mia.worlds import WorldExtent
+from mamma_mia.download import _write_manifest
+from mamma_mia.world_cache import WorldCacheIndex, PIN_TTL
+
+EXTENT = WorldExtent(lat_max=50.0, lat_min=45.0, lon_max=-10.0, lon_min=-20.0, time_start="2023-01-01",
+                     time_end="2023-01-10", depth_max=100.0)
+
+
+def add_store(cache: WorldCacheIndex, name: str, extent: WorldExtent, variables: list[str],
+              all_variables: bool = True, data_id: str = "world") -> str:
+    """
+    adds a complete store of 1000 bytes to the cache
+    """
+    store = os.path.join(cache.cache_dir, name)
+    os.makedirs(store)
+    with open(os.path.join(store, "values"), "wb") as f:
+        f.write(bytes(1000))
+    _write_manifest(store=store, manifest={"parts": ["static"], "written": ["static"], "complete": True})
+    cache.add(data_id=data_id, path=store, extent=extent, variables=variables, all_variables=all_variables)
+    return store
+
+
+@pytest.fixture
+def cache(tmp_path) -> WorldCacheIndex:
+    """
+    cache holding a single store, with a budget too small to keep it
+    """
+    cache = WorldCacheIndex(cache_dir=str(tmp_path / "worlds"), max_size=0)
+    add_store(cache=cache, name="world.zarr", extent=EXTENT, variables=["thetao"])
+    return cache
+
+
+def set_pins(cache: WorldCacheIndex, pins: list[dict]) -> None:
+    with open(cache.index_file, "r") as f:
+        index = json.load(f)
+    index["entries"][0]["pins"] = pins
+    with open(cache.index_file, "w") as f:
+        json.dump(index, f)
+
+
+def exited_pid() -> int:
+    process = subprocess.Popen([sys.executable, "-c", ""])
+    process.wait()
+    return process.pid
+
+
+def test_foreign_pin_is_kept_until_it_expires(cache):
+    # the pid of a process on another host can't be checked on this host
+    set_pins(cache=cache, pins=[{"host": "other-host", "pid": exited_pid(), "time": time.time()}])
+    cache.evict()
+    assert len(cache.entries()) == 1
+    set_pins(cache=cache, pins=[{"host": "other-host", "pid": os.getpid(), "time": time.time() - 2 * PIN_TTL}])
+    cache.evict()
+    assert cache.entries() == []
+
+
+def test_local_pins_are_released(cache):
+    set_pins(cache=cache, pins=[{"host": socket.gethostname(), "pid": exited_pid(), "time": time.time()}])
+    cache.evict()
+    assert cache.entries() == []
+
+
+def test_own_pin_is_kept(cache):
+    cache.pin(cache.entries()[0]["path"])
+    cache.evict()
+    assert len(cache.entries()) == 1
+
+
+def test_abandoned_download_lock_is_evicted(cache):
+    store = cache.entries()[0]["path"]
+    lock = f"{store}.lock"
+    with open(lock, "w") as f:
+        json.dump({"host": "other-host", "pid": os.getpid(), "time": time.time()}, f)
+    cache.evict()
+    assert len(cache.entries()) == 1
+    # the download on the other host died and stopped touching its lock
+    os.utime(lock, (0, 0))
+    cache.evict()
+    assert cache.entries() == []
+
+
+def test_covering_store_is_found(tmp_path):
+    cache = WorldCacheIndex(cache_dir=str(tmp_path / "worlds"), max_size=None)
+    wide = WorldExtent(lat_max=60.0, lat_min=40.0, lon_max=0.0, lon_min=-30.0, time_start="2022-12-01",
+                       time_end="2023-02-01", depth_max=500.0)
+    wide_store = add_store(cache=cache, name="wide.zarr", extent=wide, variables=["thetao", "so"],
+                           all_variables=False)
+    narrow_store = add_store(cache=cache, name="narrow.zarr", extent=EXTENT, variables=["thetao", "so", "uo"])
+    # the smallest store covering the request is used
+    assert cache.find(data_id="world", extent=EXTENT, variables=["thetao"]) == narrow_store
+    inside = WorldExtent(lat_max=55.0, lat_min=45.0, lon_max=-5.0, lon_min=-25.0, time_start="2023-01-05",
+                         time_end="2023-01-20", depth_max=200.0)
+    assert cache.find(data_id="world", extent=inside, variables=["so", "thetao"]) == wide_store
+
+
+@pytest.mark.parametrize("data_id, extent, variables", [
+    # a variable the store doesn't hold
+    ("world", EXTENT, ["thetao", "uo"]),
+    # every variable of the world, but the store only holds some of them
+    ("world", EXTENT, None),
+    # deeper than the store
+    ("world", WorldExtent(lat_max=50.0, lat_min=45.0, lon_max=-10.0, lon_min=-20.0, time_start="2023-01-01",
+                          time_end="2023-01-10", depth_max=200.0), ["thetao"]),
+    # depth range starting above the store
+    ("world", WorldExtent(lat_max=50.0, lat_min=45.0, lon_max=-10.0, lon_min=-20.0, time_start="2023-01-01",
+                          time_end="2023-01-10", depth_max=100.0, depth_min=0.0), ["thetao"]),
+    # after the store ends
+    ("world", WorldExtent(lat_max=50.0, lat_min=45.0, lon_max=-10.0, lon_min=-20.0, time_start="2023-01-05",
+                          time_end="2023-01-15", depth_max=100.0), ["thetao"]),
+    # another world
+    ("other", EXTENT, ["thetao"]),
+])
+def test_store_that_does_not_cover_is_missed(tmp_path, data_id, extent, variables):
+    cache = WorldCacheIndex(cache_dir=str(tmp_path / "worlds"), max_size=None)
+    stored = WorldExtent(lat_max=50.0, lat_min=45.0, lon_max=-10.0, lon_min=-20.0, time_start="2023-01-01",
+                         time_end="2023-01-10", depth_max=100.0, depth_min=5.0)
+    add_store(cache=cache, name="world.zarr", extent=stored, variables=["thetao", "so"], all_variables=False)
+    assert cache.find(data_id="world", extent=stored, variables=["so"]) is not None
+    assert cache.find(data_id=data_id, extent=extent, variables=variables) is None
+
+
+def test_least_recently_used_stores_are_evicted(tmp_path):
+    cache = WorldCacheIndex(cache_dir=str(tmp_path / "worlds"), max_size=None)
+    stores = [add_store(cache=cache, name=f"world{i}.zarr", extent=EXTENT, variables=["thetao"]) for i in range(3)]
+    # the first store was downloaded first but has been used since the others were downloaded
+    cache.record_hit(stores[0])
+    cache.max_size = 2000
+    cache.evict()
+    assert sorted(entry["path"] for entry in cache.entries()) == [stores[0], stores[2]]
+    assert not os.path.exists(stores[1])
+    assert not os.path.exists(stores[1] + ".manifest.json")
+    assert cache.size() == 2000
+    assert cache.stats()["hits"] == 1
@@ -0,0 +1,123 @@
+# Copyright 2025 National Oceanography Centre
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#  http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import numpy as np
+import pytest
+from attrs import evolve
+from mamma_mia.worlds import (MatchedWorld, WorldExtent, WorldsConf, WorldsAttributes, SourceConfig, SourceType,
+                              FieldTypeWithRank)
+from mamma_mia.segments import corridor_segments, segment_name
+from mamma_mia.world_registry import WorldRegistry, pad_time, bracket_depth
+
+SOURCE = SourceConfig(source_type=SourceType.CMEMS)
+
+
+@pytest.fixture
+def world() -> MatchedWorld:
+    return MatchedWorld(data_id="cmems_mod_glo_phy_anfc_0.083deg_PT1H-m", world_type=None, domain=None,
+                        dataset_name="world", resolution=None, alternative_parameter=None,
+                        field_type=FieldTypeWithRank.from_string("PT1H-i"), variable_alias={"thetao": "TEMP"})
+
+
+def mission_worlds(world: MatchedWorld, extent: WorldExtent) -> WorldsConf:
+    return WorldsConf(attributes=WorldsAttributes(extent=extent, interpolator_priorities={},
+                                                  matched_worlds={"world": world}),
+                      worlds={}, stores={})
+
+
+def test_time_segments_are_not_merged(world):
+    # six month hourly track drifting slowly, so the segments overlap in space
+    time = np.arange("2023-01-01", "2023-07-01", dtype="datetime64[h]")
+    latitude = np.linspace(50.0, 50.5, time.size)
+    longitude = np.linspace(-20.0, -19.5, time.size)
+    depth = np.full(time.size, 100.0)
+    segments = corridor_segments(latitude=latitude, longitude=longitude, depth=depth, time=time, excess_space=0.5,
+                                 extra_depth=100.0, time_padding=np.timedelta64(1, "D"),
+                                 segment_duration=np.timedelta64(30, "D"))
+    registry = WorldRegistry()
+    for i, segment in enumerate(segments):
+        registry.register(mission=segment_name(mission="glider", index=i),
+                          worlds=mission_worlds(world=world, extent=segment.extent), source=SOURCE,
+                          flight_extent=segment.flight_extent, parent="glider")
+    assert len(segments) == 7
+    assert len(registry.entries) == len(segments)
+    # another mission flying the same month as one of the segments still shares its download
+    registry.register(mission="other", worlds=mission_worlds(world=world, extent=segments[2].extent), source=SOURCE,
+                      flight_extent=segments[2].flight_extent)
+    assert len(registry.entries) == len(segments)
+    assert registry.assignments["other", registry.world_id(world=world, source=SOURCE)] == \
+        registry.assignments[segment_name(mission="glider", index=2), registry.world_id(world=world, source=SOURCE)]
+
+
+def box(lon_min: float) -> WorldExtent:
+    return WorldExtent(lat_max=51.0, lat_min=50.0, lon_max=lon_min + 1.0, lon_min=lon_min, time_start="2023-01-01",
+                       time_end="2023-01-10", depth_max=100.0)
+
+
+@pytest.mark.parametrize("gap, downloads", [(0.0, 1), (0.9, 1), (1.1, 2), (20.0, 2)])
+def test_missions_share_a_download_unless_it_is_wasteful(world, gap, downloads):
+    # a merged download of two boxes 1 degree wide with a gap between them is (2 + gap) / 2 times their size
+    registry = WorldRegistry()
+    registry.register(mission="first", worlds=mission_worlds(world=world, extent=box(lon_min=-20.0)), source=SOURCE)
+    registry.register(mission="second", worlds=mission_worlds(world=world, extent=box(lon_min=-19.0 + gap)),
+                      source=SOURCE)
+    assert len(registry.entries) == downloads
+    if downloads == 1:
+        entry = next(iter(registry.entries.values()))
+        assert (entry.extent.lon_min, entry.extent.lon_max) == (-20.0, -18.0 + gap)
+        assert list(registry.plan().values()) == [["first", "second"]]
+
+
+def test_mission_joins_the_download_that_grows_least(world):
+    registry = WorldRegistry()
+    for mission, lon_min in [("west", -20.0), ("east", -10.0), ("middle", -11.5)]:
+        registry.register(mission=mission, worlds=mission_worlds(world=world, extent=box(lon_min=lon_min)),
+                          source=SOURCE)
+    assert list(registry.plan().values()) == [["west"], ["east", "middle"]]
+
+
+@pytest.mark.parametrize("field_type, flight_start, flight_end, expected", [
+    # padded by an hour and rounded out to whole days
+    ("PT1H-i", "2023-01-05T12:00:00", "2023-01-07T06:00:00", ("2023-01-05", "2023-01-08")),
+    ("PT1H-i", "2023-01-05T00:30:00", "2023-01-07T23:30:00", ("2023-01-04", "2023-01-09")),
+    # daily means are padded by two days
+    ("P1D-m", "2023-01-05T12:00:00", "2023-01-07T06:00:00", ("2023-01-03", "2023-01-10")),
+    # never wider than the extent the world was matched for
+    ("P1M-m", "2023-01-05T12:00:00", "2023-01-07T06:00:00", ("2023-01-01", "2023-01-20")),
+])
+def test_pad_time(world, field_type, flight_start, flight_end, expected):
+    extent = WorldExtent(lat_max=51.0, lat_min=50.0, lon_max=-19.0, lon_min=-20.0, time_start="2023-01-01",
+                         time_end="2023-01-20", depth_max=100.0)
+    flight_extent = evolve(extent, time_start=flight_start, time_end=flight_end)
+    world = evolve(world, field_type=FieldTypeWithRank.from_string(field_type))
+    padded = pad_time(extent=extent, flight_extent=flight_extent, world=world)
+    assert (padded.time_start, padded.time_end) == expected
+
+
+@pytest.mark.parametrize("depth_levels, flight_depths, expected", [
+    # the levels within the flight and one either side of it, bounded halfway to the next levels
+    ((0.5, 10.0, 20.0, 50.0, 100.0, 200.0, 500.0), (15.0, 60.0), (5.25, 150.0)),
+    # from the surface
+    ((0.5, 10.0, 20.0, 50.0, 100.0, 200.0, 500.0), (0.0, 5.0), (0.0, 15.0)),
+    # below the deepest level
+    ((0.5, 10.0, 20.0, 50.0, 100.0, 200.0, 500.0), (600.0, 700.0), (350.0, 501.0)),
+    # levels that aren't sorted or unique
+    ((20.0, 0.5, 10.0, 10.0, 50.0), (12.0, 15.0), (5.25, 35.0)),
+    # without depth levels the world keeps the extent it was matched for
+    (None, (15.0, 60.0), (0.0, 1000.0)),
+])
+def test_bracket_depth(world, depth_levels, flight_depths, expected):
+    extent = WorldExtent(lat_max=51.0, lat_min=50.0, lon_max=-19.0, lon_min=-20.0, time_start="2023-01-01",
+                         time_end="2023-01-20", depth_max=1000.0)
+    flight_extent = evolve(extent, depth_min=flight_depths[0], depth_max=flight_depths[1])
+    bracketed = bracket_depth(extent=extent, flight_extent=flight_extent,
+                              world=evolve(world, depth_levels=depth_levels))
+    assert (bracketed.depth_min, bracketed.depth_max) == expected